@@ -0,0 +1,66 @@
+"""
+Measure how long it takes to import the game engine in a fresh interpreter,
+which is the startup cost paid by run_game.py and by every sweep worker.
+
+Usage:
+    python benchmark_imports.py [--repeats 5] [module ...]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["text_adventure_games.games",
+                   "text_adventure_games.parsing",
+                   "test.game_setup",
+                   "run_game"]
+
+# Dependencies that should only be loaded on first use
+HEAVY_DEPENDENCIES = ["spacy", "sklearn", "kani", "dill", "tiktoken", "openai"]
+
+TIMING_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [dep for dep in {heavy} if dep in sys.modules]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def time_import(module, repeats):
+    timings = []
+    loaded = []
+    for _ in range(repeats):
+        snippet = TIMING_SNIPPET.format(module=module, heavy=HEAVY_DEPENDENCIES)
+        result = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        output = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(output["seconds"])
+        loaded = output["loaded"]
+    return timings, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the game engine.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per module (default: 5).")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        timings, loaded = time_import(module, args.repeats)
+        if timings is None:
+            print(f"{module}: import failed ({loaded})")
+            continue
+        print("{m}: median {med:.3f}s, min {lo:.3f}s, max {hi:.3f}s; heavy dependencies loaded: {d}".format(
+            m=module,
+            med=statistics.median(timings),
+            lo=min(timings),
+            hi=max(timings),
+            d=", ".join(loaded) or "none"))
+
+
+if __name__ == "__main__":
+    main()
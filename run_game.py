@@ -1,19 +1,32 @@
 import traceback
 from typing import TYPE_CHECKING
 import argparse
+import os
 import sys
 
 if TYPE_CHECKING:
     from text_adventure_games.games import Game
-from text_adventure_games.parsing import GptParser3
+from text_adventure_games.games import SurvivorGame
+from text_adventure_games.parsing import GptParser3, GptParser4
+from text_adventure_games.utils.consts import get_output_logs_path
+from text_adventure_games.utils.general import warm_start
 from test.game_setup import build_exploration, build_classic, build_discovery
 
 def main():
     args = parse_args()
-    experiment_game = setup(args)
+    # Load spaCy and the tokenizer while the game is being built
+    warm_start()
+    if args.resume:
+        experiment_game = resume(args)
+    else:
+        experiment_game = setup(args)
     run(experiment_game)
 
 def parse_args():
+    parser = build_arg_parser()
+    return parser.parse_args(args=None if sys.argv[1:] else ['--help'])
+
+def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Run an experiment with specified parameters.")
 
     # Required arguments
@@ -29,8 +42,12 @@ def parse_args():
     parser.add_argument("--num_finalists", type=int, default=2, help="Number of finalists (default: 2).")
     parser.add_argument("--architecture", type=str, default="A", help="Type of architecture (default: 'A').")
     parser.add_argument("--random_placement", type=bool, default=False, help="Should characters be placed randomly across the map? (default: False)")
+    parser.add_argument("--resume", action="store_true", help="Resume the experiment with this name and ID from its last checkpoint instead of starting a new game.")
+    parser.add_argument("--parser", type=str, default="chained", choices=["chained", "structured"], help="How commands are resolved. 'chained' asks GPT for the intent, then each character, item and direction it needs; 'structured' resolves all of them with a single call per command (default: 'chained').")
+    parser.add_argument("--checkpoint_every", type=str, default="round", choices=["round", "tick"], help="When to save a checkpoint that --resume can carry on from. 'tick' loses less progress after a crash but pickles the whole game every tick (default: 'round').")
+    parser.add_argument("--scheduler", type=str, default="sequential", choices=["sequential", "two_phase", "pipelined"], help="How agents take their turns within a tick. 'two_phase' has all agents deliberate at once, then applies their commands in turn order. 'pipelined' keeps the sequential order but drafts the next agent's perceptions while the current one waits on GPT (default: 'sequential').")
 
-    return parser.parse_args(args=None if sys.argv[1:] else ['--help'])
+    return parser
 
 def setup(args) -> "Game":
     print("Setting up the game")
@@ -59,11 +76,23 @@ def setup(args) -> "Game":
     
     if game_created:
         game.give_hints = True
-        parser = GptParser3(game, verbose=False)
+        game.set_scheduler(args.scheduler)
+        game.set_checkpoint_frequency(args.checkpoint_every)
+        if args.parser == "structured":
+            parser = GptParser4(game, verbose=False)
+        else:
+            parser = GptParser3(game, verbose=False)
         game.set_parser(parser)
         parser.refresh_command_list()
         return game
 
+def resume(args) -> "Game":
+    checkpoint = os.path.join(get_output_logs_path(), 
+                              f"logs/{args.experiment_name}-{args.experiment_id}/", 
+                              SurvivorGame.CHECKPOINT_FILE)
+    print(f"Resuming the game from {checkpoint}")
+    return SurvivorGame.load_checkpoint(checkpoint)
+
 def run(game):
     try:
         game.game_loop()
@@ -74,6 +103,7 @@ def run(game):
         # This will run once the simulation has finished or if an error occurs.
         # We can probably still use the partial data even though it isn't ideal
         game.save_simulation_data()
+        game.event_log.close()
 
 if __name__ == "__main__":
     print("Entering main")
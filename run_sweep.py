@@ -0,0 +1,194 @@
+"""
+Run a grid of experiments in a pool of processes.
+
+The sweep config is a JSON file like:
+
+{
+    "sweep_name": "arch-sweep",
+    "processes": 4,
+    "requests_per_minute": 3000,
+    "grid": {
+        "experiment_method": ["exploration"],
+        "architecture": ["A", "B", "C", "D"],
+        "personas_path": ["exploration_personas"],
+        "seed": [1, 2, 3]
+    },
+    "fixed": {
+        "max_ticks": 6,
+        "scheduler": "pipelined",
+        "parser": "structured"
+    }
+}
+
+Every combination of the "grid" values is run as one game, with the "fixed" values applied to all of them.
+Keys are the run_game.py arguments, plus "seed". Each game logs to its own logs/<sweep_name>-<id> directory,
+and the results of every game are collected in logs/<sweep_name>_sweep_summary.json.
+
+All of the workers share a completion cache, an embedding cache and a rate limiter on calls to OpenAI
+(see text_adventure_games/gpt/caching.py), stored in the cache directory. Only deterministic (temperature 0)
+completions are cached unless the config sets "cache_sampled_completions": true, which also reuses sampled
+answers such as importance scores within each game, at the cost of changing how the games play out.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+import traceback
+
+from text_adventure_games.utils.consts import get_output_logs_path, get_cache_path, NONINTERACTIVE_ENV_VAR
+
+# The run_game.py arguments that must be given for every game
+REQUIRED_KEYS = ("experiment_method", "personas_path")
+
+
+def main():
+    args = parse_args()
+    with open(args.config, "r") as f:
+        config = json.load(f)
+
+    sweep_name = config.get("sweep_name", os.path.splitext(os.path.basename(args.config))[0])
+    cache_dir = args.cache_dir or config.get("cache_dir") or get_cache_path()
+    processes = args.processes or config.get("processes", os.cpu_count())
+    requests_per_minute = args.requests_per_minute or config.get("requests_per_minute")
+    cache_sampled = config.get("cache_sampled_completions", False)
+
+    runs = expand_grid(sweep_name, config.get("grid", {}), config.get("fixed", {}))
+    print(f"Running {len(runs)} games of sweep '{sweep_name}' on {processes} processes")
+
+    results = run_sweep(runs, processes, cache_dir, requests_per_minute, cache_sampled)
+
+    summary = summarize(sweep_name, config, results)
+    summary_path = args.output or os.path.join(get_output_logs_path(), f"logs/{sweep_name}_sweep_summary.json")
+    os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=4)
+    print(f"{summary['completed']} of {summary['games']} games completed. Summary saved to {summary_path}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a grid of experiments in a pool of processes.")
+    parser.add_argument("config", type=str, help="Path to the JSON sweep config.")
+    parser.add_argument("--processes", type=int, default=None, help="Number of games to run at once (default: the config's 'processes', or the number of CPUs).")
+    parser.add_argument("--requests_per_minute", type=int, default=None, help="Limit on OpenAI requests per minute, shared by all games (default: the config's 'requests_per_minute', or no limit).")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Where the shared caches are stored (default: the project's cache directory).")
+    parser.add_argument("--output", type=str, default=None, help="Path of the summary file (default: logs/<sweep_name>_sweep_summary.json).")
+    return parser.parse_args(args=None if sys.argv[1:] else ['--help'])
+
+
+def expand_grid(sweep_name, grid, fixed):
+    """
+    Make one set of run_game.py arguments for every combination of grid values.
+
+    Returns:
+        list[dict]: the arguments of each run, in a stable order
+    """
+    from run_game import build_arg_parser
+
+    axes = sorted(grid)
+    runs = []
+    for run_id, values in enumerate(itertools.product(*(grid[axis] for axis in axes))):
+        params = dict(fixed)
+        params.update(zip(axes, values))
+        missing = [key for key in REQUIRED_KEYS if key not in params]
+        if missing:
+            raise ValueError(f"Every run needs {missing}; add them to 'grid' or 'fixed'.")
+
+        # Start from run_game.py's defaults so the games match single runs
+        defaults = build_arg_parser().parse_args([params["experiment_method"], sweep_name, str(run_id), params["personas_path"]])
+        run_args = vars(defaults)
+        run_args.update(params)
+        run_args["experiment_name"] = sweep_name
+        run_args["experiment_id"] = run_id
+        runs.append({"run_id": run_id, "grid": dict(zip(axes, values)), "args": run_args})
+    return runs
+
+
+def run_sweep(runs, processes, cache_dir, requests_per_minute, cache_sampled=False):
+    # Fresh (spawned) processes, one per game: the logger and GPT counters are process-wide
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=processes,
+                      initializer=init_worker,
+                      initargs=(cache_dir, requests_per_minute, cache_sampled),
+                      maxtasksperchild=1) as pool:
+        results = []
+        for result in pool.imap_unordered(run_one, runs):
+            status = "done" if result["completed"] else "FAILED"
+            print(f"Run {result['run_id']} {status} in {result['duration_seconds']}s: {result['grid']}")
+            results.append(result)
+    return sorted(results, key=lambda r: r["run_id"])
+
+
+def init_worker(cache_dir, requests_per_minute, cache_sampled=False):
+    from text_adventure_games.gpt.caching import enable_shared_resources
+
+    # Log directories are claimed without prompting
+    os.environ[NONINTERACTIVE_ENV_VAR] = "1"
+    enable_shared_resources(cache_dir, 
+                            requests_per_minute=requests_per_minute, 
+                            cache_sampled_completions=cache_sampled)
+
+
+def run_one(run):
+    from argparse import Namespace
+    from numpy.random import seed as np_seed
+    from run_game import setup
+    from text_adventure_games.gpt.gpt_helpers import GptCallHandler
+    from text_adventure_games.gpt.caching import get_shared_resource_stats
+    from text_adventure_games.gpt.scheduler import get_request_scheduler
+    from text_adventure_games.utils.general import warm_start
+
+    run_args = dict(run["args"])
+    seed = run_args.pop("seed", None)
+    if seed is not None:
+        random.seed(seed)
+        np_seed(seed)
+
+    result = {"run_id": run["run_id"], "grid": run["grid"], "seed": seed, "completed": False, "error": None}
+    start = time.time()
+    game = None
+    try:
+        warm_start()
+        game = setup(Namespace(**run_args))
+        game.game_loop()
+        result["completed"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        print(traceback.format_exc())
+    finally:
+        if game is not None:
+            # Keep partial data from failed games too
+            game.save_simulation_data()
+            game.event_log.close()
+            result["experiment_name"] = game.experiment_name
+            result["experiment_id"] = game.experiment_id
+            result["log_dir"] = os.path.join(get_output_logs_path(), f"logs/{game.experiment_name}-{game.experiment_id}/")
+            result["rounds"] = game.round
+            result["winner"] = game.winner.name if getattr(game, "winner_declared", False) else None
+        result["gpt_calls"] = GptCallHandler.get_calls_count()
+        result["gpt_tokens"] = GptCallHandler.get_tokens_processed()
+        result["gpt_streaming"] = GptCallHandler.get_stream_stats()
+        result["shared_resources"] = get_shared_resource_stats()
+        result["request_scheduler"] = get_request_scheduler().get_stats()
+        result["duration_seconds"] = round(time.time() - start, 1)
+    return result
+
+
+def summarize(sweep_name, config, results):
+    return {
+        "sweep_name": sweep_name,
+        "config": config,
+        "games": len(results),
+        "completed": sum(r["completed"] for r in results),
+        "gpt_calls": sum(r["gpt_calls"] for r in results),
+        "gpt_tokens": sum(r["gpt_tokens"] for r in results),
+        "runs": results
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -137,29 +137,32 @@ class DiscoveryGame(games.SurvivorGame):
             extras["type"] = "Scores"
             self.logger.debug(msg=message, extra=extras)
     
-    def _get_player_alliance(self, ids_only=False, names_only=False, as_str=False):
+    def _get_player_alliance(self, ids_only=False, names_only=False, as_str=False, character=None):
+        character = character or self.player
         if ids_only:
-            return [ally.id for ally in self.player.get_teammates()]
+            return [ally.id for ally in character.get_teammates()]
         if names_only:
-            return [ally for ally in self.player.get_teammates(names_only=names_only, as_str=as_str)]
-        return self.player.get_teammates()
+            return [ally for ally in character.get_teammates(names_only=names_only, as_str=as_str)]
+        return character.get_teammates()
         
-    def update_world_info(self):
+    def get_world_info(self, character=None):
+        character = character or self.player
+        alliance_ids = self._get_player_alliance(ids_only=True, character=character)
         params = {"idol_value": 100 - self.total_ticks,
                   "contestant_names_locs": ", ".join([f"{c.name} who is at {c.location.name}" 
                                                       for c in self.characters.values() 
-                                                      if (c.id != self.player.id) and (c.id not in self._get_player_alliance(ids_only=True))]),
-                  "partner_count": len(self._get_player_alliance()),
-                  "teammates": self._get_player_alliance(names_only=True, as_str=True),
+                                                      if (c.id != character.id) and (c.id not in alliance_ids)]),
+                  "partner_count": len(self._get_player_alliance(character=character)),
+                  "teammates": self._get_player_alliance(names_only=True, as_str=True, character=character),
                   "game_locations": ", ".join(list(self.locations.keys())),
                   "remaining_idols": self.remaining_idols,
                   "rounds_remaining": 11 - self.round,
                   "turns_left_this_round": self.max_ticks_per_round - (self.tick - 1),
                   "n": self.round}
-        self.world_info = world_info_prompt.discovery_world_info.format(**params)
+        return world_info_prompt.discovery_world_info.format(**params)
 
-    def get_basic_game_goal(self):
-        params = {"teammates": self._get_player_alliance(names_only=True, as_str=True)} 
+    def get_basic_game_goal(self, character=None):
+        params = {"teammates": self._get_player_alliance(names_only=True, as_str=True, character=character)} 
         return world_info_prompt.discovery_basic_goal.format(**params)
             
 def build_exploration(experiment_name: str = "exp1",
@@ -0,0 +1,72 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from text_adventure_games import games
+from text_adventure_games.games import SurvivorGame
+from text_adventure_games.gpt.gpt_helpers import GptCallHandler
+from text_adventure_games.parsing import GptParser3
+from text_adventure_games.utils.event_log import EventLog
+
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    # save_checkpoint and load_checkpoint only need the event log, the parser and the experiment's name,
+    # so skip building a world
+    game = SurvivorGame.__new__(SurvivorGame)
+    game.experiment_name = "checkpoint"
+    game.experiment_id = 1
+    game.round = 2
+    game.resume_tick = 0
+    game.event_log = EventLog(str(tmp_path / "events.jsonl"))
+    game.parser = GptParser3.__new__(GptParser3)
+    game.parser.resolution_stats = {"fast_path": 3, "cache": 2, "gpt": 1}
+    # Loading a checkpoint reopens the experiment's log directory
+    monkeypatch.setattr(games.logger, "CustomLogger",
+                        lambda **kw: SimpleNamespace(get_logger=lambda: "resumed logger"))
+    # The counters are class attributes; put them back afterwards
+    monkeypatch.setattr(GptCallHandler, "calls_made", 10)
+    monkeypatch.setattr(GptCallHandler, "tokens_processed", 500)
+    return game
+
+
+def test_checkpoint_round_trip(game, tmp_path):
+    path = str(tmp_path / "checkpoint.pkl")
+    random.seed(1)
+    np.random.seed(1)
+    game.event_log.append("action", 2, 3, character="Alice", command="go north")
+    game.save_checkpoint(next_tick=4, path=path)
+    assert game.resume_tick == 0
+    expected_random = [random.random() for _ in range(3)]
+    expected_numpy = np.random.permutation(10)
+
+    # The game carries on past the checkpoint
+    game.event_log.append("action", 2, 4, character="Bob", command="go south")
+    game.event_log.close()
+    GptCallHandler.calls_made = 20
+    GptCallHandler.tokens_processed = 900
+    game.parser.resolution_stats["gpt"] = 5
+
+    resumed = SurvivorGame.load_checkpoint(path)
+    assert [random.random() for _ in range(3)] == expected_random
+    assert (np.random.permutation(10) == expected_numpy).all()
+    assert GptCallHandler.calls_made == 10
+    assert GptCallHandler.tokens_processed == 500
+    assert resumed.parser.get_resolution_stats() == {"fast_path": 3, "cache": 2, "gpt": 1}
+    assert resumed.round == 2
+    assert resumed.resume_tick == 4
+    assert resumed.logger == "resumed logger"
+    # The event from after the checkpoint is gone from the log
+    assert resumed.event_log.seq == 1
+    with open(resumed.event_log.path) as f:
+        assert len(f.readlines()) == 1
+
+
+def test_checkpoint_frequency(game):
+    assert SurvivorGame.CHECKPOINT_FREQUENCIES == ("round", "tick")
+    game.set_checkpoint_frequency("tick")
+    assert game.checkpoint_every == "tick"
+    with pytest.raises(ValueError):
+        game.set_checkpoint_frequency("action")
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from text_adventure_games.managers import dialogue
+from text_adventure_games.managers.dialogue import DialogueContext
+
+
+@pytest.fixture(autouse=True)
+def word_counts(monkeypatch):
+    # One token per word, so the tests don't need the tokenizer
+    monkeypatch.setattr(dialogue, "count_tokens", lambda text: len(text.split()))
+
+
+def brute_force_window(lines, max_tokens):
+    """Take lines from the end while they fit, counting each with its newline."""
+    kept, total = [], 0
+    for line in reversed(lines):
+        count = len(line.split()) + 1
+        if total + count > max_tokens:
+            break
+        kept.insert(0, line)
+        total += count
+    return kept, total
+
+
+def test_window_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(200):
+        context = DialogueContext()
+        lines = [" ".join(["word"] * rng.randint(0, 6)) for _ in range(rng.randint(0, 8))]
+        for line in lines:
+            context.add(line)
+        for max_tokens in range(-3, context.total_tokens + 3):
+            assert context.window(max_tokens) == brute_force_window(lines, max_tokens)
+
+
+def test_window_edges():
+    context = DialogueContext()
+    assert context.window(10) == ([], 0)
+    context.add("Alice wants to talk")
+    context.add("Hi Bob")
+    assert context.total_tokens == 8
+    assert context.window(8) == (["Alice wants to talk", "Hi Bob"], 8)
+    assert context.window(7) == (["Hi Bob"], 3)
+    assert context.window(0) == ([], 0)
+    assert context.window(-5) == ([], 0)
@@ -0,0 +1,94 @@
+import json
+import os
+import pickle
+
+from text_adventure_games.utils.event_log import EventLog, SNAPSHOT_DIR, load_latest_snapshot, replay
+
+
+def play_round(log, round):
+    """Append one round of events: a move, an item changing hands and a memory for each character."""
+    for tick in range(2):
+        log.append("action", round, tick, character="Alice", command="go north", location="camp")
+        log.append("move", round, tick, character="Alice", **{"from": "camp", "to": "beach"})
+        log.append("item_transfer", round, tick, item_id="1", item="shell",
+                   **{"from": "location:beach", "to": "character:Alice"})
+        log.append("item_transfer", round, tick, item_id="1", item="shell",
+                   **{"from": "character:Alice", "to": "character:Bob"})
+        log.append("move", round, tick, character="Alice", **{"from": "beach", "to": "camp"})
+        for name in ("Alice", "Bob"):
+            log.append("memory", round, tick, character=name, node_id=f"{name}-{round}-{tick}",
+                       description=f"{name} remembers round {round} tick {tick}")
+    log.append("vote", round, 1, voter="Bob", record={"target": "Alice"})
+
+
+def new_log(tmp_path):
+    log = EventLog(str(tmp_path / "events.jsonl"), batch_size=4)
+    log.append("start", 0, 0,
+               characters={"Alice": "camp", "Bob": "camp"},
+               items={"1": {"name": "shell", "holder": "location:beach"}})
+    return log
+
+
+def as_dict(state):
+    return json.loads(json.dumps({**state.to_primitive(), "memories": state.memories}))
+
+
+def test_snapshots_leave_out_memories(tmp_path):
+    log = new_log(tmp_path)
+    for round in range(6):
+        play_round(log, round)
+        with open(log.write_snapshot()) as f:
+            snapshot = json.load(f)
+        assert "memories" not in snapshot
+        assert "remembers" not in json.dumps(snapshot)
+    log.close()
+
+    snapshot = load_latest_snapshot(log.path)
+    assert snapshot.seq == log.seq
+    assert snapshot.memory_counts == {"Alice": 12, "Bob": 12}
+    assert as_dict(snapshot) == as_dict(replay(log.path, use_snapshots=False))
+
+
+def test_replay_from_snapshot_matches_full_replay(tmp_path):
+    log = new_log(tmp_path)
+    for round in range(5):
+        play_round(log, round)
+        if round % 2 == 1:
+            log.write_snapshot()
+    log.close()
+
+    for until_round in range(5):
+        full = replay(log.path, until_round=until_round, use_snapshots=False)
+        assert as_dict(replay(log.path, until_round=until_round)) == as_dict(full)
+        assert len(full.memories["Bob"]) == 2 * (until_round + 1)
+
+
+def test_rollback_to_checkpoint(tmp_path):
+    log = new_log(tmp_path)
+    play_round(log, 0)
+    log.write_snapshot()
+    play_round(log, 1)
+    # What a checkpoint keeps of the log
+    checkpoint = pickle.dumps(log)
+    expected = as_dict(replay(log.path, use_snapshots=False))
+
+    # The game carries on past the checkpoint, then crashes
+    play_round(log, 2)
+    log.write_snapshot()
+    play_round(log, 3)
+    log.close()
+    finished = as_dict(replay(log.path, use_snapshots=False))
+
+    resumed = pickle.loads(checkpoint)
+    resumed.rollback()
+    snapshots = os.listdir(tmp_path / SNAPSHOT_DIR)
+    assert all(int(f[len("snapshot_"):-len(".json")]) <= resumed.seq for f in snapshots)
+    assert load_latest_snapshot(resumed.path).round == 0
+    assert as_dict(replay(resumed.path)) == expected
+    assert as_dict(replay(resumed.path, use_snapshots=False)) == expected
+
+    # Replaying the lost rounds gives the same log as the first time
+    play_round(resumed, 2)
+    play_round(resumed, 3)
+    resumed.close()
+    assert as_dict(replay(resumed.path)) == finished
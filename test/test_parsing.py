@@ -0,0 +1,195 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from text_adventure_games.parsing import GptParser3
+
+
+@pytest.fixture
+def parser():
+    # The matching and cache helpers only need the game's characters, so skip the GPT setup in __init__
+    parser = GptParser3.__new__(GptParser3)
+    parser.verbose = False
+    parser.resolution_stats = {"fast_path": 0, "cache": 0, "gpt": 0}
+    names = ["Alice Moore", "Alice Stone", "Bob Stone", "Carol King"]
+    parser.game = SimpleNamespace(characters={name: SimpleNamespace(name=name) for name in names})
+    return parser
+
+
+def location(name, **connections):
+    return SimpleNamespace(name=name,
+                           connections={d: SimpleNamespace(name=to_loc) for d, to_loc in connections.items()})
+
+
+@pytest.fixture
+def small_resolution_cache(monkeypatch):
+    GptParser3.clear_resolution_cache()
+    monkeypatch.setattr(GptParser3, "resolution_cache_size", 4)
+    yield
+    GptParser3.clear_resolution_cache()
+
+
+def test_resolution_cache_is_lru(parser, small_resolution_cache):
+    keys = [parser._resolution_key("item", f"get the thing {i}", None, ()) for i in range(5)]
+    for i, key in enumerate(keys[:4]):
+        parser._cache_resolution(key, f"thing {i}")
+    # Using the oldest entry keeps it when the next one is added
+    assert parser._get_cached_resolution(keys[0]) == (True, "thing 0")
+    parser._cache_resolution(keys[4], "thing 4")
+
+    assert parser._get_cached_resolution(keys[1]) == (False, None)
+    assert parser._get_cached_resolution(keys[0]) == (True, "thing 0")
+    assert len(GptParser3.resolution_cache) == 4
+
+
+def test_resolution_cache_is_thread_safe(parser, small_resolution_cache):
+    keys = [parser._resolution_key("character", f"talk to person {i}", None, ()) for i in range(16)]
+    errors = []
+    start = threading.Barrier(8)
+
+    def hammer(offset):
+        try:
+            start.wait()
+            for i in range(2000):
+                key = keys[(i + offset) % len(keys)]
+                if i % 2:
+                    parser._cache_resolution(key, key[1])
+                else:
+                    found, name = parser._get_cached_resolution(key)
+                    assert not found or name == key[1]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(GptParser3.resolution_cache) <= GptParser3.resolution_cache_size
+    stats = GptParser3.get_resolution_cache_stats()
+    assert stats["size"] == len(GptParser3.resolution_cache)
+
+
+def test_fast_match_character_by_unique_name_parts(parser):
+    characters = parser.game.characters
+    assert parser._fast_match_character("talk to Alice Moore") is characters["Alice Moore"]
+    assert parser._fast_match_character("talk to moore") is characters["Alice Moore"]
+    assert parser._fast_match_character("talk to bob") is characters["Bob Stone"]
+    assert parser._fast_match_character("talk to carol") is characters["Carol King"]
+
+
+def test_fast_match_character_leaves_ambiguous_names_to_gpt(parser):
+    # Two characters are called Alice, and two are Stones
+    assert parser._fast_match_character("talk to alice") is None
+    assert parser._fast_match_character("talk to stone") is None
+    # Two different characters are named
+    assert parser._fast_match_character("tell bob about carol") is None
+    assert parser._fast_match_character("look around") is None
+    # Names only match whole words
+    assert parser._fast_match_character("talk to bobby") is None
+
+
+def test_fast_match_character_with_hint(parser):
+    characters = parser.game.characters
+    # The hint describes a role rather than naming the same character
+    assert parser._fast_match_character("give the apple to bob", hint="the giver") is None
+    assert parser._fast_match_character("give the apple to bob", hint="recipient: Bob Stone") is characters["Bob Stone"]
+    assert parser._fast_match_character("give the apple to bob", hint="recipient: Carol") is None
+
+
+def test_fast_match_item_uses_whole_names(parser):
+    items = {"stick": SimpleNamespace(name="stick"), "lipstick": SimpleNamespace(name="lipstick")}
+    assert parser._fast_match_item("put on the lipstick", items) is items["lipstick"]
+    assert parser._fast_match_item("pick up the stick", items) is items["stick"]
+    assert parser._fast_match_item("swap the stick for the lipstick", items) is None
+    assert parser._fast_match_item("pick up the rock", items) is None
+
+
+def test_fast_match_item_with_hint(parser):
+    items = {"stick": SimpleNamespace(name="stick"), "rock": SimpleNamespace(name="rock")}
+    assert parser._fast_match_item("hit the rock with the stick", items, hint="the weapon") is None
+    assert parser._fast_match_item("take the stick", items, hint="the stick to take") is items["stick"]
+    assert parser._fast_match_item("take the stick", items, hint="the rock") is None
+
+
+def test_fast_match_direction(parser):
+    camp = location("camp", north="beach", east="jungle", **{"in": "hut", "out": "clearing"})
+    assert parser._fast_match_direction("go north", camp) == "north"
+    assert parser._fast_match_direction("n", camp) == "north"
+    assert parser._fast_match_direction("walk to the jungle", camp) == "east"
+    assert parser._fast_match_direction("north or east?", camp) is None
+    assert parser._fast_match_direction("go west", camp) is None
+    assert parser._fast_match_direction("go north", None) is None
+
+
+def test_fast_match_direction_prepositions(parser):
+    camp = location("camp", north="beach", **{"in": "hut", "out": "clearing", "up": "tree"})
+    assert parser._fast_match_direction("in", camp) == "in"
+    assert parser._fast_match_direction("go  out", camp) == "out"
+    assert parser._fast_match_direction("Go Up", camp) == "up"
+    # Prepositions in the middle of a command aren't directions
+    assert parser._fast_match_direction("put the fish in the basket", camp) is None
+    assert parser._fast_match_direction("go in to the north", camp) == "north"
+    # but the place an exit leads to still is
+    assert parser._fast_match_direction("look in the hut", camp) == "in"
+
+
+def mentions(names, text):
+    parser = GptParser3.__new__(GptParser3)
+    parser._mention_matcher = None
+    parser.game = SimpleNamespace(characters={name: SimpleNamespace(name=name) for name in names})
+    return parser.find_character_mentions(text)
+
+
+def test_find_character_mentions_in_order(parser):
+    parser._mention_matcher = None
+    assert parser.find_character_mentions("Carol told Bob Stone about Alice Moore. Bob agreed.") == \
+        ["Carol King", "Bob Stone", "Alice Moore"]
+    assert parser.find_character_mentions("") == []
+    assert parser.find_character_mentions("Nobody is here") == []
+    # Names only match whole words
+    assert parser.find_character_mentions("Bobby met Carolyn") == []
+
+
+def test_find_character_mentions_with_titles():
+    names = ["Dr. Jane Doe", "Sir Tom Hill Jr."]
+    assert mentions(names, "Jane Doe and Dr. Tom Hill went north") == ["Dr. Jane Doe", "Sir Tom Hill Jr."]
+    assert mentions(names, "I spoke to Dr. Doe") == ["Dr. Jane Doe"]
+    assert mentions(names, "Sir Tom Hill Jr. found the idol") == ["Sir Tom Hill Jr."]
+    assert mentions(names, "jane  doe\nhid it") == ["Dr. Jane Doe"]
+
+
+def test_find_character_mentions_with_punctuation_in_names():
+    names = ["Liam O'Brien", "Mary-Kate Olsen"]
+    assert mentions(names, "O'Brien and Mary-Kate went north") == ["Liam O'Brien", "Mary-Kate Olsen"]
+    assert mentions(names, "liam obrien found it") == ["Liam O'Brien"]
+
+
+def test_find_character_mentions_with_shared_names():
+    names = ["Alice Moore", "Alice Stone", "Bob Stone"]
+    # A name that two characters share doesn't say which one is meant
+    assert mentions(names, "Alice went to see Stone") == []
+    assert mentions(names, "Alice Stone went to see Moore") == ["Alice Stone", "Alice Moore"]
+    # Neither do two characters that only differ by a title
+    assert mentions(["Dr. Kim Lee", "Kim Lee"], "Kim Lee won") == []
+
+
+def test_find_character_mentions_of_names_ending_in_a_period():
+    names = ["Jane Doe.", "J. R. Smith"]
+    assert mentions(names, "I voted for Jane Doe.") == ["Jane Doe."]
+    assert mentions(names, "I voted for Jane Doe") == ["Jane Doe."]
+    assert mentions(names, "Then I saw Smith.") == ["J. R. Smith"]
+    # Initials aren't names
+    assert mentions(names, "J. walked off") == []
+
+
+def test_find_character_mentions_of_names_that_are_words():
+    names = ["Will Rivers", "Hope"]
+    assert mentions(names, "I will give the shell to Hope") == ["Hope"]
+    assert mentions(names, "We hope the rivers rise, Will.") == ["Will Rivers"]
+    assert mentions(names, "There is no hope in these rivers") == []
+    # Full names of several words match however they are written
+    assert mentions(names, "will rivers found it") == ["Will Rivers"]
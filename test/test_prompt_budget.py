@@ -0,0 +1,155 @@
+from types import SimpleNamespace
+
+import pytest
+
+from text_adventure_games.gpt.gpt_helpers import (chunk_context,
+                                                  pack_context,
+                                                  PromptBudget,
+                                                  RETRY_BUDGET_SCALE)
+
+
+class WordTokenizer:
+    """One token per word, so the expected counts are easy to read off."""
+
+    def encode(self, text):
+        return text.split()
+
+    def encode_batch(self, texts):
+        return [self.encode(text) for text in texts]
+
+
+# A user message with no content costs 7 tokens here: 3 for the reply primer, and 3 plus
+# the one word "user" for the role
+USER_MESSAGE_TOKENS = 7
+
+
+def words(n, word="memory"):
+    return " ".join([word] * n)
+
+
+def make_budget(available, **kwargs):
+    handler = SimpleNamespace(model_context_limit=available + USER_MESSAGE_TOKENS, max_tokens=0)
+    return PromptBudget(handler, tokenizer=WordTokenizer(), margin=0, **kwargs)
+
+
+def test_pack_context_empty():
+    assert pack_context([], 10) == ([], 0)
+    assert pack_context([3, 4], 0) == ([], 0)
+    assert pack_context([3, 4], 10, max_items=0) == ([], 0)
+
+
+def test_pack_context_exact_fit():
+    assert pack_context([2, 3, 5], 10) == ([0, 1, 2], 10)
+    assert pack_context([2, 3, 5], 8) == ([1, 2], 8)
+    assert pack_context([2, 3, 5], 5, keep_most_recent=False) == ([0, 1], 5)
+
+
+def test_pack_context_stops_at_oversize_item():
+    # The run of kept items ends at the first one that doesn't fit
+    assert pack_context([1, 1, 20, 1, 1], 10) == ([3, 4], 2)
+    assert pack_context([1, 1, 20, 1, 1], 10, keep_most_recent=False) == ([0, 1], 2)
+    assert pack_context([1, 2, 3], 10, max_items=2) == ([1, 2], 5)
+
+
+def test_pack_context_by_score_skips_oversize_items():
+    counts = [4, 20, 3, 5]
+    scores = [0.1, 0.9, 0.5, 0.7]
+    assert pack_context(counts, 10, scores=scores) == ([2, 3], 8)
+    assert pack_context(counts, 10, scores=scores, max_items=1) == ([3], 5)
+
+
+def test_chunk_context():
+    assert chunk_context([], 10) == []
+    assert chunk_context([5, 5, 5, 5], 10) == [(0, 2), (2, 4)]
+    assert chunk_context([3, 4, 3, 9], 10) == [(0, 3), (3, 4)]
+
+
+def test_chunk_context_stops_at_oversize_item():
+    assert chunk_context([4, 4, 11, 2], 10) == [(0, 2)]
+    assert chunk_context([11, 2], 10) == []
+
+
+def test_budget_without_sections():
+    budget = make_budget(100)
+    assert budget.available == 100
+    assert budget.pack() == {}
+    assert budget.remaining == 100
+
+
+def test_budget_exact_fit():
+    budget = make_budget(12).add_fixed(words(2, "header"))
+    # Each item costs its words plus one for the separator
+    budget.add_section("memories", [words(4), words(4)])
+    assert budget.available == 10
+    assert budget.pack() == {"memories": [words(4), words(4)]}
+    assert budget.remaining == 0
+
+
+def test_budget_fixed_text_too_long():
+    budget = make_budget(5).add_fixed(words(6, "instruction"))
+    with pytest.raises(ValueError):
+        budget.pack()
+
+
+def test_budget_fills_sections_in_priority_order():
+    budget = make_budget(20)
+    budget.add_section("memories", [words(4, f"m{i}") for i in range(4)], priority=1)
+    budget.add_section("impressions", [words(4, f"i{i}") for i in range(3)], priority=0)
+    packed = budget.pack()
+    assert packed["impressions"] == [words(4, f"i{i}") for i in range(3)]
+    # The most recent memories fill what is left
+    assert packed["memories"] == [words(4, "m3")]
+    assert budget.remaining == 0
+
+
+def test_budget_reserves_minimums():
+    budget = make_budget(20)
+    budget.add_section("impressions", [words(4, f"i{i}") for i in range(4)], priority=0)
+    budget.add_section("memories", [words(1, f"m{i}") for i in range(3)], priority=1, min_tokens=6)
+    packed = budget.pack()
+    # The impressions alone would fill the prompt, but the memories keep their reserve
+    assert packed["impressions"] == [words(4, "i2"), words(4, "i3")]
+    assert packed["memories"] == [words(1, f"m{i}") for i in range(3)]
+    assert budget.remaining == 4
+
+
+def test_budget_caps_sections():
+    budget = make_budget(20)
+    budget.add_section("impressions", [words(4, f"i{i}") for i in range(4)], priority=0, max_tokens=6)
+    budget.add_section("dialogue", [words(4, f"d{i}") for i in range(4)], priority=1)
+    packed = budget.pack()
+    # What the capped section can't use goes to the next one
+    assert packed["impressions"] == [words(4, "i3")]
+    assert packed["dialogue"] == [words(4, "d1"), words(4, "d2"), words(4, "d3")]
+    assert budget.remaining == 0
+
+
+def test_budget_keeps_oldest_items():
+    budget = make_budget(10)
+    budget.add_section("goals", [words(4, f"g{i}") for i in range(3)], keep_most_recent=False)
+    assert budget.pack()["goals"] == [words(4, "g0"), words(4, "g1")]
+
+
+def test_budget_packs_once():
+    budget = make_budget(10)
+    budget.add_section("memories", [words(2)])
+    assert budget.pack() is budget.pack()
+    with pytest.raises(ValueError):
+        budget.add_section("late", [words(2)])
+
+
+def test_retry_budget_keeps_less():
+    items = [words(4, f"m{i}") for i in range(10)]
+
+    full = make_budget(40).add_fixed(words(10, "instruction"))
+    full.add_section("memories", items)
+    retry = make_budget(40, scale=RETRY_BUDGET_SCALE).add_fixed(words(10, "instruction"))
+    retry.add_section("memories", items)
+
+    assert full.available == 30
+    assert retry.available == 15
+    assert full.pack()["memories"] == items[-6:]
+    assert retry.pack()["memories"] == items[-3:]
+    # remaining is measured against the scaled budget rather than the whole context
+    assert retry.remaining == 0
+    assert retry.total_tokens <= full.total_tokens
@@ -0,0 +1,113 @@
+import threading
+import time
+
+from text_adventure_games.gpt.scheduler import RequestPriority, RequestScheduler, set_current_game
+
+
+def wait_until(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.005)
+
+
+def queue_requests(scheduler, requests, order):
+    """
+    Start a thread for each (name, priority, deadline, game) request, one at a time,
+    so that they queue up in the order given. Each records its name once it has a slot.
+    """
+    threads = []
+    for name, priority, deadline, game in requests:
+        def request(name=name, priority=priority, deadline=deadline, game=game):
+            set_current_game(game)
+            with scheduler.slot(priority, deadline):
+                order.append(name)
+
+        waiting = len(scheduler._waiting)
+        thread = threading.Thread(target=request)
+        thread.start()
+        wait_until(lambda: len(scheduler._waiting) == waiting + 1)
+        threads.append(thread)
+    return threads
+
+
+def run_queued(requests, max_concurrent=1):
+    scheduler = RequestScheduler(max_concurrent=max_concurrent)
+    order = []
+    # Hold every slot while the requests queue up behind it
+    with scheduler.slot(RequestPriority.CRITICAL):
+        threads = queue_requests(scheduler, requests, order)
+    for thread in threads:
+        thread.join(timeout=5)
+    return order, scheduler
+
+
+def test_requests_go_by_priority_then_arrival():
+    order, scheduler = run_queued([("background", RequestPriority.BACKGROUND, None, "game"),
+                                   ("normal 1", RequestPriority.NORMAL, None, "game"),
+                                   ("critical", RequestPriority.CRITICAL, None, "game"),
+                                   ("normal 2", RequestPriority.NORMAL, None, "game")])
+    assert order == ["critical", "normal 1", "normal 2", "background"]
+    stats = scheduler.get_stats()
+    assert stats["max_queue_depth"] == 4
+    assert stats["queue_depth"] == 0
+    assert stats["in_flight"] == 0
+
+
+def test_requests_past_their_deadline_are_critical():
+    order, _ = run_queued([("normal", RequestPriority.NORMAL, None, "game"),
+                           ("late background", RequestPriority.BACKGROUND, 0, "game"),
+                           ("background", RequestPriority.BACKGROUND, None, "game")])
+    assert order == ["late background", "normal", "background"]
+
+
+def test_games_with_fewer_requests_in_flight_go_first():
+    scheduler = RequestScheduler(max_concurrent=2)
+    order = []
+    # Game A has a long request in flight the whole time
+    release = threading.Event()
+
+    def long_request():
+        set_current_game("A")
+        with scheduler.slot(RequestPriority.NORMAL):
+            release.wait(timeout=5)
+
+    holder = threading.Thread(target=long_request)
+    holder.start()
+    wait_until(lambda: scheduler._in_flight == 1)
+
+    with scheduler.slot(RequestPriority.NORMAL):
+        threads = queue_requests(scheduler,
+                                 [("A 1", RequestPriority.NORMAL, None, "A"),
+                                  ("A 2", RequestPriority.NORMAL, None, "A"),
+                                  ("B 1", RequestPriority.NORMAL, None, "B")],
+                                 order)
+    for thread in threads:
+        thread.join(timeout=5)
+    release.set()
+    holder.join(timeout=5)
+
+    assert order == ["B 1", "A 1", "A 2"]
+
+
+def test_no_more_than_max_concurrent_in_flight():
+    scheduler = RequestScheduler(max_concurrent=2)
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def request():
+        with scheduler.slot(RequestPriority.NORMAL):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert peak[0] == 2
@@ -0,0 +1,47 @@
+import json
+
+from text_adventure_games.utils.simulation_data import (append_records,
+                                                        get_simulation_data_path,
+                                                        load_simulation_data,
+                                                        read_records,
+                                                        CHARACTER_GOALS,
+                                                        CHARACTER_GOAL_SCORES,
+                                                        VOTING_HISTORY)
+
+
+def path_for(kind, tmp_path):
+    return get_simulation_data_path(kind, "exp", 1, log_dir=str(tmp_path))
+
+
+def test_last_record_wins(tmp_path):
+    path = path_for(VOTING_HISTORY, tmp_path)
+    append_records(path, [(0, "Alice", {"target": "Bob"}), (0, "Bob", {"target": "Carol"})])
+    # Round 0 is saved again once it has closed
+    append_records(path, [(0, "Alice", {"target": "Carol"}), (0, "Bob", {"target": "Carol"})])
+    append_records(path, [(1, "Alice", {"target": "Bob"})])
+    assert read_records(path) == {(0, "Alice"): {"target": "Carol"},
+                                  (0, "Bob"): {"target": "Carol"},
+                                  (1, "Alice"): {"target": "Bob"}}
+
+
+def test_load_simulation_data_with_duplicate_round_and_truncated_line(tmp_path):
+    votes = path_for(VOTING_HISTORY, tmp_path)
+    goals = path_for(CHARACTER_GOALS, tmp_path)
+    append_records(votes, [(0, "Alice", {"target": "Bob"})])
+    append_records(votes, [(0, "Alice", {"target": "Carol"})])
+    append_records(goals, [(0, "Alice", "find the idol"), (0, "Bob", None)])
+    append_records(goals, [(0, "Alice", "win the vote"), (0, "Bob", None)])
+    # The game crashed partway through writing round 1
+    line = json.dumps({"round": 1, "character": "Alice", "value": "stay hidden"})
+    with open(goals, "a") as f:
+        f.write(line[:len(line) // 2])
+
+    expected = {VOTING_HISTORY: {"0": {"Alice": {"target": "Carol"}}},
+                CHARACTER_GOALS: {"Alice": {"0": "win the vote"}, "Bob": "None"},
+                CHARACTER_GOAL_SCORES: {}}
+    assert load_simulation_data("exp", 1, log_dir=str(tmp_path)) == expected
+
+    # The resumed game writes round 1 again, after the partial line
+    append_records(goals, [(1, "Alice", "stay hidden")])
+    expected[CHARACTER_GOALS]["Alice"]["1"] = "stay hidden"
+    assert load_simulation_data("exp", 1, log_dir=str(tmp_path)) == expected
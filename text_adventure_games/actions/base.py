@@ -22,9 +22,16 @@ class Action:
     ACTION_DESCRIPTION: str = None
     ACTION_ALIASES: list[str] = None
 
-    def __init__(self, game):
+    def __init__(self, game, parser=None):
+        """
+        Args:
+            game (Game): the game
+            parser (Parser, optional): the parser the action reports to and matches with, if not
+                                       game.parser, e.g. one bound to the slots of a single resolved
+                                       command (see parsing.ResolvedCommandParser).
+        """
         self.game = game
-        self.parser = game.parser
+        self.parser = parser or game.parser
 
     def check_preconditions(self) -> bool:
         """
@@ -243,9 +250,10 @@ class ActionSequence(Action):
         self,
         game,
         command: str,
-        character: Character = None
+        character: Character = None,
+        parser=None
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.command = command
         self.character = character
 
@@ -269,9 +277,10 @@ class Quit(Action):
         self,
         game,
         command: str,
-        character: Character = None
+        character: Character = None,
+        parser=None
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.command = command
         self.character = character
 
@@ -299,9 +308,10 @@ class Describe(Action):
         self,
         game,
         command: str,
-        character: Character = None
+        character: Character = None,
+        parser=None
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.command = command
         self.character = character
 
@@ -8,8 +8,8 @@ class Eat(base.Action):
     ACTION_NAME = "eat"
     ACTION_DESCRIPTION = "Ingest food items for nourishment."
 
-    def __init__(self, game, command: str, character: Character):
-        super().__init__(game)
+    def __init__(self, game, command: str, character: Character, parser=None):
+        super().__init__(game, parser)
         self.command = command
         self.character = character
         self.item = self.parser.match_item(
@@ -68,8 +68,8 @@ class Drink(base.Action):
     ACTION_NAME = "drink"
     ACTION_DESCRIPTION = "Drink a liquid."
 
-    def __init__(self, game, command: str, character: Character):
-        super().__init__(game)
+    def __init__(self, game, command: str, character: Character, parser=None):
+        super().__init__(game, parser)
         # self.character = self.parser.get_character(command)
         self.command = command
         self.character = character
@@ -142,8 +142,8 @@ class Light(base.Action):
     ACTION_NAME = "light"
     ACTION_DESCRIPTION = "Ignite something flammable like a lamp or a candle. Also includes turning on a light"
 
-    def __init__(self, game, command: str, character: Character):
-        super().__init__(game)
+    def __init__(self, game, command: str, character: Character, parser=None):
+        super().__init__(game, parser)
         # self.character = self.parser.get_character(command)
         self.command = command
         self.character = character
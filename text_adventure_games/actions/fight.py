@@ -14,9 +14,10 @@ class Attack(base.Action):
         self,
         game,
         command: str,
-        character: Character
+        character: Character,
+        parser=None
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.command = command
         # self.character = character
         attack_words = ["attack", "hit", "strike", "punch", "thwack"]
@@ -10,8 +10,8 @@ class Catch_Fish(base.Action):
     ACTION_DESCRIPTION = "Catch fish with a pole. Generally, catch an aquatic animal or creature with a rod."
     ACTION_ALIASES = ["go fishing"]
 
-    def __init__(self, game, command: str, character: Character):
-        super().__init__(game)
+    def __init__(self, game, command: str, character: Character, parser=None):
+        super().__init__(game, parser)
         # self.character = self.parser.get_character(command)
         self.command = command
         self.character = character
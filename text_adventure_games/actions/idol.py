@@ -12,8 +12,8 @@ class Search_Idol(base.Action):
     ACTION_DESCRIPTION = "Look for an idol. Typically requires a tool in order to be successful."
     ACTION_ALIASES = ["look for idol", "search for idol", "find idol"]
 
-    def __init__(self, game, command: str, character: Character):
-        super().__init__(game)
+    def __init__(self, game, command: str, character: Character, parser=None):
+        super().__init__(game, parser)
         self.valid_idol_locations = [loc for loc in game.locations.values() if loc.get_property("has_idol")]
         self.command = command
         self.character = character
@@ -148,8 +148,8 @@ class Read_Clue(base.Action):
     ACTION_DESCRIPTION = "Examine the clue for details on the idol's location."
     ACTION_ALIASES = ["examine clue", "read clue", "read idol clue"]
 
-    def __init__(self, game, command: str, character: Character):
-        super().__init__(game)
+    def __init__(self, game, command: str, character: Character, parser=None):
+        super().__init__(game, parser)
         self.command = command
         self.character = character
         self.clue = self.parser.match_item(
@@ -25,10 +25,11 @@ class Go(base.Action):
         self,
         game,
         command: str,
-        character: Character
+        character: Character,
+        parser=None
         # location: Location, direction: str
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.character = character  # self.parser.get_character(command)
         self.location = self.character.location
         self.direction = self.parser.get_direction(command, self.location)
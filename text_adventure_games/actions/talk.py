@@ -14,9 +14,10 @@ class Talk(base.Action):
         self,
         game,
         command: str,
-        character: Character
+        character: Character,
+        parser=None
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.command = command
         # self.character = character
         talk_words = ["talk", "chat", "dialogue", "speak"]
@@ -72,5 +73,12 @@ class Talk(base.Action):
         self.starter.set_dialogue_participant(self.talked_to)
         self.talked_to.set_dialogue_participant(self.starter)
 
-        self.parser.ok(self.command, dialogue_history, self.starter)
+        memories = dialogue.encode_memories()
+        if memories:
+            # The dialogue loop removes characters from the participants as they leave,
+            # so everyone who spoke is taken from the dialogue itself
+            self.parser.add_dialogue_to_history(self.command, self.starter, dialogue.speakers, memories)
+        else:
+            # Summarize and score the conversation like any other action
+            self.parser.ok(self.command, dialogue_history, self.starter)
         return True
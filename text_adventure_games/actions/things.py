@@ -10,8 +10,8 @@ class Get(base.Action):
     ACTION_DESCRIPTION = "Acquire, get, take, pick up an item for personal use and add to inventory."
     ACTION_ALIASES = ["take", "collect", "pick up"]
 
-    def __init__(self, game, command: str, character: Character):
-        super().__init__(game)
+    def __init__(self, game, command: str, character: Character, parser=None):
+        super().__init__(game, parser)
         self.command = command
         # self.character = self.parser.get_character(command)
         self.character = character
@@ -70,9 +70,10 @@ class Drop(base.Action):
         self,
         game,
         command: str,
-        character: Character
+        character: Character,
+        parser=None
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.command = command
         # self.character = self.parser.get_character(command)
         self.character = character
@@ -123,9 +124,10 @@ class Inventory(base.Action):
         self,
         game,
         command: str,
-        character: Character
+        character: Character,
+        parser=None
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.command = command
         # self.character = self.parser.get_character(command)
         self.character = character
@@ -159,9 +161,10 @@ class Examine(base.Action):
         self,
         game,
         command: str,
-        character: Character
+        character: Character,
+        parser=None
     ):
-        super().__init__(game)
+        super().__init__(game, parser)
         self.command = command
         # self.character = self.parser.get_character(command)
         self.character = character
@@ -194,8 +197,8 @@ class Give(base.Action):
     def __init__(self, 
                  game, 
                  command: str,
-                 character: Character):
-        super().__init__(game)
+                 character: Character, parser=None):
+        super().__init__(game, parser)
         self.command = command
         # self.character = self.parser.get_character(command)
         # self.character = character
@@ -270,8 +273,8 @@ class Unlock_Door(base.Action):
     ACTION_NAME = "unlock door"
     ACTION_DESCRIPTION = "Unlock a door that is currently locked so that it may be opened"
 
-    def __init__(self, game, command, character):
-        super().__init__(game)
+    def __init__(self, game, command, character, parser=None):
+        super().__init__(game, parser)
         self.command = command
         # self.character = self.parser.get_character(command)
         self.character = character
@@ -15,12 +15,13 @@ Description: defines how agents select an action given their perceptions and mem
 from typing import TYPE_CHECKING
 
 # local imports
-from text_adventure_games.gpt.gpt_helpers import (limit_context_length,
-                                                  get_prompt_token_count,
-                                                  get_token_remainder,
-                                                  context_list_to_string,
-                                                  GptCallHandler)
-from text_adventure_games.utils.general import enumerate_dict_options, get_logger_extras
+from text_adventure_games.gpt.gpt_helpers import (context_list_to_string,
+                                                  count_tokens,
+                                                  GptCallHandler,
+                                                  PromptBudget,
+                                                  RETRY_BUDGET_SCALE)
+from text_adventure_games.gpt.scheduler import RequestPriority
+from text_adventure_games.utils.general import get_logger_extras
 from .retrieve import retrieve
 from text_adventure_games.assets.prompts import act_prompts as ap
 
@@ -34,8 +35,8 @@ class Act:
         self.game = game
         self.character = character
         self.gpt_handler = self._set_up_gpt()
-        self.token_offset = 0
-        self.offset_pad = 5
+        # (system, user) prompts, if they were built ahead of time with prepare()
+        self.messages = None
  
     def _set_up_gpt(self):
         model_params = {
@@ -44,25 +45,44 @@ class Act:
             "max_tokens": 100,
             "temperature": 1,
             "top_p": 1,
-            "max_retries": 5
+            "max_retries": 5,
+            "priority": RequestPriority.CRITICAL
         }
 
-        return GptCallHandler(**model_params) 
+        return GptCallHandler.get_shared(**model_params)
     
     # def _log_action(self, game, character, message):
     #     extras = get_logger_extras(game, character)
     #     extras["type"] = "Act"
     #     game.logger.debug(msg=message, extra=extras)
 
+    def prepare(self):
+        """
+        Build the action prompts ahead of the call to GPT. Character.prepare_turn calls this
+        on the agent's own turn, once it has perceived and updated its impressions.
+        """
+        self.messages = self.build_messages()
+        return self
+
     def act(self):
         
-        system_prompt, user_prompt = self.build_messages()
+        if self.messages:
+            system_prompt, user_prompt = self.messages
+        else:
+            system_prompt, user_prompt = self.build_messages()
 
         # print("act system:", system_prompt, sep='\n')
         # print("-" * 50)
         # print("act user:", user_prompt, sep='\n')
 
         action_to_take = self.generate_action(system_prompt, user_prompt)
+        if action_to_take is None:
+            # Try once more with less context before giving up on this turn
+            system_prompt, user_prompt = self.build_messages(scale=RETRY_BUDGET_SCALE)
+            action_to_take = self.generate_action(system_prompt, user_prompt)
+        if action_to_take is None:
+            print(f"{self.character.name} couldn't decide on an action and skips this turn")
+            return -999
         
         # self._log_action(self.game, self.character, action_to_take)
         print(f"{self.character.name} chose to take action: {action_to_take}")
@@ -77,21 +97,16 @@ class Act:
         )
         
         if isinstance(response, tuple):
-            # This occurs when there was a Bad Request Error cause for exceeding token limit
-            success, token_difference = response
-            print(f"Action prompts exceeded token limit of model by {token_difference} tokens.")
-            # Add this offset to the calculations of token limits and pad it 
-            self.token_offset = token_difference + self.offset_pad
-            self.offset_pad += 2 * self.offset_pad 
-            return self.act(self.game, self.character)
+            # The request was rejected (e.g. by the content filter); the caller decides what to do
+            _, info = response
+            print(f"GPT rejected the action prompt for {self.character.name} ({info}).")
+            return None
         
         return response
 
-    def build_messages(self):
+    def build_messages(self, scale: float = 1.0):
         system_msg, sys_token_count = self.build_system_message()
-
-        consumed_tokens = sys_token_count + self.token_offset
-        user_msg = self.build_user_message(consumed_tokens=consumed_tokens)
+        user_msg = self.build_user_message(system_msg, sys_token_count, scale=scale)
         return system_msg, user_msg
 
     def build_system_message(self) -> str:
@@ -99,34 +114,24 @@ class Act:
         Build the system prompt for agent actions
         This is considered an "always included" portion of the message
 
-        Args:
-            game (_type_): _description_
-            character (_type_): _description_
-            game_actions (_type_): _description_
-
         Returns:
             str: the system prompt
             int: token count of the system prompt
         """
-        system = ""
-
-        system += self.character.get_standard_info(self.game)
-        system += ap.action_system_mid
-        system += ap.action_system_end
-        
-        game_actions = self.game.parser.actions
-        # Added inverted argument because the game actions are inverted
-        choices_str, _ = enumerate_dict_options(game_actions, names_only=True, inverted=True)
-        system += choices_str
+        standard_info, sys_token_count = self.character.get_standard_info(self.game, return_token_count=True)
+        instructions = ap.action_system_mid + ap.action_system_end
+        sys_token_count += count_tokens(instructions)
 
-        sys_token_count = get_prompt_token_count(content=system, role='system', pad_reply=False)
+        # The menu of actions is rendered and counted once, by the parser
+        choices_str, choices_token_count = self.game.parser.get_action_menu()
+        sys_token_count += choices_token_count
 
-        return system, sys_token_count
+        return standard_info + instructions + choices_str, sys_token_count
 
-    def build_user_message(self, consumed_tokens: int):
+    def build_user_message(self, system_prompt: str, system_tokens: int = None, scale: float = 1.0):
 
         if hasattr(self.game, "get_basic_game_goal"):
-            goal_reminder = self.game.get_basic_game_goal()
+            goal_reminder = self.game.get_basic_game_goal(self.character)
         else:
             goal_reminder = "Complete the objective of the game as quickly as you can. "    
         
@@ -138,52 +143,29 @@ class Act:
             ap.action_incentivize_exploration,
             goal_reminder,
             "Given the above information and others present here, what would you like to do?"]
-        always_included_tokens = get_prompt_token_count(content=always_included,
-                                                        role="user",
-                                                        pad_reply=True, 
-                                                        tokenizer=self.game.parser.tokenizer)
-        
-        # Get available tokens using the requested model's limit as the reference point
-        # All other arguments to this method are subtracted from the limit
-        user_available_tokens = get_token_remainder(self.gpt_handler.model_context_limit, 
-                                                    self.gpt_handler.max_tokens,
-                                                    consumed_tokens,
-                                                    always_included_tokens)
-        imp_limit, mem_limit = self.get_user_token_limits(user_available_tokens, props=(0.33, 0.66))
-
-        # Add the theory of mind of agents in the vicinity
-        # and limit the inclusion to the token count defined in "imp_limit"
-        user_messages = ""
-        tok_count = 0
+
+        budget = PromptBudget(self.gpt_handler, 
+                              system=system_prompt, 
+                              system_tokens=system_tokens, 
+                              tokenizer=self.game.parser.tokenizer,
+                              scale=scale)
+        budget.add_fixed(*always_included)
+
+        # Add the theory of mind of agents in the vicinity, using up to a third of the space
         try:
             impressions = self.character.impressions.get_multiple_impressions(chars_in_view)
-            impressions, tok_count = limit_context_length(history=impressions,
-                                                          max_tokens=imp_limit,
-                                                          tokenizer=self.game.parser.tokenizer,
-                                                          return_count=True)
-            # Add the impressions to the user prompt
-            user_messages += context_list_to_string(impressions)
         except AttributeError:
-            pass
+            impressions = []
+        budget.add_section("impressions", impressions, priority=0, sep_tokens=0, max_tokens=budget.available // 3)
 
-        # Retrieve ALL relevant memories to the situation
-        memories_list = retrieve(self.game, self.character, query=None, n=40)  # Should we limit this too or just let it fill up?
+        # Retrieve ALL relevant memories to the situation; the least relevant are dropped first
+        memories_list = retrieve(self.game, self.character, query=None, n=40)
+        budget.add_section("memories", memories_list, priority=1)
+        packed = budget.pack()
 
-        # This is the token count still available to fill with memories
-        memory_available_tokens = get_token_remainder(user_available_tokens, tok_count)
-        memories_list = limit_context_length(memories_list,
-                                             max_tokens=memory_available_tokens, 
-                                             tokenizer=self.game.parser.tokenizer)
-        
+        user_messages = context_list_to_string(packed["impressions"])
         user_messages += always_included[0]
-        user_messages += context_list_to_string(context=memories_list, sep="\n")
+        user_messages += context_list_to_string(context=packed["memories"], sep="\n")
         
         user_messages += '\n'.join(always_included[1:])
         return user_messages
-
-    def get_user_token_limits(self, remainder, props):
-        ratio_impressions, ratio_memories = props
-        remaining_tokens_impressions = int(remainder * ratio_impressions)
-        remaining_tokens_memories = int(remainder * ratio_memories)
-
-        return remaining_tokens_impressions, remaining_tokens_memories
@@ -15,7 +15,10 @@ from text_adventure_games.gpt.gpt_helpers import (GptCallHandler,
                                                   limit_context_length,
                                                   get_prompt_token_count,
                                                   get_token_remainder,
-                                                  context_list_to_string)
+                                                  context_list_to_string,
+                                                  count_tokens,
+                                                  PromptBudget,
+                                                  RETRY_BUDGET_SCALE)
 
 if TYPE_CHECKING:
     from text_adventure_games.things.characters import Character
@@ -49,8 +52,6 @@ class Goals:
 
         # GPT Call handler attrs
         self.gpt_handler = self._set_up_gpt()
-        self.token_offset = 50  # Taking into account a few variable tokens in the user prompt
-        self.offset_pad = 5
  
     def _set_up_gpt(self):
         model_params = {
@@ -79,67 +80,100 @@ class Goals:
             game (Game): the game
 
         Returns:
-            str: a new goal for this round
+            str: a new goal for this round, or None if GPT rejected the goal prompt
         """
+        draft = self.draft_goals(game)
+        if not draft:
+            return None
+        self.commit_goals(game, *draft)
+        return draft[0]
 
+    def draft_goals(self, game: "Game") -> tuple[str, np.ndarray]:
+        """
+        Call GPT for this round's goals and embed them without recording them.
+        This only reads the game state, so drafts for several characters can be made concurrently.
+
+        Args:
+            game (Game): the game
+
+        Returns:
+            tuple[str, np.ndarray]: the goal text and its embedding, or None if GPT rejected 
+                                    the goal prompt even with less context
+        """
         system, user = self.build_goal_prompts(game)
         
         goal = self.gpt_handler.generate(system=system, user=user)
         if isinstance(goal, tuple):
-            # This occurs when there was a Bad Request Error cause for exceeding token limit
-            success, token_difference = goal
-            # Add this offset to the calculations of token limits and pad it 
-            self.token_offset = token_difference + self.offset_pad
-            self.offset_pad += 2 * self.offset_pad 
-            return self.gpt_generate_goals(self.game)
-        
-        # log the content of the goals explicitly
-        self._log_goals(game, goal)
+            # The request was rejected (e.g. by the content filter); try once more with less context
+            system, user = self.build_goal_prompts(game, scale=RETRY_BUDGET_SCALE)
+            goal = self.gpt_handler.generate(system=system, user=user)
+        if isinstance(goal, tuple):
+            # Keep last round's goals rather than stopping the game
+            _, info = goal
+            print(f"GPT rejected the goal prompt for {self.character.name} ({info}); skipping this round's goals.")
+            return None
         
         # get embedding of goal
         goal_embed = self._create_goal_embedding(goal)
+        return goal, goal_embed
+
+    def commit_goals(self, game: "Game", goal: str, goal_embed: np.ndarray) -> None:
+        """
+        Record drafted goals for this round.
+
+        Args:
+            game (Game): the game
+            goal (str): the goal text
+            goal_embed (np.ndarray): embedding of the goal text
+        """
+        # log the content of the goals explicitly
+        self._log_goals(game, goal)
         # for experimentation purposes
         self.goal_update(goal, goal_embed, game)
-        return goal
     
-    def build_goal_prompts(self, game):
+    def build_goal_prompts(self, game, scale: float = 1.0):
         system_prompt, sys_tkn_count = self.build_system_prompt(game)
-        consumed_tokens = sys_tkn_count + self.token_offset
-        user_prompt = self.build_user_prompt(game, consumed_tokens=consumed_tokens)
+        user_prompt = self.build_user_prompt(game, system_prompt, sys_tkn_count, scale=scale)
         return system_prompt, user_prompt
     
     def build_system_prompt(self, game):
 
-        system_prompt = self.character.get_standard_info(game, include_perceptions=False)
+        system_prompt, system_tkn_count = self.character.get_standard_info(game, 
+                                                                           include_perceptions=False, 
+                                                                           return_token_count=True)
         system_prompt += gp.gpt_goals_prompt
-
-        system_tkn_count = get_prompt_token_count(system_prompt, role="system", pad_reply=False, tokenizer=game.parser.tokenizer)
+        system_tkn_count += count_tokens(gp.gpt_goals_prompt)
         return system_prompt, system_tkn_count
         
-    def build_user_prompt(self, game, consumed_tokens=0):
+    def build_user_prompt(self, game, system_prompt, system_tokens=None, scale=1.0):
 
         always_included = ["Additional context for creating your goal:\n",
                            "You can keep the previous goal, update the previous goal or create a new one based on your strategy."]
-        always_included_count = get_prompt_token_count(always_included, 
-                                                       role="user", 
-                                                       pad_reply=True, 
-                                                       tokenizer=game.parser.tokenizer)
-        available_tokens = get_token_remainder(self.gpt_handler.model_context_limit,
-                                               self.gpt_handler.max_tokens,
-                                               consumed_tokens,
-                                               always_included_count)
-        
-        reflections_limit, goals_limit = int(available_tokens * 0.6), int(available_tokens * 0.3)
+        budget = PromptBudget(self.gpt_handler, 
+                              system=system_prompt, 
+                              system_tokens=system_tokens, 
+                              tokenizer=game.parser.tokenizer,
+                              scale=scale)
+        budget.add_fixed(*always_included)
+
         # retreive goals and scores for prev round and two rounds prior
         round = game.round
-        goal_prev = None
-        goal_prev_2 = None
         if round > 0:
             goal_prev = self.get_goals(round=round-1, as_str=True)
             score = self.get_goal_scores(round=round-1, as_str=True)
+            if goal_prev:
+                budget.add_section("goals_prev",
+                                   ["Goals of prior round:", goal_prev, "Goal Completion Score of prior round:", score],
+                                   priority=1,
+                                   keep_most_recent=False)
         if round > 1:
             goal_prev_2 = self.get_goals(round=round-2, as_str=True)
             score_2 = self.get_goal_scores(round=round-2, as_str=True)
+            if goal_prev_2:
+                budget.add_section("goals_prev_2",
+                                   ["Goals of two rounds prior:", goal_prev_2, "Goal Completion Score of two rounds prior:", score_2],
+                                   priority=2,
+                                   keep_most_recent=False)
         
         # retreive refelction nodes for two rounds prior
         reflection_raw_2 = []
@@ -148,7 +182,10 @@ class Goals:
             node = self.character.memory.get_observation(node_id)
             if node.node_type.value == 3:
                 reflection_raw_2.append(node.node_description)
-        # reflection_2 = "\n".join(reflection_raw_2)
+        if reflection_raw_2:
+            budget.add_fixed("Reflections on last two rounds:")
+            # Reflections fill most of the prompt, but always leave room for the previous goals
+            budget.add_section("reflections", reflection_raw_2, priority=0, max_tokens=int(budget.available * 0.6))
 
         # get all character objects
         # char_objects = list(game.characters.values())
@@ -158,34 +195,18 @@ class Goals:
         # else:
         #     impressions_str = None
 
+        packed = budget.pack()
         user_prompt = always_included[0]
-        if reflection_raw_2:
+        if packed.get("reflections"):
             # user_prompt += f"Reflections on prior round:\n{self.recent_reflection}\n\n"
             user_prompt += "Reflections on last two rounds:"
-            context_list = limit_context_length(history=reflection_raw_2,
-                                                max_tokens=reflections_limit,
-                                                tokenizer=game.parser.tokenizer)
-            reflection_2 = context_list_to_string(context_list, sep='\n')
+            reflection_2 = context_list_to_string(packed["reflections"], sep='\n')
             user_prompt += f"{reflection_2}\n"
-        if goal_prev:
-            context_list = ["Goals of prior round:", 
-                            goal_prev, 
-                            "Goal Completion Score of prior round:", 
-                            score]
-            context_list = limit_context_length(history=context_list,
-                                                max_tokens=goals_limit // 2,
-                                                tokenizer=game.parser.tokenizer)
-            goal_prev_str = context_list_to_string(context_list, sep='\n')
+        if packed.get("goals_prev"):
+            goal_prev_str = context_list_to_string(packed["goals_prev"], sep='\n')
             user_prompt += f"{goal_prev_str}\n\n"
-        if goal_prev_2:
-            context_list = ["Goals of two rounds prior:", 
-                            goal_prev_2, 
-                            "Goal Completion Score of two rounds prior:", 
-                            score_2]
-            context_list = limit_context_length(history=context_list,
-                                                max_tokens=goals_limit // 2,
-                                                tokenizer=game.parser.tokenizer)
-            goal_prev_2_str = context_list_to_string(context_list, sep='\n')
+        if packed.get("goals_prev_2"):
+            goal_prev_2_str = context_list_to_string(packed["goals_prev_2"], sep='\n')
             user_prompt += f"{goal_prev_2_str}\n"
 
         # if impressions_str:
@@ -269,15 +290,28 @@ class Goals:
             str: a completion based score for each priority level
         """
 
+        scores = self.draft_goal_scores(game)
+        self.score_update(scores, game)
+
+        return scores
+
+    def draft_goal_scores(self, game: "Game") -> str:
+        """
+        Call GPT to score this round's goal completion without recording the scores,
+        so that several characters can be scored concurrently.
+
+        Args:
+            game (Game): the game
+
+        Returns:
+            str: a completion based score for each priority level
+        """
         system_prompt = gp.evaluate_goals_prompt
         system_prompt_tokens = get_prompt_token_count(system_prompt, role="system")
         
         user_prompt = self.build_eval_user_prompt(game, consumed_tokens=system_prompt_tokens)
        
-        scores = self.gpt_handler.generate(system=system_prompt, user=user_prompt)
-        self.score_update(scores, game)
-
-        return scores
+        return self.gpt_handler.generate(system=system_prompt, user=user_prompt)
     
     def build_eval_user_prompt(self, game, consumed_tokens=0):
 
@@ -303,7 +337,8 @@ class Goals:
             # Get the reflections and actions that this agent has made this round
             if node.node_type.value == 3 and node.node_is_self == 1:
                 reflections_raw.append(node.node_description)
-            if node.node_type.value == 1 and node.node_is_self == 1:
+            # conversations this agent started count as actions too
+            if node.node_type.value in (1, 2) and node.node_is_self == 1:
                 actions_raw.append(node.node_description)
 
         reflections_list = limit_context_length(history=reflections_raw,
@@ -16,11 +16,12 @@ from typing import TYPE_CHECKING
 
 # local imports
 from text_adventure_games.assets.prompts import impressions_prompts as ip
-from text_adventure_games.gpt.gpt_helpers import (limit_context_length, 
-                                                  get_token_remainder,
-                                                  get_prompt_token_count,
-                                                  context_list_to_string, 
-                                                  GptCallHandler)
+from text_adventure_games.gpt.gpt_helpers import (context_list_to_string, 
+                                                  count_tokens,
+                                                  GptCallHandler,
+                                                  PromptBudget,
+                                                  RETRY_BUDGET_SCALE)
+from text_adventure_games.gpt.scheduler import RequestPriority
 from text_adventure_games.agent.agent_cognition import retrieve
 from text_adventure_games.utils.general import get_logger_extras
 
@@ -54,8 +55,6 @@ class Impressions:
 
         # GPT Call handler attrs
         self.gpt_handler = self._set_up_gpt()
-        self.token_offset = 50  # Taking into account a few variable tokens in the user prompt
-        self.offset_pad = 5
  
     def _set_up_gpt(self):
         model_params = {
@@ -64,7 +63,8 @@ class Impressions:
             "max_tokens": IMPRESSION_MAX_OUTPUT,
             "temperature": 1,
             "top_p": 1,
-            "max_retries": 5
+            "max_retries": 5,
+            "priority": RequestPriority.BACKGROUND
         }
 
         return GptCallHandler(**model_params)
@@ -155,6 +155,13 @@ class Impressions:
         system, user = self.build_impression_prompts(game, character, target)
 
         impression = self.gpt_generate_impression(system, user)
+        if impression is None:
+            # Try once more with fewer memories
+            system, user = self.build_impression_prompts(game, character, target, scale=RETRY_BUDGET_SCALE)
+            impression = self.gpt_generate_impression(system, user)
+        if impression is None:
+            # Keep the current impression; it will be updated the next time this is called
+            return
         # print(f"{character.name} impression of {target.name}: {impression}")
 
         self._log_impression(game, character, impression)
@@ -180,49 +187,44 @@ class Impressions:
             current_impression (str): the existing impression of the target
 
         Returns:
-            str: a new or updated impression
+            str: a new or updated impression, or None if GPT rejected the prompt
         """
         impression = self.gpt_handler.generate(system=system_prompt, user=user_prompt)
         if isinstance(impression, tuple):
-            # This occurs when there was a Bad Request Error cause for exceeding token limit
-            success, token_difference = impression
-            # Add this offset to the calculations of token limits and pad it 
-            self.token_offset = token_difference + self.offset_pad
-            self.offset_pad += 2 * self.offset_pad 
-            return self.set_impression(self.game, self.character, self.last_target)
+            # The request was rejected (e.g. by the content filter); the caller decides what to do
+            _, info = impression
+            print(f"GPT rejected the impression prompt of {self.name} ({info}).")
+            return None
         
         return impression
 
-    def build_impression_prompts(self, game, character, target):
+    def build_impression_prompts(self, game, character, target, scale=1.0):
         system_prompt, sys_token_count = self.build_system_prompt(game, character, target.name)
-        consumed_tokens = sys_token_count + self.token_offset
-        
-        user_prompt = self.build_user_message(game, character, target, consumed_tokens=consumed_tokens)
+        user_prompt = self.build_user_message(game, character, target, system_prompt, sys_token_count, scale=scale)
         return system_prompt, user_prompt
     
     def build_system_prompt(self, game, character, target_name):
-        system_prompt = character.get_standard_info(game, include_perceptions=False)
-        system_prompt += ip.gpt_impressions_prompt.format(target_name=target_name)
-        sys_tkn_count = get_prompt_token_count(system_prompt, role="system", tokenizer=game.parser.tokenizer)
-        return system_prompt, sys_tkn_count
+        # The standard info is the same for every target this tick, so its count comes from the cache
+        system_prompt, sys_tkn_count = character.get_standard_info(game, include_perceptions=False, return_token_count=True)
+        instructions = ip.gpt_impressions_prompt.format(target_name=target_name)
+        return system_prompt + instructions, sys_tkn_count + count_tokens(instructions)
 
-    def build_user_message(self, game, character, target, consumed_tokens=0) -> str:
+    def build_user_message(self, game, character, target, system_prompt, system_tokens=None, scale=1.0) -> str:
         """
         Helper method to build out the user message string for impression prompting.
 
         Args:
-            target_name (str): name of the target
-            memories_list (list): list of relevant memories
-            current_impression (str): the existing impression of the character
+            game (Game): the game
+            character (Character): the agent making the impression
+            target (Character): the target of the impression
+            system_prompt (str): the system prompt sent with this message
+            system_tokens (int, optional): token count of the system prompt
+            scale (float, optional): share of the remaining context the memories may use. Defaults to 1.0.
 
         Returns:
-            str: _description_
+            str: the user message
         """
         always_included = ["Target person: {t}\n\n".format(t=target.name)]
-        always_included_count = get_prompt_token_count(always_included[0], 
-                                                       role="user", 
-                                                       pad_reply=True, 
-                                                       tokenizer=game.parser.tokenizer)
         # get the agent's current impression of the target character
         target_impression = self._get_impression(target)
 
@@ -233,7 +235,6 @@ class Impressions:
             nodes = [character.memory.get_observation(m_id) for m_id in memory_ids]
             context_list = [node.node_description for node in nodes if target.name in node.node_keywords]
             self.chronological = True
-            target_impression_tkns = get_prompt_token_count(target_impression)
         else:
             # IF this agent has never reflected upon this target, get the 10 most relevant memories about them
             # TODO: how could this query be improved?
@@ -243,30 +244,29 @@ class Impressions:
                                              n=-1, 
                                              query=f"I want to remember everything I know about {target.name}")
             self.chronological = False
-            target_impression_tkns = 0
-        
-        available_tokens = get_token_remainder(self.gpt_handler.model_context_limit,
-                                               consumed_tokens,
-                                               target_impression_tkns,
-                                               always_included_count, 
-                                               self.gpt_handler.max_tokens  # Max output tokens set by user
-                                               )
-        if context_list:
-            context_list = limit_context_length(context_list, 
-                                                max_tokens=available_tokens,
-                                                tokenizer=game.parser.tokenizer)
 
-        message = always_included[0]
         if self.chronological:
             ordering = "in chronological order"
         else:
             ordering = "in order from least to most relevant"
-
+        current_impression = ""
         if target_impression:
-            message += "Current theory of mind for {t} {o}:\n{i}\n\n".format(t=target.name, o=ordering, i=target_impression)
+            current_impression = "Current theory of mind for {t} {o}:\n{i}\n\n".format(t=target.name, o=ordering, i=target_impression)
+        memory_header = "Memories to consider in developing a theory of mind for {t}:\n".format(t=target.name)
+
+        budget = PromptBudget(self.gpt_handler, 
+                              system=system_prompt, 
+                              system_tokens=system_tokens, 
+                              tokenizer=game.parser.tokenizer,
+                              scale=scale)
+        budget.add_fixed(always_included[0], current_impression, memory_header)
+        budget.add_section("memories", context_list)
+        context_list = budget.pack()["memories"]
+
+        message = always_included[0]
+        message += current_impression
         if context_list:
             memory_str = context_list_to_string(context_list, sep="\n")
-            message += "Memories to consider in developing a theory of mind for {t}:\n{m}".format(t=target.name, 
-                                                                                                  m=memory_str)
+            message += memory_header + memory_str
         
         return message
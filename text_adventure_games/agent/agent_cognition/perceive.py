@@ -17,47 +17,68 @@ if TYPE_CHECKING:
     from text_adventure_games.games import Game
     from text_adventure_games.things import Character
 
-def collect_perceptions(game: "Game"):
-    # Collect the latest information about the location
-    return game.describe()
+def collect_perceptions(game: "Game", character: "Character" = None):
+    # Collect the latest information about the location from the character's point of view
+    return game.describe(character)
     
+def get_location_observations(game: "Game", character: "Character") -> Dict:
+    # What the character can observe at their location right now, by category
+    return parse_location_description(collect_perceptions(game, character))
+
 def percieve_location(game: "Game", character: "Character"):
     """
     Gather rudimentary information about the current location of the Agent
-    and store these observations as new memories (of type MemoryType.ACTION).
+    and store these observations as new memories (of type MemoryType.PERCEPT).
 
     Args:
         game (games.Game): the current game object
     """
-    location_description = collect_perceptions(game)
-    location_observations = parse_location_description(location_description)
+    commit_perceptions(game, character, draft_perceptions(game, character))
+
+def draft_perceptions(game: "Game", character: "Character"):
+    """
+    Find what is new at the character's location and summarize and score each new observation,
+    without changing the character. Pass the result to commit_perceptions.
+
+    Returns:
+        tuple[Dict, Dict, list]: the location observations, the new ones among them, and a
+                                 (statement, importance, keywords) tuple for each new observation
+    """
+    location_observations = get_location_observations(game, character)
 
     # check for differences between observations
     diffs_perceived = find_difference_in_dict_lists(character.last_location_observations,
                                                     location_observations)
 
+    percepts = []
+    for observations in diffs_perceived.values():
+        for statement in observations:
+            command = "Look around at the surroundings"
+            percepts.append(game.parser.summarise_and_score_action(statement, 
+                                                                   character,
+                                                                   command=command))
+    return location_observations, diffs_perceived, percepts
+
+def commit_perceptions(game: "Game", character: "Character", draft):
+    """
+    Store perceptions drafted by draft_perceptions as new memories.
+    """
+    location_observations, diffs_perceived, percepts = draft
+
     # Replace the last perception with the current one
     character.last_location_observations = location_observations.copy()
 
-    add_new_observations(game, character, new_percepts=diffs_perceived)
+    for observations in diffs_perceived.values():
+        print(f"{character.name} sees: {observations}")
 
-def add_new_observations(game: "Game", character: "Character", new_percepts: Dict):
     # Create new observations from the differences
-    for observations in new_percepts.values():
-        print(f"{character.name} sees: {observations}")
-        for statement in observations:
-            # print(statement)
-            command = "Look around at the surroundings"
-            action_statement, action_importance, action_keywords = game.parser.summarise_and_score_action(statement, 
-                                                                                                          character,
-                                                                                                          command=command)
-
-            character.memory.add_memory(round=game.round,
-                                        tick=game.tick,
-                                        description=action_statement,
-                                        keywords=action_keywords,
-                                        location=character.location.name,
-                                        success_status=True,
-                                        memory_importance=action_importance,
-                                        memory_type=MemoryType.PERCEPT.value,
-                                        actor_id=character.id)
+    for action_statement, action_importance, action_keywords in percepts:
+        character.memory.add_memory(round=game.round,
+                                    tick=game.tick,
+                                    description=action_statement,
+                                    keywords=action_keywords,
+                                    location=character.location.name,
+                                    success_status=True,
+                                    memory_importance=action_importance,
+                                    memory_type=MemoryType.PERCEPT.value,
+                                    actor_id=character.id)
@@ -34,12 +34,12 @@ import json
 # local imports
 from text_adventure_games.agent.memory_stream import MemoryType
 from text_adventure_games.assets.prompts import reflection_prompts as rp
-from text_adventure_games.gpt.gpt_helpers import (limit_context_length,
-                                                  get_prompt_token_count,
-                                                  get_token_remainder, 
-                                                  GptCallHandler)
+from text_adventure_games.gpt.gpt_helpers import (chunk_context,
+                                                  count_tokens,
+                                                  count_tokens_batch,
+                                                  GptCallHandler,
+                                                  PromptBudget)
 
-from ordered_set import OrderedSet
 from . import retrieve
 
 if TYPE_CHECKING:
@@ -110,7 +110,7 @@ def generalize(game, character):
         "max_retries": 5
     }
 
-    gpt_handler = GptCallHandler(**model_params)
+    gpt_handler = GptCallHandler.get_shared(**model_params)
     
     # how many memories to get during retrieval, which is called 4 times (once per passed question)
     memories_per_retrieval = 25
@@ -118,24 +118,22 @@ def generalize(game, character):
     # Get Static Components (System Prompt and Impressions don't update during Reflection) #
 
     # load system prompt
-    system_prompt = character.get_standard_info(game, include_goals=True, include_perceptions=False) + rp.gpt_generalize_prompt
-    # get the number of tokens in the system prompt
-    system_prompt_token_count = get_prompt_token_count(content=system_prompt, role='system', pad_reply=False)
+    system_prompt, system_prompt_token_count = character.get_standard_info(game, 
+                                                                           include_goals=True, 
+                                                                           include_perceptions=False, 
+                                                                           return_token_count=True)
+    system_prompt += rp.gpt_generalize_prompt
+    system_prompt_token_count += count_tokens(rp.gpt_generalize_prompt)
 
     # print('-'*100)
     # print("SYSTEM PROMPT:\n", system_prompt, sep='')
     # print('-'*100)
     
     # Get IMPRESSIONS of each character still in the game
-    impressions_token_count = 0
     impressions = []
     if character.use_impressions:
         impressions = character.impressions.get_multiple_impressions(game.characters.values())
 
-        # count the number of tokens in the impressions, including a padding for GPT's reply
-        # containing <|start|>assistant<|message|>
-        impressions_token_count = get_prompt_token_count(content=impressions, role='user', pad_reply=True)
-
     # make a list of relevant memories that have been retrieved based on the query questions
     relevant_memories = []
     for question in rp.memory_query_questions:
@@ -152,17 +150,16 @@ def generalize(game, character):
     relevant_memories.sort(key=lambda x: len(x))
     # relevant_memories = [memory+'\n' for memory in relevant_memories]
 
-    # get the relevant memories token count (role=None and pad_reply=False because we've already accounted for these)
-    relevant_memories_token_count = get_prompt_token_count(content=relevant_memories, role=None, pad_reply=False)
+    # get the token count of each relevant memory (no role or reply padding because we've already accounted for these)
+    relevant_memories_token_counts = count_tokens_batch(relevant_memories)
 
     # print("ALL MEMORIES:", relevant_memories_token_count)
     # print(relevant_memories)
 
-    # get the relevant memories primer message token count
+    # the relevant memories primer messages
     # I'm including None here just for the token calculation, in case we need to supply this in the prompt
     #  if there are no relevant reflections
     relevant_memories_primer = ['\nRelevant Reflections:\n', '\nRelevant Memories:\n', 'None\n']
-    rel_mem_primer_token_count = get_prompt_token_count(content=relevant_memories_primer, role=None, pad_reply=False)
 
     # the instructions telling GPT to generate high-level insights
     insight_q_prompt = ['\n'+rp.insight_question]
@@ -171,66 +168,32 @@ def generalize(game, character):
     # print("INSIGHT PROMPT:", insight_q_prompt)
     # print('-'*100)
 
-    # get the insight prompt token count
-    insight_q_token_count = get_prompt_token_count(content=insight_q_prompt, role=None, pad_reply=False)
-
-    # Calculate 
-    available_tokens = get_token_remainder(gpt_handler.model_context_limit,  # Max input for requested model
-                                           gpt_handler.max_tokens,  # GPT's response limit, set by user
-                                           system_prompt_token_count,  # system message tokens
-                                           impressions_token_count,  # impressions tokens
-                                           rel_mem_primer_token_count,  # relevant memories primer tokens
-                                           insight_q_token_count)  # question count
-
-    # while there are still relevant memories that haven't been reflected on
-    # (note that we remove them from new_observations after reflecting on them)
-    while relevant_memories_token_count > 0:
-
-        # limit the user prompt items to fit in GPT's context size
-        # (keep_most_recent=False allows us to get smaller observations first)
-        relevant_memories_limited = limit_context_length(relevant_memories,
-                                                         max_tokens=available_tokens,  # insight message tokens
-                                                         tokenizer=game.parser.tokenizer,
-                                                         keep_most_recent=False)
-        
-        # print("LIMITED MEMORIES:", get_prompt_token_count(content=relevant_memories_limited, role=None, pad_reply=False))
-        # print(relevant_memories_limited)
-
-        # if there are no memories small enough to be processed, break the loop
-        if len(relevant_memories_limited) <= 0:
-            break
+    # Impressions are sent with every chunk, so they may take at most half of the prompt;
+    # whatever is left is the size of each chunk of memories
+    budget = PromptBudget(gpt_handler, system=system_prompt, system_tokens=system_prompt_token_count)
+    budget.add_fixed(*relevant_memories_primer, *insight_q_prompt)
+    budget.add_section("impressions", impressions, priority=0, max_tokens=budget.available // 2, sep_tokens=0)
+    impressions = budget.pack()["impressions"]
+    available_tokens = budget.remaining
+
+    # split the relevant memories into consecutive chunks that each fit in GPT's context size,
+    # and reflect on one chunk at a time (smaller observations come first).
+    # Chunking stops at the first memory too large to be processed on its own.
+    for start, end in chunk_context(relevant_memories_token_counts, available_tokens):
+        relevant_memories_limited = relevant_memories[start:end]
         
         # print('-'*100)
         # print("TRIMMED MEMORIES:", relevant_memories_limited)
         # print('-'*100)
 
-        reflections_lmtd = []
-        observations_lmtd = []
-        for full_memory in relevant_memories_limited:
-            idx, memory_desc = full_memory.split('.', 1)
-            idx = int(idx)
-            memory_desc = memory_desc.strip()
-            memory_type = character.memory.get_observation_type(idx)
-            if memory_type.value == MemoryType.REFLECTION.value:
-                reflections_lmtd.append(full_memory)
-            else:
-                observations_lmtd.append(memory_desc)
-
-        # if either is empty, replace it with a list containing the word None
-        if not reflections_lmtd:
-            reflections_lmtd = [relevant_memories_primer[2]]
-        if not observations_lmtd:
-            observations_lmtd = [relevant_memories_primer[2]]
-
-        # get user input consisting of impressions, relevant memories (with primer), and the insight instructions
-        user_prompt_list = impressions + [relevant_memories_primer[0]] + reflections_lmtd + \
-            [relevant_memories_primer[1]] + observations_lmtd + insight_q_prompt
-        
-        # join the list items into a string – note that the list values end with newline characters,
-        # so join using an empty string
-        user_prompt_str = "".join(user_prompt_list)
+        user_prompt_str = build_insight_prompt(character, 
+                                               impressions, 
+                                               relevant_memories_limited, 
+                                               relevant_memories_primer, 
+                                               insight_q_prompt)
         
         success = False
+        retried = False
         while not success:
             try:
                 # get GPT's response
@@ -238,6 +201,23 @@ def generalize(game, character):
                     system=system_prompt,
                     user=user_prompt_str
                 )
+                if isinstance(response, tuple):
+                    _, info = response
+                    if retried:
+                        print(f"GPT rejected the reflection prompt of {character.name} ({info}); "
+                              "skipping these memories.")
+                        break
+                    # The request was rejected (e.g. by the content filter); 
+                    # try once more with half of the impressions and memories
+                    retried = True
+                    user_prompt_str = build_insight_prompt(
+                        character,
+                        impressions[:len(impressions) // 2],
+                        relevant_memories_limited[:max(1, len(relevant_memories_limited) // 2)],
+                        relevant_memories_primer,
+                        insight_q_prompt
+                    )
+                    continue
 
                 # convert string response to dictionary
                 new_generalizations = json.loads(response)
@@ -249,16 +229,50 @@ def generalize(game, character):
                 # add the new generalizations to the character's memory
                 add_generalizations_to_memory(game, character, new_generalizations)               
 
-        # reset relevant memories to exclude all from the previous reflection
-        # (this also removes the relevant memories primer string)
-        relevant_memories = list(OrderedSet(relevant_memories) - OrderedSet(relevant_memories_limited))
-        # relevant_memories.sort(key=lambda x: len(x)) #redundant?
-        # get the updated new observations token count
-        relevant_memories_token_count = get_prompt_token_count(content=relevant_memories, role=None, pad_reply=False)
 
-        # print("REDUCED MEMORIES:", get_prompt_token_count(content=relevant_memories, role=None, pad_reply=False))
-        # print(relevant_memories)
-        # print(relevant_memories_token_count > 0)
+def build_insight_prompt(character: "Character", 
+                         impressions: list, 
+                         memories: list, 
+                         memories_primer: list, 
+                         insight_q_prompt: list) -> str:
+    """
+    Build the user prompt asking for insights on a chunk of memories.
+
+    Args:
+        character (Character): the reflecting character
+        impressions (list): the character's impressions of others
+        memories (list): enumerated memories ("<idx>. <description>") to reflect on
+        memories_primer (list): headers for the reflections and the other memories, and the "None" placeholder
+        insight_q_prompt (list): the instructions telling GPT to generate high-level insights
+
+    Returns:
+        str: the user prompt
+    """
+    reflections_lmtd = []
+    observations_lmtd = []
+    for full_memory in memories:
+        idx, memory_desc = full_memory.split('.', 1)
+        idx = int(idx)
+        memory_desc = memory_desc.strip()
+        memory_type = character.memory.get_observation_type(idx)
+        if memory_type.value == MemoryType.REFLECTION.value:
+            reflections_lmtd.append(full_memory)
+        else:
+            observations_lmtd.append(memory_desc)
+
+    # if either is empty, replace it with a list containing the word None
+    if not reflections_lmtd:
+        reflections_lmtd = [memories_primer[2]]
+    if not observations_lmtd:
+        observations_lmtd = [memories_primer[2]]
+
+    # get user input consisting of impressions, relevant memories (with primer), and the insight instructions
+    user_prompt_list = impressions + [memories_primer[0]] + reflections_lmtd + \
+        [memories_primer[1]] + observations_lmtd + insight_q_prompt
+    
+    # join the list items into a string – note that the list values end with newline characters,
+    # so join using an empty string
+    return "".join(user_prompt_list)
 
 
 def add_generalizations_to_memory(game: "Game", character: "Character", generalizations: Dict, ):
@@ -8,7 +8,6 @@ Description: defines how agents select an action given their perceptions and mem
 from __future__ import annotations
 from typing import TYPE_CHECKING
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
 # local imports
 if TYPE_CHECKING:
@@ -47,14 +46,20 @@ def retrieve(game: "Game", character: "Character", query: str = None, n: int = -
         n (int): the number of relevant memories to return. Defaults to -1.
         include_idx (bool): if True returns memory index numbers along with the memory descriptions
     """
-    seach_keys = gather_keywords_for_search(game, character, query)
-    memory_node_ids = get_relevant_memory_ids(seach_keys, character)
-    if len(memory_node_ids) == 0:
+    # The ranking only depends on the query, the round (through the goals used as search keys) and the
+    # memories themselves, so it is reused by every stage of a turn until a memory is added or changed
+    cache_key = (game.round, query)
+    ranked_memory_ids = character.memory.get_cached_retrieval(cache_key)
+    if ranked_memory_ids is None:
+        seach_keys = gather_keywords_for_search(game, character, query)
+        memory_node_ids = get_relevant_memory_ids(seach_keys, character)
+
+        # TODO: how many should be returned? default = all
+        ranked_memory_ids = rank_nodes(character, memory_node_ids, query) if memory_node_ids else []
+        character.memory.cache_retrieval(cache_key, ranked_memory_ids)
+    if len(ranked_memory_ids) == 0:
         return None
 
-    # TODO: how many should be returned? default = all
-    ranked_memory_ids = rank_nodes(character, memory_node_ids, query)
-
     # If specified positive integer, then take up to that many
     # We take the negative index through to the end because the nodes are in ascending order of relevancy
     if n > 0:
@@ -140,6 +145,9 @@ def calculate_node_relevance(character, memory_ids, query):
     Returns:
         np.array: a scaled list of relevance scores for each node
     """
+    # scikit-learn is slow to import, so defer it until memories are first ranked
+    from sklearn.metrics.pairwise import cosine_similarity
+
     memory_embeddings = [character.memory.get_embedding(i) for i in memory_ids]
     if query:
         # if a query is passed, only this will be used to rank node relevance
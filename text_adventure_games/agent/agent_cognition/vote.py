@@ -9,17 +9,15 @@ import json
 import logging
 from random import choice
 from typing import List, TYPE_CHECKING, Union
-import openai
 
 # local imports
 from . import retrieve
 from text_adventure_games.assets.prompts import vote_prompt as vp
-from text_adventure_games.utils.general import get_logger_extras
-from text_adventure_games.gpt.gpt_helpers import (limit_context_length,
-                                                  get_prompt_token_count,
-                                                  get_token_remainder,
-                                                  context_list_to_string,
-                                                  GptCallHandler)
+from text_adventure_games.utils.general import get_logger_extras, map_concurrently
+from text_adventure_games.gpt.gpt_helpers import (context_list_to_string,
+                                                  count_tokens,
+                                                  GptCallHandler,
+                                                  PromptBudget)
 from ..memory_stream import MemoryType
 
 if TYPE_CHECKING:
@@ -27,18 +25,25 @@ if TYPE_CHECKING:
     from text_adventure_games.games import Game
 
 VOTING_MAX_OUTPUT = 100
+VOTING_RETRIES = 5
 
 class VotingSession:
-    def __init__(self, game: "Game", participants: List["Character"]):
+    def __init__(self, game: "Game", participants: List["Character"], concurrent: bool = True):
+        """
+        Args:
+            game (Game): the game
+            participants (List[Character]): the voters
+            concurrent (bool, optional): cast all ballots at once. Ballots are secret, so voters
+                                         don't depend on each other. Defaults to True.
+        """
         self.game = game
+        self.concurrent = concurrent
         self.participants = self._set_participants(participants)
         self.tally = Counter()
         self.voter_record = defaultdict(str)
 
         # gpt call attrs
         self.gpt_handler = self._set_up_gpt()
-        self.token_offset = 10
-        self.offset_pad = 5
 
     def _set_participants(self, participants):
         immune = []
@@ -50,7 +55,8 @@ class VotingSession:
             print(f"{immune[0].name} is safe from the vote")
             self._add_idol_possession_to_memory(immune, participants)
         self.immune = immune
-        return list(set(participants))
+        # Remove duplicates but keep a stable voting order
+        return list(dict.fromkeys(participants))
 
     def _add_idol_possession_to_memory(self, immune_players, participants):
         immune_desc = vp.immunity_memory_prompt.format(immune_players=", ".join([ip.name for ip in immune_players]))
@@ -76,7 +82,7 @@ class VotingSession:
             "max_retries": 5
         }
 
-        return GptCallHandler(**model_params) 
+        return GptCallHandler.get_shared(**model_params)
 
     def get_vote_options(self, current_voter: "Character", names_only=False):
         """
@@ -90,38 +96,61 @@ class VotingSession:
         """
         predicate = lambda p: (p != current_voter) and (p not in self.immune)
         if names_only:
-            return [p.name for p in self.participants if predicate]
+            return [p.name for p in self.participants if predicate(p)]
         else:
-            return [p for p in self.participants if predicate]
+            return [p for p in self.participants if predicate(p)]
 
     def run(self):
-        for voter in self.participants: 
-            # print(f"Voter: {voter.name}")
-            # 1. Gather context for voter
-            # 2. have them cast vote:
-            self._run_character_vote(voter)
+        """
+        Collect a ballot from every participant, then record the votes in participant order.
+        """
+        voters = list(self.participants)
+        if self.concurrent:
+            ballots = map_concurrently(self._cast_ballot, voters, max_workers=getattr(self.game, "max_workers", None))
+        else:
+            ballots = [self._cast_ballot(voter) for voter in voters]
+
+        for voter, ballot in zip(voters, ballots):
+            self._record_ballot(voter, ballot)
+        
+        # Clean up / reset any idols used in this round
+        self._cleanup()
 
     def _run_character_vote(self, voter):
+        self._record_ballot(voter, self._cast_ballot(voter))
+
+    def _cast_ballot(self, voter):
+        """
+        Gather context for a voter and have them cast a vote. This doesn't modify the
+        session or the voter, so ballots can be cast concurrently.
+
+        Args:
+            voter (Character): the character voting
+
+        Returns:
+            tuple: (vote target name, confessional) or (None, None) if GPT failed to vote properly
+        """
         system_prompt, user_prompt = self._gather_voter_context(voter)
 
-        success = False
-        for i in range(5):
-            vote = self.gpt_cast_vote(system_prompt, user_prompt, voter)
+        for _ in range(VOTING_RETRIES):
+            vote = self.gpt_cast_vote(system_prompt, user_prompt)
+            if isinstance(vote, tuple):
+                # A rejected request; the prompts already fit the model, so just count it as a failed try
+                continue
             vote_name, vote_confessional, success = self._validate_vote(vote, voter)
-            success = success
             if success:
-                self._record_vote(voter, vote_name, vote_confessional)
-                break
-            elif i == 4:
-                # This vote has failed too many times so get a random vote
-                print(f"{voter.name} is failed to vote properly. Making a random choice.")
-                valid_options = self.get_vote_options(voter, names_only=True)
-                random_vote = choice(valid_options)
-                self._record_vote(voter, random_vote, "This was a randomized vote because GPT failed to vote properly.")
-                break
-        
-        # Clean up / reset any idols used in this round
-        self._cleanup()
+                return vote_name, vote_confessional
+        return None, None
+
+    def _record_ballot(self, voter, ballot):
+        vote_name, vote_confessional = ballot
+        if vote_name is None:
+            # This vote has failed too many times so get a random vote
+            print(f"{voter.name} is failed to vote properly. Making a random choice.")
+            valid_options = self.get_vote_options(voter, names_only=True)
+            vote_name = choice(valid_options)
+            vote_confessional = "This was a randomized vote because GPT failed to vote properly."
+        self._record_vote(voter, vote_name, vote_confessional)
 
     def _record_vote(self, voter, vote_name, vote_confessional):
         self.tally[vote_name] += 1
@@ -192,7 +221,9 @@ class VotingSession:
         return record
 
     def _gather_voter_context(self, voter: "Character"):
-        voter_std_info = voter.get_standard_info(self.game, include_perceptions=False)
+        voter_std_info, std_token_count = voter.get_standard_info(self.game, 
+                                                                  include_perceptions=False, 
+                                                                  return_token_count=True)
         valid_options = self.get_vote_options(voter)
         try:
             impressions = voter.impressions.get_multiple_impressions(valid_options)
@@ -206,17 +237,14 @@ class VotingSession:
 
         system = self._build_system_prompt(voter_std_info,
                                            prompt_ending=vp.vote_system_ending)
-        
-        system_token_count = get_prompt_token_count(content=system,
-                                                    role="system",
-                                                    tokenizer=self.game.parser.tokenizer)
-        tokens_consumed = system_token_count + self.token_offset
+        system_token_count = std_token_count + count_tokens(vp.vote_system_ending)
         
         user = self._build_user_prompt(voter=voter,
                                        impressions=impressions, 
                                        memories=hyperrelevant_memories,
                                        prompt_ending=vp.vote_user_prompt,
-                                       consumed_tokens=tokens_consumed)
+                                       system_prompt=system,
+                                       system_tokens=system_token_count)
         return system, user
     
     def _build_system_prompt(self, standard_info, prompt_ending):
@@ -231,55 +259,40 @@ class VotingSession:
                            impressions: list,
                            memories: list,
                            prompt_ending: str,
-                           consumed_tokens: int = 0):
+                           system_prompt: str = None,
+                           system_tokens: int = None):
         
         choices = self.get_vote_options(voter, names_only=True)
         user_prompt_end = prompt_ending.format(vote_options=choices)
-
-        always_included_count = get_prompt_token_count(content=user_prompt_end,
-                                                       role="user",
-                                                       pad_reply=True)
-        
-        user_available_tokens = get_token_remainder(self.gpt_handler.model_context_limit, 
-                                                    self.gpt_handler.max_tokens,
-                                                    consumed_tokens,
-                                                    always_included_count)
-        
-        # Initially allot half of the remaining tokens to the impressions
-        context_limit = user_available_tokens // 2
+        impressions_header = "Your REFLECTIONS on other:\n"
+        memories_header = "SELECT RELEVANT MEMORIES to the vote:\n"
+
+        budget = PromptBudget(self.gpt_handler, 
+                              system=system_prompt, 
+                              system_tokens=system_tokens, 
+                              tokenizer=self.game.parser.tokenizer)
+        budget.add_fixed(user_prompt_end, impressions_header, memories_header, "\n\n\n\n")
+        # Impressions come first but may only take half of the space
+        budget.add_section("impressions", impressions, priority=0, max_tokens=budget.available // 2, sep_tokens=0)
+        budget.add_section("memories", memories, priority=1, sep_tokens=0)
+        packed = budget.pack()
 
         user_prompt = ""
-        if impressions:
-            impressions, imp_token_count = limit_context_length(impressions,
-                                                                context_limit,
-                                                                return_count=True)
-            
-            user_prompt += f"Your REFLECTIONS on other:\n{context_list_to_string(impressions)}\n\n"
-            context_limit = get_token_remainder(user_available_tokens,
-                                                imp_token_count)
-        if memories:
-            memories = limit_context_length(memories,
-                                            context_limit)
-                                                                
-            user_prompt += f"SELECT RELEVANT MEMORIES to the vote:\n{context_list_to_string(memories)}\n\n"
+        if packed["impressions"]:
+            user_prompt += f"{impressions_header}{context_list_to_string(packed['impressions'])}\n\n"
+        if packed["memories"]:
+            user_prompt += f"{memories_header}{context_list_to_string(packed['memories'])}\n\n"
 
         user_prompt += user_prompt_end
         return user_prompt
   
-    def gpt_cast_vote(self, system_prompt, user_prompt, voter):
+    def gpt_cast_vote(self, system_prompt, user_prompt):
         # This method constructs a call to GPT, passing the context as part of a system prompt
         # The user prompt should contain info about recent memories, 
         # the fact that the model must reason about who to vote for,
         # and the list of the valid people to choose to vote for.
-        vote = self.gpt_handler.generate(system_prompt, user_prompt)
-        if isinstance(vote, tuple):
-            # This occurs when there was a Bad Request Error cause for exceeding token limit
-            success, token_difference = vote
-            # Add this offset to the calculations of token limits and pad it 
-            self.token_offset = token_difference + self.offset_pad + self.token_offset
-            self.offset_pad += 2 * self.offset_pad 
-            return self._run_character_vote(voter)
-        return vote
+        # A tuple is returned if the context was too long; see _cast_ballot.
+        return self.gpt_handler.generate(system_prompt, user_prompt)
 
     def _log_confessional(self, voter: "Character", message: str):
         extras = get_logger_extras(self.game, voter)
@@ -303,8 +316,12 @@ class VotingSession:
         return True
 
 class JuryVotingSession(VotingSession):
-    def __init__(self, game: "Game", jury_members: List["Character"], finalists: List["Character"]):
-        super().__init__(game=game, participants=jury_members)
+    def __init__(self, 
+                 game: "Game", 
+                 jury_members: List["Character"], 
+                 finalists: List["Character"], 
+                 concurrent: bool = True):
+        super().__init__(game=game, participants=jury_members, concurrent=concurrent)
         self.finalists = finalists
 
     def get_vote_options(self, current_voter: "Character", names_only=False):
@@ -326,7 +343,10 @@ class JuryVotingSession(VotingSession):
 
     def _gather_voter_context(self, voter):
         # Adjust to focus on the finalists and the criteria for selecting the winner
-        voter_std_info = voter.get_standard_info(self.game, include_goals=False, include_perceptions=False)
+        voter_std_info, std_token_count = voter.get_standard_info(self.game, 
+                                                                  include_goals=False, 
+                                                                  include_perceptions=False, 
+                                                                  return_token_count=True)
         try:
             impressions = voter.impressions.get_multiple_impressions(self.finalists)
         except AttributeError:
@@ -340,17 +360,14 @@ class JuryVotingSession(VotingSession):
         
         system = self._build_system_prompt(voter_std_info,
                                            prompt_ending=vp.jury_system_ending)
-        
-        system_token_count = get_prompt_token_count(content=system,
-                                                    role="system",
-                                                    tokenizer=self.game.parser.tokenizer)
-        tokens_consumed = system_token_count + self.token_offset
+        system_token_count = std_token_count + count_tokens(vp.jury_system_ending)
         
         user = self._build_user_prompt(voter=voter,
                                        impressions=impressions, 
                                        memories=hyperrelevant_memories,
                                        prompt_ending=vp.jury_user_prompt,
-                                       consumed_tokens=tokens_consumed)
+                                       system_prompt=system,
+                                       system_tokens=system_token_count)
         
         return system, user
     
@@ -11,11 +11,10 @@ from collections import defaultdict
 from dataclasses import dataclass, field
 import re
 import numpy as np
-from spacy import load as spacyload
 # from uuid import uuid4
 
 # Local imports
-from ..utils.general import set_up_openai_client, get_text_embedding
+from ..utils.general import get_text_embedding, get_nlp_model
 if TYPE_CHECKING:
     from ..things.characters import Character
 
@@ -49,8 +48,7 @@ class MemoryStream:
     @classmethod
     def _generate_stopwords(cls):
         if cls._stopwords is None:
-            nlp = spacyload('en_core_web_sm', disable=['ner', 'tagger', 'parser', 'textcat'])
-            cls._stopwords = nlp.Defaults.stop_words
+            cls._stopwords = get_nlp_model().Defaults.stop_words
         return cls._stopwords
 
     def __init__(self, character: "Character"):
@@ -68,6 +66,10 @@ class MemoryStream:
         
         self.num_observations = 0
         self.observations = []
+        # Incremented by every change to the memories, their embeddings or the default queries
+        self.version = 0
+        # (version, {(round, query): ranked node ids}); see retrieve.retrieve
+        self._retrieval_cache = (None, {})
         
         self.memory_embeddings = {}  # keys are the index of the observation
         self.keyword_nodes = defaultdict(lambda: defaultdict(list))
@@ -91,9 +93,6 @@ class MemoryStream:
         self.recency_alpha = 1
         self.relevance_alpha = 1
 
-        # Set up a client for this instance
-        self.client = set_up_openai_client(org="Penn")
-
         # Initialize stopwords
         self.stopwords = self._generate_stopwords()
 
@@ -107,8 +106,16 @@ class MemoryStream:
                    success_status,
                    memory_importance,
                    memory_type,
-                   actor_id):
-        
+                   actor_id,
+                   embedding=None):
+        """
+        Add a memory of any MemoryType.
+
+        Args:
+            embedding (np.ndarray, optional): the description's embedding, if it was already
+                                              computed (e.g. in a batch for several characters).
+                                              Embedded here if not given.
+        """
         if not self.is_valid_memory_type(memory_type):
             valid_types = [type.name for type in MemoryType]
             raise ValueError(f"Memories must be created with valid type; one of {valid_types}")
@@ -126,8 +133,9 @@ class MemoryStream:
         node_kwds = [w for kw_type in keywords.values() for w in kw_type]
 
         # Embed the description
-        memory_embedding = self.get_observation_embedding(description)
-        self.memory_embeddings[node_id] = memory_embedding
+        if embedding is None:
+            embedding = self.get_observation_embedding(description)
+        self.memory_embeddings[node_id] = embedding
 
         # Check if this action was done by this agent
         self_is_actor = int(actor_id == self.agent_id)
@@ -145,7 +153,16 @@ class MemoryStream:
                                          node_is_self=self_is_actor)
             
         if memory_type == MemoryType.DIALOGUE.value:
-            pass
+            new_memory = self.add_dialogue(node_id,
+                                           round,
+                                           tick,
+                                           description,
+                                           location,
+                                           success_status,
+                                           memory_importance,
+                                           type=MemoryType.DIALOGUE,
+                                           node_keywords=set(node_kwds),
+                                           node_is_self=self_is_actor)
         if memory_type == MemoryType.REFLECTION.value:
             new_memory = self.add_reflection(node_id,
                                              round,
@@ -187,6 +204,7 @@ class MemoryStream:
         
         # increment the internal count of nodes
         self.num_observations += 1
+        self.version += 1
             
     def add_action(self,
                    node_id,
@@ -214,6 +232,32 @@ class MemoryStream:
                                      node_is_self=node_is_self)
         return new_action
     
+    def add_dialogue(self,
+                     node_id,
+                     round,
+                     tick,
+                     description,
+                     location: str,
+                     success_status: bool,
+                     memory_importance: int,
+                     type: MemoryType,
+                     node_keywords: set,
+                     node_is_self: int) -> None:
+
+        new_dialogue = ObservationNode(node_id,
+                                       node_round=round,
+                                       node_tick=tick,
+                                       node_level=1,
+                                       node_loc=location,
+                                       node_description=description,
+                                       node_success=success_status,
+                                       embedding_key=node_id,
+                                       node_importance=memory_importance,
+                                       node_type=type,
+                                       node_keywords=node_keywords,
+                                       node_is_self=node_is_self)
+        return new_dialogue
+
     def add_reflection(self,
                        node_id,
                        round,
@@ -382,6 +426,23 @@ class MemoryStream:
         
     def get_relationships_summary(self):
         raise NotImplementedError
+
+    def get_cached_retrieval(self, key):
+        """
+        Get the ranked node ids of an earlier retrieval, if the memories haven't changed since.
+        """
+        version, cache = self._retrieval_cache
+        if version != self.version:
+            return None
+        return cache.get(key)
+
+    def cache_retrieval(self, key, ranked_memory_ids):
+        version, cache = self._retrieval_cache
+        if version != self.version:
+            # Replaced rather than cleared, so a concurrent reader keeps a consistent view
+            cache = {}
+            self._retrieval_cache = (self.version, cache)
+        cache[key] = ranked_memory_ids
     
     # ----------- SETTER METHODS -----------
     def set_embedding(self, node_id, new_embedding):
@@ -396,6 +457,7 @@ class MemoryStream:
             return False
         else:
             self.memory_embeddings.update({node_id: new_embedding})
+            self.version += 1
             return True
         
     def set_query_embeddings(self, character, round: int = 0):
@@ -424,6 +486,7 @@ class MemoryStream:
     def set_goal_query(self, goal_embedding):
         try:
             self.query_embeddings.update({"goals": goal_embedding})
+            self.version += 1
         except KeyError as e:
             print("Goal query embedding update failed. Skipping. Caught:\n", e)
     
@@ -437,6 +500,7 @@ class MemoryStream:
             for k, v in kwargs.items():
                 if hasattr(node, k):
                     setattr(node, k, v)
+            self.version += 1
             return True
         
     def update_node_embedding(self, node_id, new_description) -> bool:
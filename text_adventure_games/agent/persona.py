@@ -8,8 +8,80 @@ Description: Defines the Persona of an agent
 # local imports
 from text_adventure_games.gpt.gpt_agent_setup import summarize_agent_facts
 from text_adventure_games.managers.scales import TraitScale
+from text_adventure_games.utils.consts import get_cache_path
+from text_adventure_games.gpt.caching import SqliteCache
+import hashlib
 import json
 import os
+import threading
+
+# Summaries are shared by every game (and every sweep process) using the same cache directory
+SUMMARY_CACHE_FILE = "persona_summaries.sqlite"
+# Summaries stored before the sqlite cache; copied into it when it is first opened
+LEGACY_SUMMARY_CACHE_FILE = "persona_summaries.json"
+_SUMMARY_CACHE = None
+_SUMMARY_CACHE_LOCK = threading.Lock()
+
+
+def get_facts_key(facts) -> str:
+    """
+    Hash a persona's facts so identical facts map to the same summary,
+    regardless of key order.
+    """
+    facts_str = json.dumps(facts, sort_keys=True)
+    return hashlib.sha256(facts_str.encode("utf-8")).hexdigest()
+
+
+def get_summary_cache() -> SqliteCache:
+    """
+    Get the persistent persona summary cache, opening it on first use.
+    """
+    global _SUMMARY_CACHE
+    with _SUMMARY_CACHE_LOCK:
+        if _SUMMARY_CACHE is None:
+            cache_dir = get_cache_path()
+            os.makedirs(cache_dir, exist_ok=True)
+            cache = SqliteCache(os.path.join(cache_dir, SUMMARY_CACHE_FILE))
+            legacy_fp = os.path.join(cache_dir, LEGACY_SUMMARY_CACHE_FILE)
+            if os.path.exists(legacy_fp):
+                try:
+                    with open(legacy_fp, 'r') as f:
+                        legacy_summaries = json.load(f)
+                except (IOError, json.JSONDecodeError):
+                    legacy_summaries = {}
+                for facts_key, summary in legacy_summaries.items():
+                    if cache.get(facts_key) is None:
+                        cache.set(facts_key, summary)
+            _SUMMARY_CACHE = cache
+    return _SUMMARY_CACHE
+
+
+def get_or_create_fact_summary(facts) -> str:
+    """
+    Get the summary of these facts from the persistent summary cache,
+    or summarize them with GPT and cache the result.
+
+    Args:
+        facts (dict): the persona's facts
+
+    Returns:
+        str: a summary of the facts
+    """
+    cache = get_summary_cache()
+    facts_key = get_facts_key(facts)
+    summary = cache.get(facts_key)
+    if summary is not None:
+        return summary
+
+    summary = summarize_agent_facts(str(facts))
+    if not summary or not isinstance(summary, str):
+        # Don't cache a failed call
+        return summary
+
+    # Each summary is its own row, so games writing at the same time don't overwrite each other
+    cache.set(facts_key, summary)
+    return summary
+
 
 class Persona():
     """
@@ -23,11 +95,12 @@ class Persona():
     Facts (dict) these include the agent's name, age, occupation, likes, dislikes, and home city
     summary: str
     """
-    def __init__(self, facts):
+    def __init__(self, facts, summary=None):
         # Agent traits
         self.facts = facts
         self.traits = {}
-        self.summary = summarize_agent_facts(str(self.facts))
+        # Only summarize the facts if no stored summary was supplied
+        self.summary = summary if summary else get_or_create_fact_summary(self.facts)
         self.description = f'A {self.facts["Age"]} year old {self.facts["Occupation"]} named {self.facts["Name"]}'
         self.game_theory_strategy = "nothing specific yet"
         self.strategy_in_effect = False
@@ -106,12 +179,11 @@ class Persona():
         with open(filename, 'r') as f:
             persona_dict = json.load(f)
 
-        # Create a new Persona instance with the loaded data
-        persona = cls(persona_dict['facts'])
+        # Create a new Persona instance with the loaded data, reusing the stored summary
+        persona = cls(persona_dict['facts'], summary=persona_dict.get('fact_summary'))
         # persona.traits = {tname: {'score': trait['score'], 'adjective': trait['adjective']} for tname, trait in persona_dict['traits'].items()}
         # persona.traits = {tname: TraitScale(**trait) for tname, trait in persona_dict['traits'].items()}
         persona.archetype_base = persona_dict['archetype_base']
-        persona.summary = persona_dict['fact_summary']
         persona.description = persona_dict['description']
         persona.strategy_in_effect = persona_dict['strategy_in_effect']
         persona.game_theory_strategy = persona_dict['game_theory_strategy']
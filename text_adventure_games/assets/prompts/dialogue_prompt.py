@@ -26,3 +26,21 @@ Dialogue history:
 
 What do you say next? Alternatively, do you leave the conversation?
 """
+
+gpt_dialogue_memory_system_prompt = """
+You record the memories that a conversation leaves its participants with.
+The participants were: {participants}.
+
+Given the dialogue, return a JSON object with these keys:
+"summary": one or two sentences in the third person saying who talked, what about, and what was agreed or revealed.
+"importance": an integer from 1 to 10 rating how much the conversation matters to the participants' chances of winning the game,
+where 1 is small talk and 10 is something like a plan to vote someone out.
+"facts": an object with each participant's name as a key and, as its value, a list of at most {max_facts} short statements of
+the things that participant learned or committed to in the conversation, written from their own point of view.
+"""
+
+gpt_dialogue_memory_user_prompt = """
+Dialogue:
+
+{dialogue_history}
+"""
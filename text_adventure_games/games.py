@@ -1,10 +1,13 @@
 import json
 import inspect
+import contextvars
+import random
 from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import os
 from typing import TYPE_CHECKING, Literal
+import numpy as np
 from numpy.random import permutation
-import dill as pickle
 
 from .agent.memory_stream import MemoryType
 from .things import Location, Character
@@ -13,8 +16,12 @@ from .utils.custom_logging import logger
 from .agent.agent_cognition.vote import VotingSession, JuryVotingSession
 from .assets.prompts import vote_prompt, world_info_prompt
 from .utils.consts import get_output_logs_path
-from .utils.general import create_dirs, get_logger_extras
-from .gpt.gpt_helpers import GptCallHandler
+from .utils.general import create_dirs, get_logger_extras, map_concurrently
+from .utils.event_log import EventLog
+from .utils.simulation_data import (VOTING_HISTORY, CHARACTER_GOALS, CHARACTER_GOAL_SCORES, 
+                                    append_records, get_simulation_data_path)
+from .gpt.gpt_helpers import GptCallHandler, get_token_count_cache_stats
+from .gpt.scheduler import get_request_scheduler, set_current_game
 
 class Game:
     """
@@ -48,6 +55,10 @@ class Game:
         self.game_over = False
         self.game_over_description = None
 
+        # Incremented by every event that changes what agents are told about the world
+        # (actions, movements, goals, exiles); cached prompt context is keyed on it
+        self.state_version = 0
+
         # Add player to game and put them on starting point
         self.characters = {}
         self.add_character(player)
@@ -97,6 +108,9 @@ class Game:
     def set_parser(self, parser: parsing.Parser):
         self.parser = parser
 
+    def bump_state_version(self):
+        self.state_version += 1
+
     def game_loop(self):
         """
         A simple loop that starts the game, loops over commands from the user,
@@ -138,54 +152,61 @@ class Game:
         """
         self.characters[character.name] = character
 
-    def describe(self) -> str:
+    def describe(self, character: Character = None) -> str:
         """
         Describe the current game state by first describing the current
         location, then listing any exits, and then describing any objects
         in the current location.
+
+        Args:
+            character (Character, optional): whose view to describe. Defaults to the player.
         """
-        description = self.describe_current_location() + "\n"
-        description += self.describe_exits() + "\n"
-        description += self.describe_items() + "\n"
-        description += self.describe_characters() + "\n"
-        description += self.describe_inventory() 
+        character = character or self.player
+        description = self.describe_current_location(character) + "\n"
+        description += self.describe_exits(character) + "\n"
+        description += self.describe_items(character) + "\n"
+        description += self.describe_characters(character) + "\n"
+        description += self.describe_inventory(character) 
         # print(f"total description: {description}")
         return description
 
-    def describe_current_location(self) -> str:
+    def describe_current_location(self, character: Character = None) -> str:
         """
         Describe the current location by printing its description field.
         """
-        loc_description = f"location: {self.player.name} is at {self.player.location.description}"
+        character = character or self.player
+        loc_description = f"location: {character.name} is at {character.location.description}"
         # print(f"location description: {loc_description}")
         return loc_description
 
-    def describe_exits(self) -> str:
+    def describe_exits(self, character: Character = None) -> str:
         """
         List the directions that the player can take to exit from the current
         location.
         """
+        character = character or self.player
         exits = []
-        for direction in self.player.location.connections.keys():
-            location = self.player.location.connections[direction]
+        for direction in character.location.connections.keys():
+            location = character.location.connections[direction]
             exits.append(direction.capitalize() + " to " + location.name)
         description = "exits: "
         if len(exits) > 0:
-            description += f"From {self.player.location.name} {self.player.name} could go: "
+            description += f"From {character.location.name} {character.name} could go: "
             for exit in exits:
                 description += exit + ", "
         # print(f"Exit description: {description}")
         return description
 
-    def describe_items(self) -> str:
+    def describe_items(self, character: Character = None) -> str:
         """
         Describe what items are in the current location.
         """
+        character = character or self.player
         description = "items: "
-        if len(self.player.location.items) > 0:
-            description += f"{self.player.name} sees:"
-            for item_name in self.player.location.items:
-                item = self.player.location.items[item_name]
+        if len(character.location.items) > 0:
+            description += f"{character.name} sees:"
+            for item_name in character.location.items:
+                item = character.location.items[item_name]
                 description += item.description 
                 if self.give_hints:
                     special_commands = item.get_command_hints()
@@ -197,34 +218,36 @@ class Game:
                     description += "; "
         return description
 
-    def describe_characters(self) -> str:
+    def describe_characters(self, character: Character = None) -> str:
         """
         Describe what characters are in the current location.
         """
+        character = character or self.player
         description = "characters: "
-        if len(self.player.location.characters) > 1:
-            description += f"{self.player.name} sees characters: "
-            for character_name in self.player.location.characters:
-                if character_name == self.player.name:
+        if len(character.location.characters) > 1:
+            description += f"{character.name} sees characters: "
+            for character_name in character.location.characters:
+                if character_name == character.name:
                     continue
-                character = self.player.location.characters[character_name]
+                other = character.location.characters[character_name]
                 # TODO: may want to change this to just the character name for ease of parsing later
-                description += character.name + ", "
+                description += other.name + ", "
         return description
 
-    def describe_inventory(self) -> str:
+    def describe_inventory(self, character: Character = None) -> str:
         """
         Describes the player's inventory.
         """
+        character = character or self.player
         inventory_description = "inventory: "
-        if len(self.player.inventory) == 0:
-            inventory_description += f"{self.player.name} has nothing in inventory."
+        if len(character.inventory) == 0:
+            inventory_description += f"{character.name} has nothing in inventory."
             # self.ok(empty_inventory, [], "Describe the player's inventory.")
         else:
             # descriptions = []  # JD logical issue?
-            inventory_description += f"In {self.player.name} inventory, {self.player.name} has: "
-            for item_name in self.player.inventory:
-                item = self.player.inventory[item_name]
+            inventory_description += f"In {character.name} inventory, {character.name} has: "
+            for item_name in character.inventory:
+                item = character.inventory[item_name]
                 d = "{item_description}, "
                 inventory_description += d.format(
                     # item=item_name, 
@@ -460,6 +483,18 @@ class Game:
 
 # Override methods or implement a new class?
 class SurvivorGame(Game):
+    # "sequential": each agent deliberates and acts before the next one starts.
+    # "two_phase": all agents deliberate concurrently against the state at the start of the tick,
+    #              then their commands are applied one at a time in the turn order.
+    # "pipelined": sequential, but the next agent's turn is prepared while the current agent's
+    #              GPT call is in flight, and thrown away if the current action changes its scene.
+    SCHEDULERS = ("sequential", "two_phase", "pipelined")
+    # "round": save a checkpoint when a round ends; a resumed game replays the round it crashed in.
+    # "tick": save one after every tick as well, so at most one tick is lost, at the cost of
+    #         pickling the whole game (every agent's memories included) each tick.
+    CHECKPOINT_FREQUENCIES = ("round", "tick")
+    CHECKPOINT_FILE = "checkpoint.pkl"
+
     def __init__(self, 
                  start_at: Location, 
                  player: Character, 
@@ -469,7 +504,8 @@ class SurvivorGame(Game):
                  num_finalists: int = 2,
                  experiment_name: str = "exp1",
                  experiment_id: int = 1,
-                 end_state_check: Literal["on_round", "on_tick", "on_action"] = "on_round"):
+                 end_state_check: Literal["on_round", "on_tick", "on_action"] = "on_round",
+                 max_workers: int = 8):
         super().__init__(start_at, player, characters, custom_actions)
         game_logger = logger.CustomLogger(experiment_name=experiment_name, sim_id=experiment_id)
         self.logger = game_logger.get_logger()
@@ -485,6 +521,17 @@ class SurvivorGame(Game):
         self.total_ticks = 0
         self.num_contestants = len(self.characters)
         self.end_state_check = end_state_check
+        # Upper bound on the number of agents making GPT calls at the same time
+        self.max_workers = max_workers
+        self.scheduler = "sequential"
+        self.checkpoint_every = "round"
+        # How prefetched perceptions were used by the pipelined scheduler. Each discarded
+        # observation is a summary and an importance score that GPT was paid for and not used.
+        self.prefetch_stats = {"used": 0, "discarded": 0, "discarded_observations": 0}
+        # The tick a resumed game picks up from
+        self.resume_tick = 0
+        # ((round, tick, state version), {character id: world info}) for the current state
+        self._world_info_cache = (None, {})
         
         # Store end state variables: 
         # Exiled players in jury cast the final vote
@@ -493,24 +540,86 @@ class SurvivorGame(Game):
         self.num_finalists = num_finalists
         self.winner_declared = False
 
+        # Append-only record of everything that changes in the game; see utils/event_log.py
+        log_dir = os.path.join(get_output_logs_path(), f"logs/{self.experiment_name}-{self.experiment_id}/")
+        self.event_log = EventLog(os.path.join(log_dir, f"events_{self.experiment_name}-{self.experiment_id}.jsonl"))
+        # Rounds between snapshots derived from the event log
+        self.snapshot_every = 5
+        # How many of each character's memories have been written to the event log
+        self._logged_memory_counts = {}
+        # The first round save_simulation_data hasn't written yet
+        self._saved_round = 0
+
         # Log the starting loctions of the characters
         self._log_starting_locs()
+        self._record_start_event()
 
     def update_world_info(self):
+        self.world_info = self.get_world_info(self.player)
+
+    def set_scheduler(self, scheduler: str):
+        if scheduler not in self.SCHEDULERS:
+            raise ValueError(f"Unknown scheduler '{scheduler}'. Valid schedulers are: {self.SCHEDULERS}")
+        self.scheduler = scheduler
+
+    def set_checkpoint_frequency(self, checkpoint_every: str):
+        if checkpoint_every not in self.CHECKPOINT_FREQUENCIES:
+            raise ValueError(f"Unknown checkpoint frequency '{checkpoint_every}'. "
+                             f"Valid frequencies are: {self.CHECKPOINT_FREQUENCIES}")
+        self.checkpoint_every = checkpoint_every
+
+    def get_world_info(self, character=None):
+        """
+        Describe the state of the world from the perspective of a character.
+        Unlike update_world_info, this doesn't depend on whose turn it is,
+        so it can be used while several agents are deliberating at once.
+        The result is cached until the tick or the state version changes.
+
+        Args:
+            character (Character, optional): the viewing character. Defaults to the current player.
+
+        Returns:
+            str: the world info
+        """
+        character = character or self.player
+        stamp = (self.round, self.tick, self.state_version)
+        cached_stamp, cache = self._world_info_cache
+        if cached_stamp != stamp:
+            # Replaced rather than cleared, so threads reading the old cache aren't affected
+            cache = {}
+            self._world_info_cache = (stamp, cache)
+        if character.id in cache:
+            return cache[character.id]
+
         params = {"contestant_count": len(self.characters),
                   "contestant_names_locs": ", ".join([f"{c.name} who is at {c.location.name}" 
                                                       for c in self.characters.values() 
-                                                      if c.id != self.player.id]),
+                                                      if c.id != character.id]),
                   "n_finalists": self.num_finalists,
                   "rounds_until_finals": len(self.characters) - self.num_finalists,
                   "turns_left_this_round": self.max_ticks_per_round - (self.tick - 1)}
-        self.world_info = world_info_prompt.world_info.format(**params)
+        world_info = world_info_prompt.world_info.format(**params)
+        cache[character.id] = world_info
+        return world_info
     
     # Override game loop 
     def game_loop(self):
-
+        # Requests made during this game are scheduled fairly against other games in the process
+        set_current_game(f"{self.experiment_name}-{self.experiment_id}")
+
+        try:
+            self._play_rounds()
+        finally:
+            # However the game ends, record the memories of the last (possibly partial) tick
+            # and get every buffered event onto disk
+            self._record_new_memories()
+            self.event_log.close()
+
+    def _play_rounds(self):
         while True:
-            for tick in range(self.max_ticks_per_round):
+            # Resumed games pick up where the checkpoint left off; every other round starts at 0
+            start_tick, self.resume_tick = self.resume_tick, 0
+            for tick in range(start_tick, self.max_ticks_per_round):
                 self.tick = tick
 
                 # Confirming Round increments
@@ -525,17 +634,38 @@ class SurvivorGame(Game):
 
                 self.reset_character_dialogue()
 
-                for character in permutation(list(self.characters.values())):  # random permuted ordering, not based on character initiative
-                    print(f"It is: {character.name}'s turn")
-                    self.turn_handler(character)
+                # random permuted ordering, not based on character initiative
+                # Reflecting agents don't act; they all reflect together in the reflection_handler
+                turn_order = [c for c in permutation(list(self.characters.values())) if not c.should_reflect(self)]
+                if self.scheduler == "pipelined":
+                    if self.pipelined_turn_handler(turn_order):
+                        return
+                else:
+                    if self.scheduler == "two_phase":
+                        # Everyone deliberates at once; commands are then applied in the turn order
+                        commands = self.deliberation_handler(turn_order)
+                    else:
+                        commands = [None] * len(turn_order)
 
-                    # EXPLORATION: check if game ended
-                    if self.end_state_check == "on_action" and self.is_game_over():
-                        return 
+                    for character, command in zip(turn_order, commands):
+                        print(f"It is: {character.name}'s turn")
+                        self.turn_handler(character, command=command)
+
+                        # EXPLORATION: check if game ended
+                        if self.end_state_check == "on_action" and self.is_game_over():
+                            return 
+
+                # At the end of the round, agents reflect and evaluate their goals
+                self.reflection_handler()
+                # Turns record their own memories; this picks up the reflections
+                self._record_new_memories()
 
                 # Update the total ticks that have occurred in the game.
                 self.total_ticks += 1
 
+                if self.checkpoint_every == "tick":
+                    self.save_checkpoint(next_tick=tick + 1)
+
                 # EXPLORATION: check if game ended
                 if self.end_state_check == "on_tick" and self.is_game_over():
                     break
@@ -551,7 +681,86 @@ class SurvivorGame(Game):
             # save game results so far
             self.save_simulation_data()
             self._log_gpt_call_data()
-            self.save_game("test_file.json")
+            self.save_checkpoint()
+            if self.round % self.snapshot_every == 0:
+                self.event_log.write_snapshot()
+
+    def get_checkpoint_path(self):
+        return os.path.join(get_output_logs_path(), 
+                            f"logs/{self.experiment_name}-{self.experiment_id}/", 
+                            self.CHECKPOINT_FILE)
+
+    def save_checkpoint(self, next_tick: int = 0, path=None):
+        """
+        Save the complete state of the simulation so that it can be resumed with load_checkpoint.
+        Unlike save_game, this keeps everything: the world, characters with their memories, goals
+        and impressions, the parser, voting history and jury, random number generator states and
+        the GPT call counters. The file is replaced atomically, so a crash while saving leaves the
+        previous checkpoint intact.
+
+        Args:
+            next_tick (int, optional): the tick of the current round to resume from. Defaults to 0,
+                                       i.e. the start of the round in self.round.
+            path (str, optional): where to save. Defaults to the experiment's log directory.
+        """
+        import dill
+
+        path = path or self.get_checkpoint_path()
+        create_dirs(path)
+        self.resume_tick = next_tick
+        checkpoint = {"game": self,
+                      "random_state": random.getstate(),
+                      "numpy_random_state": np.random.get_state(),
+                      "counters": self._get_counters()}
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                dill.dump(checkpoint, f, protocol=dill.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        finally:
+            self.resume_tick = 0
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        """
+        Restore a game saved by save_checkpoint. Calling game_loop on the result carries on
+        from the tick after the checkpoint, logging to the same experiment directory.
+
+        Args:
+            path (str): path to the checkpoint file
+
+        Returns:
+            SurvivorGame: the restored game
+        """
+        import dill
+
+        with open(path, "rb") as f:
+            checkpoint = dill.load(f)
+        game = checkpoint["game"]
+        random.setstate(checkpoint["random_state"])
+        np.random.set_state(checkpoint["numpy_random_state"])
+        game._set_counters(checkpoint["counters"])
+        # Events written after the checkpoint will happen again
+        game.event_log.rollback()
+
+        game_logger = logger.CustomLogger(experiment_name=game.experiment_name, 
+                                          sim_id=game.experiment_id, 
+                                          resume=True)
+        game.logger = game_logger.get_logger()
+        return game
+
+    def _get_counters(self):
+        counters = {"calls_made": GptCallHandler.get_calls_count(),
+                    "tokens_processed": GptCallHandler.get_tokens_processed()}
+        if hasattr(self.parser, "get_resolution_stats"):
+            counters["parser_resolutions"] = self.parser.get_resolution_stats()
+        return counters
+
+    def _set_counters(self, counters):
+        GptCallHandler.calls_made = counters["calls_made"]
+        GptCallHandler.tokens_processed = counters["tokens_processed"]
+        if "parser_resolutions" in counters and hasattr(self.parser, "set_resolution_stats"):
+            self.parser.set_resolution_stats(counters["parser_resolutions"])
 
     def reset_character_dialogue(self):
         for c in self.characters.values():
@@ -560,23 +769,143 @@ class SurvivorGame(Game):
     def goal_setting_handler(self):
         # if it is the beginning of a round, everyone should make goals
         if self.tick == 0:
-            for character in self.characters.values():
-                # Update the world info with new tick, contestant counts, and non-player contestant names
+            # Update the world info with new tick, contestant counts, and non-player contestant names
+            self.update_world_info()
+            # Goal prompts only read the game state, so draft everyone's goals at once,
+            # then record them in a fixed character order
+            characters = list(self.characters.values())
+            drafts = map_concurrently(lambda c: c.draft_goals(self), characters, max_workers=self.max_workers)
+            for character, draft in zip(characters, drafts):
+                character.commit_goals(self, draft)
+
+    def reflection_handler(self):
+        """
+        End of round phase in which every reflecting agent reflects and scores its goals.
+        Agents only touch their own memory here, so this runs concurrently;
+        goal scores are then recorded in a fixed character order.
+        """
+        reflecting = [c for c in self.characters.values() if c.should_reflect(self)]
+        if not reflecting:
+            return
+        scores = map_concurrently(lambda c: c.reflect_and_evaluate(self), reflecting, max_workers=self.max_workers)
+        for character, character_scores in zip(reflecting, scores):
+            character.commit_goal_scores(self, character_scores)
+
+    def deliberation_handler(self, characters):
+        """
+        First phase of the two-phase scheduler: every character perceives, updates impressions,
+        retrieves memories and picks a command concurrently, against the state of the world at
+        the start of the tick. Nothing is enacted here; each character only writes to its own
+        memory and impressions.
+
+        Args:
+            characters (list[Character]): the characters taking a turn this tick
+
+        Returns:
+            list: the chosen command for each character, in the same order
+        """
+        return map_concurrently(lambda c: c.engage(self), characters, max_workers=self.max_workers)
+
+    def pipelined_turn_handler(self, turn_order) -> bool:
+        """
+        Take turns in order, like the sequential scheduler, but draft the next character's
+        perceptions (the GPT calls that summarize and score each new observation) on a background
+        thread while the current character waits on GPT for its action.
+
+        Drafting doesn't change any state, and it finishes before the current action is enacted,
+        so the world is never read and written at the same time. The draft is only stored if the
+        action left the next character's surroundings as they were; otherwise it is thrown away
+        and the character perceives from scratch, so the GPT calls of a discarded draft are wasted
+        (see prefetch_stats). Everything else (impressions, retrieval and prompts) happens on the
+        character's own turn, so turns come out as in the sequential scheduler. Overlapping only
+        perception is deliberate: impressions are written as they are made, and the prompts depend
+        on them and on the memories the current action adds, so building those ahead of time would
+        either leave stale writes behind or produce prompts that have to be thrown away.
+
+        Args:
+            turn_order (list[Character]): the characters taking a turn this tick
+
+        Returns:
+            bool: True if the game ended during the tick
+        """
+        prefetch = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for i, character in enumerate(turn_order):
+                print(f"It is: {character.name}'s turn")
+                self.player = character
                 self.update_world_info()
-                character.generate_goals(self)
 
-    def turn_handler(self, character):
+                perceptions = self._collect_prefetched_perceptions(character, prefetch)
+                act = character.prepare_turn(self, perceptions=perceptions)
+
+                # Start on the next character while this one's GPT call is in flight
+                prefetch = None
+                if i + 1 < len(turn_order):
+                    next_character = turn_order[i + 1]
+                    future = executor.submit(contextvars.copy_context().run, next_character.draft_perceptions, self)
+                    prefetch = (next_character, future)
+
+                command = act.act()
+
+                # Let the prefetch finish before this character's action changes the world
+                if prefetch:
+                    prefetch[1].exception()
+                self.turn_handler(character, command=command)
+
+                # EXPLORATION: check if game ended
+                if self.end_state_check == "on_action" and self.is_game_over():
+                    return True
+        return False
+
+    def _collect_prefetched_perceptions(self, character, prefetch):
+        """
+        Get the perceptions drafted for this character, if they are still what it would perceive.
+
+        Returns:
+            tuple | None: the drafted perceptions, or None if the character needs to perceive from scratch
+        """
+        if prefetch is None or prefetch[0] is not character:
+            return None
+        try:
+            perceptions = prefetch[1].result()
+        except Exception as e:
+            print(f"Discarding prefetched perceptions for {character.name}: {e}")
+            self.prefetch_stats["discarded"] += 1
+            return None
+
+        if not character.perceptions_match(self, perceptions):
+            # The last action changed this character's surroundings
+            self.prefetch_stats["discarded"] += 1
+            self.prefetch_stats["discarded_observations"] += len(perceptions[2])
+            return None
+        self.prefetch_stats["used"] += 1
+        return perceptions
+
+    def turn_handler(self, character, command=None):
+        """
+        Have a character take their turn.
+
+        Args:
+            character (Character): the character taking a turn
+            command (str, optional): a command the character already chose during a
+                                     deliberation phase. It is tried first; if it fails
+                                     against the current world, the character deliberates again.
+        """
         # set the current player to the game's "player" for description purposes
         self.player = character
         
         # Update the world info with new tick, contestant counts, and non-player contestant names
         self.update_world_info()
 
+        world_before = self._get_world_positions()
         success = False
         # Only move on to the next character when current takes a successful action
         # But agent only gets three tries
-        for _ in range(3):
-            if character.id == self.original_player_id:
+        for attempt in range(3):
+            if attempt == 0 and command is not None:
+                # Others may have moved since this command was chosen
+                character.chars_in_view = character.get_characters_in_view(self)
+            elif character.id == self.original_player_id:
                 # TODO: How do we integrate the ability for a human player to engage?
                 command = character.engage(self)
             else:
@@ -589,7 +918,16 @@ class SurvivorGame(Game):
                 break
             if success:
                 self._log_action(character, command)
+                self.event_log.append("action", self.round, self.tick,
+                                      character=character.name,
+                                      command=command,
+                                      location=world_before[0].get(character.name))
                 break
+        if self._record_world_changes(world_before) or success:
+            self.bump_state_version()
+        # Memories made during the turn (by this character and anyone who saw or heard it)
+        # go into the log in the order they happened
+        self._record_new_memories()
 
     def is_game_over(self) -> bool:
         if self.game_over:
@@ -626,11 +964,13 @@ class SurvivorGame(Game):
         # If we've reached the end of a round, run a voting session to exile someone.
         elif self.tick == (self.max_ticks_per_round - 1):
             self.run_voting_session()
+        self._record_new_memories()
 
     def update_voting_history(self, session: "VotingSession"):
         for char in self.characters.values():
             record = session.record_vote(char)
             self.voting_history[self.round].update({char.name: record})
+            self.event_log.append("vote", self.round, self.tick, voter=char.name, record=record)
 
     def run_voting_session(self):
         self.vote_session = VotingSession(game=self, 
@@ -658,6 +998,31 @@ class SurvivorGame(Game):
         message = f"Current GPT tokens count: {GptCallHandler.get_tokens_processed()}"
         self.logger.debug(msg=message, extra=extras)
 
+        if hasattr(self.parser, "get_resolution_stats"):
+            stats = self.parser.get_resolution_stats()
+            extras["type"] = "Resolutions"
+            message = "Parser resolutions - fast path: {fast_path}, cache: {cache}, GPT: {gpt}".format(**stats)
+            self.logger.debug(msg=message, extra=extras)
+
+        extras["type"] = "TokenCounts"
+        message = "Token count cache - hits: {hits}, misses: {misses}, size: {size}".format(**get_token_count_cache_stats())
+        self.logger.debug(msg=message, extra=extras)
+
+        extras["type"] = "Scheduler"
+        stats = get_request_scheduler().get_stats()
+        message = f"Request scheduler - max queue depth: {stats['max_queue_depth']}, waits by priority: {stats['wait']}"
+        self.logger.debug(msg=message, extra=extras)
+
+        extras["type"] = "Streaming"
+        message = "Streamed GPT calls - requests: {requests}, early stops: {early_stops}, mean TTFT: {mean_ttft}s, max TTFT: {max_ttft}s".format(**GptCallHandler.get_stream_stats())
+        self.logger.debug(msg=message, extra=extras)
+
+        if self.scheduler == "pipelined":
+            extras["type"] = "Prefetch"
+            message = ("Prefetched perceptions - used: {used}, discarded: {discarded}, "
+                       "summarized observations discarded: {discarded_observations}").format(**self.prefetch_stats)
+            self.logger.debug(msg=message, extra=extras)
+
     def _log_action(self, character, message):
         extras = get_logger_extras(self, character)
         extras["type"] = "Act"
@@ -668,6 +1033,7 @@ class SurvivorGame(Game):
         for character in list(self.characters.values()):
             # Pass appropriate memories to each agent
             if character == exiled_agent:
+                self.event_log.append("exile", self.round, self.tick, character=character.name)
                 self.add_exile_memory(self.characters[character.name],
                                       exiled_name=exiled_agent.name, 
                                       to_jury=True)
@@ -677,6 +1043,7 @@ class SurvivorGame(Game):
                 character.location.remove_character(character)
                 character.location = None
                 _ = self.characters.pop(character.name)
+                self.bump_state_version()
 
             else:
                 self.add_exile_memory(self.characters[character.name],
@@ -739,6 +1106,7 @@ class SurvivorGame(Game):
         self.update_voting_history(session=self.final_vote)
         self.winner = winner
         self.winner_declared = True
+        self.event_log.append("winner", self.round, self.tick, character=winner.name)
         self._log_finalists(winner=winner)
         self._add_winner_memory()
 
@@ -779,37 +1147,99 @@ class SurvivorGame(Game):
             message = f"Starting point: {c.location.name}"
             self.logger.debug(msg=message, extra=extras)
 
+    def _get_world_positions(self):
+        """
+        Where every character and item currently is.
+
+        Returns:
+            tuple[dict, dict]: character name -> location name, and
+                               item id -> (item name, holder), holders as in utils/event_log.py
+        """
+        locations = {name: c.location.name if c.location else None for name, c in self.characters.items()}
+        items = {}
+        for location in self.locations.values():
+            for item in location.items.values():
+                items[str(item.id)] = (item.name, f"location:{location.name}")
+        for c in self.characters.values():
+            for item in c.inventory.values():
+                items[str(item.id)] = (item.name, f"character:{c.name}")
+        return locations, items
+
+    def _record_start_event(self):
+        locations, items = self._get_world_positions()
+        self.event_log.append("start", self.round, self.tick,
+                              characters=locations,
+                              items={item_id: {"name": name, "holder": holder} 
+                                     for item_id, (name, holder) in items.items()})
+
+    def _record_world_changes(self, before) -> bool:
+        """
+        Write the movements and item transfers since `before` (from _get_world_positions) to the event log.
+
+        Returns:
+            bool: whether anything moved
+        """
+        old_locations, old_items = before
+        new_locations, new_items = self._get_world_positions()
+        changed = False
+        for name, location in new_locations.items():
+            if old_locations.get(name) != location:
+                changed = True
+                self.event_log.append("move", self.round, self.tick,
+                                      character=name,
+                                      **{"from": old_locations.get(name), "to": location})
+        for item_id in sorted(old_items.keys() | new_items.keys()):
+            old, new = old_items.get(item_id), new_items.get(item_id)
+            if old != new:
+                changed = True
+                self.event_log.append("item_transfer", self.round, self.tick,
+                                      item_id=item_id,
+                                      item=(new or old)[0],
+                                      **{"from": old[1] if old else None, "to": new[1] if new else None})
+        return changed
+
+    def _record_new_memories(self):
+        """
+        Write the memories each character has made since the last call to the event log.
+        """
+        everyone = list(self.characters.items()) + list(self.jury.items())
+        for name, character in everyone:
+            start = self._logged_memory_counts.get(name, 0)
+            for node in character.memory.observations[start:]:
+                self.event_log.append("memory", self.round, self.tick,
+                                      character=name,
+                                      node_id=node.node_id,
+                                      node_round=node.node_round,
+                                      node_tick=node.node_tick,
+                                      description=node.node_description,
+                                      memory_type=getattr(node.node_type, "name", node.node_type),
+                                      importance=node.node_importance,
+                                      location=node.node_loc)
+            self._logged_memory_counts[name] = character.memory.num_observations
+
     def save_simulation_data(self):
-        output_path = get_output_logs_path()
-        experiment_dir = f"logs/{self.experiment_name}-{self.experiment_id}/"
-        fp = os.path.join(output_path, experiment_dir, f"voting_history_{self.experiment_name}-{self.experiment_id}.json")
-        create_dirs(fp)
-
-        # Save voting history
-        with open(fp, mode="w") as f:
-            json.dump(self.voting_history, f, indent=4)
-
-        # Save goal scores and goals
-        fp = os.path.join(output_path, experiment_dir, f"character_goals_{self.experiment_name}-{self.experiment_id}.json")
-        create_dirs(fp)
-        
-        with open(fp, mode="w") as f:
-            output = {}
-            for name, c in self.characters.items():
-                output[name] = c.get_goals() or "None"
-
-            for name, c in self.jury.items():
-                output[name] = c.get_goals() or "None"
-            json.dump(output, f, indent=4)
-
-        fp = os.path.join(output_path, experiment_dir, f"character_goal_scores_{self.experiment_name}-{self.experiment_id}.json")
-        create_dirs(fp)
-
-        with open(fp, mode="w") as f:
-            output = {}
-            for name, c in self.characters.items():
-                output[name] = c.get_goal_scores() or "None"
-
-            for name, c in self.jury.items():
-                output[name] = c.get_goal_scores() or "None"
-            json.dump(output, f, indent=4)
+        """
+        Append votes, goals and goal scores to JSONL files in the experiment's log directory, one record
+        per (round, character); see utils/simulation_data.py. Rounds before the last save were already
+        written, so only the rounds since then are. The current round is written too, and again on the
+        next save if it was still in progress.
+        """
+        rounds = range(self._saved_round, self.round + 1)
+        everyone = list(self.characters.items()) + list(self.jury.items())
+
+        votes = [(r, name, record) 
+                 for r in rounds 
+                 for name, record in self.voting_history.get(r, {}).items()]
+        goals, goal_scores = [], []
+        for r in rounds:
+            for name, c in everyone:
+                for records, history in [(goals, c.get_goals()), (goal_scores, c.get_goal_scores())]:
+                    # Characters without any goals get a null record, so they still show up as "None"
+                    if not history:
+                        records.append((r, name, None))
+                    elif r in history:
+                        records.append((r, name, history[r]))
+
+        for kind, records in [(VOTING_HISTORY, votes), (CHARACTER_GOALS, goals), (CHARACTER_GOAL_SCORES, goal_scores)]:
+            append_records(get_simulation_data_path(kind, self.experiment_name, self.experiment_id), records)
+        self._saved_round = self.round
@@ -0,0 +1,260 @@
+"""
+Author: Samuel Thudium (sam.thudium1@gmail.com)
+
+File: gpt/caching.py
+Description: on-disk caches and a rate limiter that can be shared by several game processes,
+             e.g. the workers of run_sweep.py. Everything is stored in sqlite, which handles
+             locking between processes for us.
+
+             Nothing here is active by default; call enable_shared_resources in each process
+             that should use them.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .scheduler import DEFAULT_DEADLINES, RequestPriority
+
+COMPLETION_CACHE_FILE = "completions.sqlite"
+EMBEDDING_CACHE_FILE = "embeddings.sqlite"
+RATE_LIMIT_FILE = "rate_limit.sqlite"
+# Seconds without a heartbeat after which a waiting request is assumed to be gone
+WAITER_TIMEOUT = 30
+# Seconds a request waits before checking again whether it is next in line for a free token
+WAITER_POLL_INTERVAL = 0.05
+
+_COMPLETION_CACHE = None
+_EMBEDDING_CACHE = None
+_RATE_LIMITER = None
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+    # WAL lets readers in other processes keep going while one process writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def make_key(*parts) -> str:
+    """
+    Hash any JSON serializable parts into a cache key.
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SqliteCache:
+    """
+    A key-value store of JSON values in a sqlite file.
+    Safe to use from several threads and several processes.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = _connect(db_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                               (key, json.dumps(value)))
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class CompletionCache(SqliteCache):
+    """
+    Chat completions keyed on the messages and the request parameters.
+    Only deterministic (temperature 0) calls are cached, unless cache_sampled is set;
+    see GptCallHandler.generate.
+    """
+
+    def __init__(self, db_path, cache_sampled=False):
+        super().__init__(db_path)
+        self.cache_sampled = cache_sampled
+
+    def make_key(self, messages, request_params):
+        return make_key(messages, request_params)
+
+
+class EmbeddingCache(SqliteCache):
+    """
+    Embedding vectors keyed on the text and the embedding model.
+    Values are stored as lists; callers convert them back to arrays.
+    """
+
+    def make_key(self, text, model):
+        return make_key(text, model)
+
+
+class RateLimiter:
+    """
+    A token bucket shared by every process that opens the same sqlite file.
+    Each request takes one token; tokens refill at requests_per_minute / 60 per second,
+    up to a burst of `burst` requests.
+
+    This is where requests from all of the games in a sweep actually queue up, so waiting
+    requests are let through by priority class (see gpt.scheduler.RequestPriority), then
+    first come, first served, across all processes. A request that has waited longer than
+    its deadline is treated as critical.
+    """
+
+    def __init__(self, db_path, requests_per_minute, burst=None):
+        self.db_path = db_path
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1, requests_per_minute // 10)
+        self._lock = threading.Lock()
+        self._conn = _connect(db_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY, tokens REAL, updated REAL)")
+        self._conn.execute("INSERT OR IGNORE INTO bucket (id, tokens, updated) VALUES (0, ?, ?)",
+                           (self.capacity, time.time()))
+        # Requests waiting for a token. Each waiter refreshes its heartbeat while it waits,
+        # so rows left behind by a crashed process are eventually dropped.
+        self._conn.execute("CREATE TABLE IF NOT EXISTS waiting "
+                           "(id INTEGER PRIMARY KEY AUTOINCREMENT, priority INTEGER, deadline REAL, "
+                           "enqueued REAL, heartbeat REAL)")
+        self.total_wait = 0.0
+        self.wait_by_priority = {p.name.lower(): 0.0 for p in RequestPriority}
+
+    def acquire(self, priority=RequestPriority.NORMAL, deadline=None):
+        """
+        Block until a request may be made.
+
+        Args:
+            priority (RequestPriority, optional): the request's priority class. Defaults to NORMAL.
+            deadline (float, optional): seconds the request may wait before it is treated as critical.
+                                        Defaults to the priority's entry in DEFAULT_DEADLINES.
+        """
+        priority = RequestPriority(priority)
+        ticket = self._enqueue(priority, deadline)
+        try:
+            while True:
+                wait = self._try_acquire(ticket)
+                if wait <= 0:
+                    return
+                # Wake up at least every second to refresh the heartbeat
+                wait = min(wait, 1.0)
+                with self._lock:
+                    self.total_wait += wait
+                    self.wait_by_priority[priority.name.lower()] += wait
+                time.sleep(wait)
+        finally:
+            self._dequeue(ticket)
+
+    def get_wait_stats(self) -> dict:
+        with self._lock:
+            return {"total": round(self.total_wait, 2),
+                    "by_priority": {p: round(w, 2) for p, w in self.wait_by_priority.items()}}
+
+    def _enqueue(self, priority, deadline) -> int:
+        now = time.time()
+        deadline = now + (DEFAULT_DEADLINES[priority] if deadline is None else deadline)
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO waiting (priority, deadline, enqueued, heartbeat) "
+                                        "VALUES (?, ?, ?, ?)", (int(priority), deadline, now, now))
+        return cursor.lastrowid
+
+    def _dequeue(self, ticket):
+        with self._lock:
+            self._conn.execute("DELETE FROM waiting WHERE id = ?", (ticket,))
+
+    def _try_acquire(self, ticket) -> float:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so the read-modify-write is atomic across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._conn.execute("UPDATE waiting SET heartbeat = ? WHERE id = ?", (now, ticket))
+                self._conn.execute("DELETE FROM waiting WHERE heartbeat < ?", (now - WAITER_TIMEOUT,))
+                # Waiters in line: past their deadline counts as critical, then oldest first
+                line = [row[0] for row in self._conn.execute(
+                    "SELECT id FROM waiting ORDER BY CASE WHEN deadline <= ? THEN ? ELSE priority END, enqueued, id",
+                    (now, int(RequestPriority.CRITICAL)))]
+                place = line.index(ticket) if ticket in line else len(line)
+
+                tokens, updated = self._conn.execute("SELECT tokens, updated FROM bucket WHERE id = 0").fetchone()
+                tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+                if tokens >= place + 1:
+                    tokens -= 1
+                    wait = 0
+                elif tokens >= 1:
+                    # The free tokens belong to more urgent requests
+                    wait = WAITER_POLL_INTERVAL
+                else:
+                    wait = (1 - tokens) / self.rate
+                self._conn.execute("UPDATE bucket SET tokens = ?, updated = ? WHERE id = 0", (tokens, now))
+            finally:
+                self._conn.execute("COMMIT")
+        return wait
+
+
+def enable_shared_resources(cache_dir, 
+                            requests_per_minute=None, 
+                            completions=True, 
+                            embeddings=True, 
+                            cache_sampled_completions=False):
+    """
+    Turn on the shared caches and, if requests_per_minute is given, the shared rate limiter
+    for this process. Every process pointed at the same cache_dir shares them.
+
+    Args:
+        cache_dir (str): directory holding the sqlite files
+        requests_per_minute (int, optional): shared limit on calls to the OpenAI API. Defaults to no limit.
+        completions (bool, optional): cache chat completions made at a temperature of 0. Defaults to True.
+        embeddings (bool, optional): cache text embeddings. Defaults to True.
+        cache_sampled_completions (bool, optional): also cache sampled completions that are marked cacheable
+                                                    (e.g. importance scores), reusing them within a game. 
+                                                    This changes how the simulation plays out, since the same 
+                                                    prompt then always gets the same answer. Defaults to False.
+    """
+    global _COMPLETION_CACHE, _EMBEDDING_CACHE, _RATE_LIMITER
+    os.makedirs(cache_dir, exist_ok=True)
+    if completions:
+        _COMPLETION_CACHE = CompletionCache(os.path.join(cache_dir, COMPLETION_CACHE_FILE),
+                                            cache_sampled=cache_sampled_completions)
+    if embeddings:
+        _EMBEDDING_CACHE = EmbeddingCache(os.path.join(cache_dir, EMBEDDING_CACHE_FILE))
+    if requests_per_minute:
+        _RATE_LIMITER = RateLimiter(os.path.join(cache_dir, RATE_LIMIT_FILE), requests_per_minute)
+
+
+def get_completion_cache():
+    return _COMPLETION_CACHE
+
+
+def get_embedding_cache():
+    return _EMBEDDING_CACHE
+
+
+def get_rate_limiter():
+    return _RATE_LIMITER
+
+
+def get_shared_resource_stats() -> dict:
+    stats = {}
+    if _COMPLETION_CACHE:
+        stats["completion_cache"] = _COMPLETION_CACHE.get_stats()
+    if _EMBEDDING_CACHE:
+        stats["embedding_cache"] = _EMBEDDING_CACHE.get_stats()
+    if _RATE_LIMITER:
+        wait = _RATE_LIMITER.get_wait_stats()
+        stats["rate_limit_wait_seconds"] = wait["total"]
+        stats["rate_limit_wait_by_priority"] = wait["by_priority"]
+    return stats
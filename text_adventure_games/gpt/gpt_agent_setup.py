@@ -5,26 +5,34 @@ File: gpt_agent.py
 Description: Methods that access the OPENAI API and make a call to GPT
 """
 import re
-import openai
 
 # relative imports
 from ..utils import general
 from .gpt_helpers import GptCallHandler
 
-GPT_HANDLER = GptCallHandler(**{
-    "api_key_org": "Helicone",
-    "model": "gpt-4",
-    "max_tokens": 100,
-    "temperature": 1,
-    "top_p": 1,
-    "max_retries": 5
-})
+# Created on first use so that importing this module doesn't read the config
+_GPT_HANDLER = None
+
+
+def get_gpt_handler():
+    global _GPT_HANDLER
+    if _GPT_HANDLER is None:
+        _GPT_HANDLER = GptCallHandler(**{
+            "api_key_org": "Helicone",
+            "model": "gpt-4",
+            "max_tokens": 100,
+            "temperature": 1,
+            "top_p": 1,
+            "max_retries": 5
+        })
+    return _GPT_HANDLER
 
 
 def get_new_character_from_gpt(description, model: str = "gpt-3.5-turbo"):
 
     # client = general.set_up_openai_client(org="Penn")
-    GPT_HANDLER.update_params(max_tokens=200, temperature=1.25)
+    gpt_handler = get_gpt_handler()
+    gpt_handler.update_params(max_tokens=200, temperature=1.25)
 
     system_prompt = """
 You are a character generator. You should fill in the following character information\
@@ -43,8 +51,8 @@ Create a JSON structure from the output.
 """
 
     user_prompt = f"Create a character who fits this description: {description}"
-    response = GPT_HANDLER.generate(system_prompt, user_prompt)
-    GPT_HANDLER.reset_defaults()
+    response = gpt_handler.generate(system_prompt, user_prompt)
+    gpt_handler.reset_defaults()
 
     facts_json, error_in_json = general.extract_json_from_string(response)
     return facts_json, error_in_json
@@ -70,10 +78,11 @@ def get_trait_continuum(low: str, high: str, mid: str = None, model='gpt-3.5-tur
         user_prompt += f"Provide a list of 15 adjectives that range from\
         'Low: {low}' to 'High: {high}' with a smooth transition in between."
 
-    GPT_HANDLER.update_params(top_p=0.5)
+    gpt_handler = get_gpt_handler()
+    gpt_handler.update_params(top_p=0.5)
 
-    continuum = GPT_HANDLER.generate(system=system_prompt, user=user_prompt)
-    GPT_HANDLER.reset_defaults()
+    continuum = gpt_handler.generate(system=system_prompt, user=user_prompt)
+    gpt_handler.reset_defaults()
 
     scale = general.extract_enumerated_list(continuum)
     return scale
@@ -100,10 +109,11 @@ def get_target_adjective(low: str,
     user_prompt = f"On a smooth transition scale from {low_int}={low} to {high_int}={high},\
         a target score of {target} is represented by the adjective:"
 
-    GPT_HANDLER.update_params(max_tokens=10, top_p=0.5)
+    gpt_handler = get_gpt_handler()
+    gpt_handler.update_params(max_tokens=10, top_p=0.5)
 
-    response = GPT_HANDLER.generate(system=system_prompt, user=user_prompt)
-    GPT_HANDLER.reset_defaults()
+    response = gpt_handler.generate(system=system_prompt, user=user_prompt)
+    gpt_handler.reset_defaults()
 
     target_trait = general.extract_target_word(response)
     return target_trait
@@ -138,9 +148,10 @@ def summarize_agent_facts(facts: str, model='gpt-4') -> str:
          "His love for dogs adds a playful and nurturing aspect to his personality, ",
          "creating a warm and inviting presence in both his professional and personal life."])
     
-    GPT_HANDLER.update_params(stop=".", max_tokens=100, presence_penalty=0.2)
-    response = GPT_HANDLER.generate(system=system_prompt, user=facts)
-    GPT_HANDLER.reset_defaults()
+    gpt_handler = get_gpt_handler()
+    gpt_handler.update_params(stop=".", max_tokens=100, presence_penalty=0.2)
+    response = gpt_handler.generate(system=system_prompt, user=facts)
+    gpt_handler.reset_defaults()
 
     summary = response.lower()
     summary = re.sub("summary:?", "", summary)
@@ -2,24 +2,118 @@
 Author: Samuel Thudium (sam.thudium1@gmail.com)
 """
 
+from bisect import bisect_right
+from collections import OrderedDict
 from dataclasses import asdict, dataclass, field
+from itertools import accumulate
 import json
 import logging
 import os
 import re
+import threading
 import time
 from typing import ClassVar
-import openai
-import tiktoken
-import httpx
 
 # local imports
 from ..utils.general import enumerate_dict_options
 from ..utils.consts import get_config_file, get_assets_path
 from ..assets.prompts import gpt_helper_prompts as hp
+from .caching import get_completion_cache, get_rate_limiter
+from .scheduler import RequestPriority, current_game, get_request_scheduler
 
 logger = logging.getLogger(__name__)
 
+# openai, httpx and tiktoken are imported on first use to keep package imports fast
+_TOKENIZER = None
+_TOKENIZER_LOCK = threading.Lock()
+
+# LRU cache of token counts for the shared tokenizer. The same memories, persona summaries and
+# world info are counted again and again while building prompts.
+TOKEN_COUNT_CACHE_SIZE = 16384
+# Below this many uncached strings, encoding one at a time beats encode_batch's thread pool
+BATCH_ENCODE_MIN = 8
+_TOKEN_COUNTS = OrderedDict()
+_TOKEN_COUNTS_LOCK = threading.Lock()
+_token_count_stats = {"hits": 0, "misses": 0}
+
+
+def get_tokenizer():
+    """
+    Get the cl100k_base encoding shared by the whole process, loading it on first use.
+    """
+    global _TOKENIZER
+    with _TOKENIZER_LOCK:
+        if _TOKENIZER is None:
+            import tiktoken
+            _TOKENIZER = tiktoken.get_encoding("cl100k_base")
+    return _TOKENIZER
+
+
+def count_tokens(text: str, tokenizer=None) -> int:
+    """
+    Count the tokens in a string, using the token count cache.
+
+    Args:
+        text (str): the text to count
+        tokenizer (optional): a tokenizer other than the shared one; its counts are not cached.
+
+    Returns:
+        int: number of tokens
+    """
+    return count_tokens_batch([text], tokenizer=tokenizer)[0]
+
+
+def count_tokens_batch(texts: list, tokenizer=None) -> list:
+    """
+    Count the tokens in each of several strings. Strings that aren't in the token count cache
+    are encoded together with encode_batch.
+
+    Args:
+        texts (list[str]): the texts to count
+        tokenizer (optional): a tokenizer other than the shared one; its counts are not cached.
+
+    Returns:
+        list[int]: number of tokens in each text, in order
+    """
+    # Another tokenizer doesn't need the shared one to be loaded
+    if tokenizer is not None and tokenizer is not _TOKENIZER:
+        return [len(tokens) for tokens in tokenizer.encode_batch(texts)]
+    shared_tokenizer = get_tokenizer()
+
+    counts = [None] * len(texts)
+    # text -> positions in texts that still need a count
+    missing = {}
+    with _TOKEN_COUNTS_LOCK:
+        for i, text in enumerate(texts):
+            count = _TOKEN_COUNTS.get(text)
+            if count is None:
+                missing.setdefault(text, []).append(i)
+            else:
+                _TOKEN_COUNTS.move_to_end(text)
+                counts[i] = count
+        _token_count_stats["hits"] += len(texts) - sum(len(v) for v in missing.values())
+        _token_count_stats["misses"] += len(missing)
+
+    if missing:
+        uncached = list(missing)
+        if len(uncached) >= BATCH_ENCODE_MIN:
+            encoded = shared_tokenizer.encode_batch(uncached)
+        else:
+            encoded = [shared_tokenizer.encode(text) for text in uncached]
+        with _TOKEN_COUNTS_LOCK:
+            for text, tokens in zip(uncached, encoded):
+                _TOKEN_COUNTS[text] = len(tokens)
+                for i in missing[text]:
+                    counts[i] = len(tokens)
+            while len(_TOKEN_COUNTS) > TOKEN_COUNT_CACHE_SIZE:
+                _TOKEN_COUNTS.popitem(last=False)
+    return counts
+
+
+def get_token_count_cache_stats() -> dict:
+    with _TOKEN_COUNTS_LOCK:
+        return {**_token_count_stats, "size": len(_TOKEN_COUNTS)}
+
 
 class ClientInitializer:
 
@@ -28,7 +122,8 @@ class ClientInitializer:
 
     def __init__(self):
         self.load_count = 0
-        self.api_info = self._load_api_keys()
+        # The config is read when the first client is requested, not at import
+        self.api_info = None
         self.clients = {}
 
     def _load_api_keys(self):
@@ -45,6 +140,10 @@ class ClientInitializer:
             return self.get_client(org)
     
     def set_client(self, org):
+        import openai
+
+        if self.api_info is None:
+            self.api_info = self._load_api_keys()
         if not self.api_info:
             raise AttributeError("api_info may not have been initialized correctly")
         try:
@@ -61,6 +160,7 @@ class ClientInitializer:
         if "api_key" not in params:
             raise ValueError("'api_key' must be included in your config.")
         if "timeout" not in params:
+            import httpx
             # Limit connection to 15 seconds
             # Limit read and write to 60 seconds 
             params["timeout"] = httpx.Timeout(60, connect=15)
@@ -87,6 +187,19 @@ class GptCallHandler:
     client_handler: ClassVar = ClientInitializer()
     calls_made: ClassVar[int] = 0
     tokens_processed: ClassVar[int] = 0 
+    # Time to first token and early stops of streamed calls (see generate_stream)
+    stream_stats: ClassVar[dict] = {"requests": 0, "early_stops": 0, "with_tokens": 0,
+                                    "total_ttft": 0.0, "max_ttft": 0.0}
+    # Handlers may be called from several threads at once (see utils.general.map_concurrently)
+    _counter_lock: ClassVar = threading.Lock()
+    # Parameters that can be overridden for a single call to generate
+    REQUEST_PARAMS: ClassVar[tuple] = ("model", "max_tokens", "temperature", "top_p", 
+                                       "frequency_penalty", "presence_penalty", "stop", "response_format")
+    # The model limits asset, read once per process
+    _loaded_model_limits: ClassVar[dict] = None
+    # Handlers handed out by get_shared, keyed on their parameters
+    _shared_handlers: ClassVar[dict] = {}
+    _shared_lock: ClassVar = threading.Lock()
 
     # Instance variables
     api_key_org: str = "Helicone"
@@ -97,12 +210,14 @@ class GptCallHandler:
     frequency_penalty: float = 0
     presence_penalty: float = 0
     max_retries: int = 5
+    response_format: dict = None
+    # Default priority of this handler's requests (see gpt.scheduler)
+    priority: int = RequestPriority.NORMAL
     stop = None
     openai_internal_errors: int = 0
     openai_rate_limits_hit: int = 0
     
     def __post_init__(self):
-        self.original_params = self._save_init_params()
         self.original_params = self._save_init_params()
         self.client = self.client_handler.get_client(self.api_key_org)
         self.model_limits = self._load_model_limits()
@@ -111,7 +226,33 @@ class GptCallHandler:
     def _save_init_params(self):
         return asdict(self)
 
+    def __getstate__(self):
+        # API clients can't be pickled; the handler gets its client back on the next call
+        state = self.__dict__.copy()
+        state["client"] = None
+        return state
+
+    @classmethod
+    def get_shared(cls, **model_params) -> "GptCallHandler":
+        """
+        Get the process-wide handler for these parameters, creating it on first use.
+        For callers that would otherwise set up an identical handler for every turn or conversation.
+        Shared handlers must not be changed with update_params; pass overrides to generate instead.
+
+        Returns:
+            GptCallHandler: the shared handler
+        """
+        key = json.dumps(model_params, sort_keys=True, default=str)
+        with cls._shared_lock:
+            handler = cls._shared_handlers.get(key)
+            if handler is None:
+                handler = cls(**model_params)
+                cls._shared_handlers[key] = handler
+        return handler
+
     def _load_model_limits(self):
+        if GptCallHandler._loaded_model_limits is not None:
+            return GptCallHandler._loaded_model_limits
         assets = get_assets_path()
         full_path = os.path.join(assets, "openai_model_limits.json")
         try:
@@ -121,6 +262,7 @@ class GptCallHandler:
             print(f"Bad path. Couldn't find assest at {full_path}")
             # TODO: what to do in this case?
         else:
+            GptCallHandler._loaded_model_limits = limits
             return limits
         
     def _set_requested_model_limits(self):
@@ -152,7 +294,8 @@ class GptCallHandler:
 
     @classmethod
     def increment_calls_count(cls):
-        cls.calls_made += 1
+        with cls._counter_lock:
+            cls.calls_made += 1
 
     @classmethod
     def get_tokens_processed(cls):
@@ -160,22 +303,193 @@ class GptCallHandler:
 
     @classmethod
     def update_token_count(cls, add_on: int):
-        cls.tokens_processed += add_on
+        with cls._counter_lock:
+            cls.tokens_processed += add_on
         
     def generate(self, 
                  system: str = None, 
                  user: str = None, 
-                 messages: list = None) -> str:
+                 messages: list = None,
+                 cacheable: bool = False,
+                 priority: int = None,
+                 deadline: float = None,
+                 **overrides) -> str:
         """
         A wrapper for making a call to OpenAI API.
         It expects a function as an argument that should produce the messages argument.        
 
         Args:
             func (Callable): _description_
+            cacheable (bool): whether a sampled response may be served from, and stored in, the shared
+                              completion cache (see gpt.caching). Calls with a temperature of 0 are
+                              always cached and shared by every game. Sampled responses are only
+                              cached if the cache was enabled with cache_sampled_completions, and
+                              then only reused within the game that made them (see
+                              scheduler.current_game), so games in a sweep stay independent.
+            priority (RequestPriority): priority class of this call. Defaults to the handler's priority.
+            deadline (float): seconds this call may wait in the request scheduler before it is
+                              treated as critical. Defaults to the priority's default.
+            overrides: request parameters (see REQUEST_PARAMS) to use for this call only.
+                       Unlike update_params, these don't modify the handler, so a handler
+                       can be shared between threads.
 
         Returns:
             str: _description_
         """
+        messages, request_params = self._prepare_request(system, user, messages, overrides)
+
+        cache = get_completion_cache()
+        cache_key = None
+        sampled = request_params["temperature"] != 0
+        if cache and (not sampled or (cacheable and cache.cache_sampled)):
+            key_params = request_params
+            if sampled:
+                key_params = dict(request_params, game=current_game.get())
+            cache_key = cache.make_key(messages, key_params)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        def send():
+            response = self.client.chat.completions.create(
+                messages=messages,
+                **request_params
+            )
+            return response.choices[0].message.content
+
+        content = self._send_with_retries(send, priority, deadline)
+        if isinstance(content, tuple):
+            return content
+        self._set_token_counts(system, user, messages)
+        # print("incrementing the number of calls to GPT")
+        GptCallHandler.increment_calls_count()
+        if cache_key and content is not None:
+            cache.set(cache_key, content)
+        return content
+
+    def generate_stream(self,
+                        system: str = None,
+                        user: str = None,
+                        messages: list = None,
+                        stop_phrases: list = None,
+                        on_text=None,
+                        priority: int = None,
+                        deadline: float = None,
+                        **overrides) -> str:
+        """
+        Like generate, but the response is streamed. The text is handed to on_text as it arrives,
+        and the request is cancelled as soon as any of the stop phrases has been generated.
+        Time to first token is recorded in the streaming stats (see get_stream_stats).
+        Streamed responses are not cached.
+
+        A request that fails before any text arrives is retried as usual. Once on_text has been
+        given part of the response, a retry would hand it those pieces again, so if the stream
+        breaks after that, the text received so far is returned instead.
+
+        Args:
+            stop_phrases (list[str], optional): phrases that end the response. Unlike the API's stop
+                                                sequences, the phrase is kept in the response, so
+                                                callers can still check for it.
+            on_text (Callable[[str], None], optional): called with each new piece of the response.
+            priority, deadline, overrides: as in generate
+
+        Returns:
+            str: the response, ending with the stop phrase if one was generated,
+                 or a (False, info) tuple if the request was rejected (see generate)
+        """
+        messages, request_params = self._prepare_request(system, user, messages, overrides)
+        stop_phrases = [phrase for phrase in stop_phrases or [] if phrase]
+
+        def send():
+            started = time.monotonic()
+            stream = self.client.chat.completions.create(
+                messages=messages,
+                stream=True,
+                **request_params
+            )
+            return self._read_stream(stream, stop_phrases, on_text, started)
+
+        content = self._send_with_retries(send, priority, deadline)
+        if isinstance(content, tuple):
+            return content
+        self._set_token_counts(system, user, messages)
+        GptCallHandler.increment_calls_count()
+        return content
+
+    def _read_stream(self, stream, stop_phrases, on_text, started):
+        """
+        Collect a streamed response, closing the stream early if a stop phrase comes up.
+        """
+        # Only the end of the text can hold a phrase that wasn't there before the last piece
+        lookback = max((len(phrase) for phrase in stop_phrases), default=0)
+        text = ""
+        first_token_time = None
+        stopped = False
+        chunks = iter(stream)
+        try:
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    if not (on_text and text):
+                        # Nothing has been passed on yet, so the request can be retried
+                        raise
+                    # on_text already has part of the response; keep it rather than starting over
+                    self._log_gpt_error(e)
+                    break
+                if not chunk.choices:
+                    continue
+                piece = chunk.choices[0].delta.content
+                if not piece:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.monotonic() - started
+
+                search_from = max(0, len(text) - lookback + 1)
+                text += piece
+                end = None
+                for phrase in stop_phrases:
+                    found = text.find(phrase, search_from)
+                    if found != -1 and (end is None or found + len(phrase) < end):
+                        end = found + len(phrase)
+                if end is not None:
+                    piece = piece[:len(piece) - (len(text) - end)]
+                    text = text[:end]
+                    stopped = True
+                if on_text and piece:
+                    on_text(piece)
+                if stopped:
+                    break
+        finally:
+            # Closing the response cancels the rest of the generation
+            stream.close()
+        GptCallHandler.record_stream(first_token_time, stopped)
+        return text
+
+    @classmethod
+    def record_stream(cls, first_token_time, stopped_early):
+        with cls._counter_lock:
+            stats = cls.stream_stats
+            stats["requests"] += 1
+            stats["early_stops"] += int(stopped_early)
+            if first_token_time is not None:
+                stats["with_tokens"] += 1
+                stats["total_ttft"] += first_token_time
+                stats["max_ttft"] = max(stats["max_ttft"], first_token_time)
+
+    @classmethod
+    def get_stream_stats(cls) -> dict:
+        with cls._counter_lock:
+            stats = cls.stream_stats
+            n = stats["with_tokens"]
+            return {"requests": stats["requests"],
+                    "early_stops": stats["early_stops"],
+                    "mean_ttft": round(stats["total_ttft"] / n, 3) if n else 0.0,
+                    "max_ttft": round(stats["max_ttft"], 3)}
+
+    def _prepare_request(self, system, user, messages, overrides):
         if system and user:
             # Generate messages
             messages = [
@@ -185,20 +499,41 @@ class GptCallHandler:
         elif not messages or not isinstance(messages, list):
             raise ValueError("You must supply 'system' and 'user' strings or a list of ChatMessages in 'messages'.")
 
+        request_params = {param: getattr(self, param) for param in self.REQUEST_PARAMS}
+        request_params.update({param: value for param, value in overrides.items() if param in self.REQUEST_PARAMS})
+        # Only send a response format (e.g. JSON mode) when one is requested;
+        # not every model accepts the parameter.
+        if not request_params["response_format"]:
+            del request_params["response_format"]
+        return messages, request_params
+
+    def _send_with_retries(self, send, priority, deadline):
+        """
+        Make a request through the scheduler and rate limiter, handling OpenAI's errors.
+
+        Args:
+            send (Callable[[], str]): makes the request and returns the response's content
+
+        Returns:
+            str: the content, or a (False, info) tuple if the request was rejected
+        """
+        import openai
+
+        if self.client is None:
+            self.client = self.client_handler.get_client(self.api_key_org)
+        rate_limiter = get_rate_limiter()
+        scheduler = get_request_scheduler()
+        priority = self.priority if priority is None else priority
+
         i = 0
         while i < self.max_retries:
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens,
-                    top_p=self.top_p,
-                    frequency_penalty=self.frequency_penalty,
-                    presence_penalty=self.presence_penalty,
-                    stop=self.stop
-                )
-                # return response.choices[0].message.content
+                # Wait for a rate limit token before taking a slot, so that a request held back
+                # by the rate limit doesn't keep a slot from more urgent requests
+                if rate_limiter:
+                    rate_limiter.acquire(priority, deadline)
+                with scheduler.slot(priority, deadline):
+                    content = send()
             except openai.APITimeoutError as e:
                 # The request took too long
                 self._log_gpt_error(e)
@@ -228,10 +563,7 @@ class GptCallHandler:
                 print("Your api credentials caused an error. Check your config file.")
                 raise e
             else:
-                self._set_token_counts(system, user, messages)
-                # print("incrementing the number of calls to GPT")
-                GptCallHandler.increment_calls_count()
-                return response.choices[0].message.content
+                return content
 
     def _set_token_counts(self, system, user, messages):
         if system and user:
@@ -344,18 +676,12 @@ def gpt_get_summary_description_of_action(statement,
 
     if not isinstance(call_handler, GptCallHandler):
         raise TypeError("'call_handler' must be a GptCallHandler.")
-    
-    call_handler.update_params(**handler_kwargs)
 
     system = hp.action_summary_prompt
     messages = [{"role": "system", "content": system},
                 {"role": "user", "content": statement}]
 
-    summary_statement = call_handler.generate(messages=messages)
-    call_handler.reset_defaults()
-
-    summary_statement = call_handler.generate(messages=messages)
-    call_handler.reset_defaults()
+    summary_statement = call_handler.generate(messages=messages, **handler_kwargs)
 
     return summary_statement
 
@@ -365,18 +691,14 @@ def gpt_get_action_importance(statement: str,
 
     if not isinstance(call_handler, GptCallHandler):
         raise TypeError("'call_handler' must be a GptCallHandler.")
-    
-    call_handler.update_params(**handler_kwargs)
 
     system = hp.action_importance_prompt
     messages = [{"role": "system", "content": system},
                 {"role": "user", "content": statement}]
 
-    importance_str = call_handler.generate(messages=messages)
-    call_handler.reset_defaults()
-
-    importance_str = call_handler.generate(messages=messages)
-    call_handler.reset_defaults()
+    importance_str = call_handler.generate(messages=messages, cacheable=True, **handler_kwargs)
+    if not isinstance(importance_str, str):
+        return None
 
     pattern = r"\d+"
     matches = re.findall(pattern, importance_str)
@@ -411,12 +733,6 @@ def gpt_pick_an_option(instructions,
     """
     if not isinstance(call_handler, GptCallHandler):
         raise TypeError("'call_handler' must be a GptCallHandler.")
-    
-    call_handler.update_params(**handler_kwargs)
-    if not isinstance(call_handler, GptCallHandler):
-        raise TypeError("'call_handler' must be a GptCallHandler.")
-    
-    call_handler.update_params(**handler_kwargs)
 
     choices_str, options_list = enumerate_dict_options(options)
 
@@ -431,26 +747,13 @@ def gpt_pick_an_option(instructions,
     ]
 
     # Call the OpenAI API
-    selection = call_handler.generate(messages=messages)
-    call_handler.reset_defaults()
-    messages = [
-        {
-            "role": "system",
-            "content": "{instructions}\n\n{choices_str}\nReturn just the number of the best match.".format(
-                instructions=instructions, choices_str=choices_str
-            ),
-        },
-        {"role": "user", "content": input_str},
-    ]
-
-    # Call the OpenAI API
-    selection = call_handler.generate(messages=messages)
-    call_handler.reset_defaults()
+    selection = call_handler.generate(messages=messages, cacheable=True, **handler_kwargs)
+    if not isinstance(selection, str):
+        return None
 
     # Use regular expressions to match a number returned by OpenAI and select that option.
     pattern = r"\d+"
     matches = re.findall(pattern, selection)
-    matches = re.findall(pattern, selection)
     if matches:
         index = int(matches[0])
         if index >= len(options_list):
@@ -460,12 +763,249 @@ def gpt_pick_an_option(instructions,
     else:
         return None
 
+def pack_context(token_counts: list, 
+                 max_tokens: int, 
+                 keep_most_recent: bool = True, 
+                 max_items: int = None, 
+                 scores: list = None):
+    """
+    Choose which items of a context list fit in a token budget, given each item's token count.
+
+    By default this keeps the longest run of items from the end of the list (or from the start if
+    keep_most_recent is False) that fits, found by binary search over prefix sums. If scores are
+    given, it instead keeps the highest scoring items that fit, skipping any that are too long.
+
+    Args:
+        token_counts (list[int]): token count of each item
+        max_tokens (int): the token budget
+        keep_most_recent (bool, optional): keep items from the end of the list. Defaults to True.
+        max_items (int, optional): keep at most this many items. Defaults to no limit.
+        scores (list[float], optional): importance of each item, to pack the most important items.
+
+    Returns:
+        tuple[list[int], int]: indices of the kept items in list order, and their total token count
+    """
+    n = len(token_counts)
+    max_items = n if max_items is None else min(max_items, n)
+    if max_tokens <= 0 or max_items <= 0:
+        return [], 0
+
+    if scores is not None:
+        kept, total = [], 0
+        for i in sorted(range(n), key=lambda i: scores[i], reverse=True):
+            if total + token_counts[i] <= max_tokens:
+                kept.append(i)
+                total += token_counts[i]
+                if len(kept) >= max_items:
+                    break
+        return sorted(kept), total
+
+    ordered = token_counts[::-1] if keep_most_recent else token_counts
+    prefix_sums = list(accumulate(ordered, initial=0))
+    # the number of items whose running total is within budget
+    k = min(bisect_right(prefix_sums, max_tokens) - 1, max_items)
+    indices = range(n - k, n) if keep_most_recent else range(k)
+    return list(indices), prefix_sums[k]
+
+
+def chunk_context(token_counts: list, max_tokens: int) -> list:
+    """
+    Split a context list into consecutive chunks that each fit in a token budget.
+    Stops at the first item that doesn't fit in a chunk on its own.
+
+    Args:
+        token_counts (list[int]): token count of each item
+        max_tokens (int): the token budget of each chunk
+
+    Returns:
+        list[tuple[int, int]]: (start, end) slice bounds of each chunk
+    """
+    prefix_sums = list(accumulate(token_counts, initial=0))
+    chunks = []
+    start = 0
+    while start < len(token_counts):
+        end = bisect_right(prefix_sums, prefix_sums[start] + max_tokens) - 1
+        if end <= start:
+            break
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+# Tokens held back from every prompt budget to absorb small differences between
+# the counts of a prompt's pieces and the count of the joined prompt
+PROMPT_BUDGET_MARGIN = 16
+# Share of the section budget used when a packed prompt is rejected and sent again
+RETRY_BUDGET_SCALE = 0.5
+
+
+class PromptBudget:
+    """
+    Plans how the context window of one call to GPT is shared by the parts of its prompt.
+
+    Fixed text (the system prompt, instructions, headers) is always included. Sections are lists
+    of context items (memories, impressions, dialogue, ...) that are trimmed to fit what is left.
+    Each section has a priority (lower is more important) and a minimum number of tokens it is
+    guaranteed if it has that much content. pack() reserves every section's minimum, in priority
+    order, then hands out the rest in priority order. Each item is counted once, through the shared
+    token count cache, and a prompt built from the packed sections fits in the model's context
+    along with the reply. A request can still be rejected (e.g. by the content filter); callers then
+    build the prompt once more with scale=RETRY_BUDGET_SCALE, which keeps less of each section.
+    """
+
+    def __init__(self, 
+                 gpt_handler: "GptCallHandler", 
+                 system: str = None, 
+                 system_tokens: int = None, 
+                 tokenizer=None, 
+                 margin: int = PROMPT_BUDGET_MARGIN,
+                 scale: float = 1.0):
+        """
+        Args:
+            gpt_handler (GptCallHandler): the handler that will make the call; gives the model's limits
+            system (str, optional): the system prompt, if the call has one
+            system_tokens (int, optional): token count of the system prompt, if already known 
+                                           (e.g. from the parts of get_standard_info)
+            tokenizer (optional): defaults to the shared tokenizer
+            margin (int, optional): tokens held back for safety. Defaults to PROMPT_BUDGET_MARGIN.
+            scale (float, optional): share of the tokens left after the fixed text that the sections
+                                     may use, e.g. RETRY_BUDGET_SCALE for a prompt that was rejected. 
+                                     Defaults to 1.0.
+        """
+        self.tokenizer = tokenizer
+        self.scale = scale
+        self.limit = get_token_remainder(gpt_handler.model_context_limit, gpt_handler.max_tokens, margin)
+        # The user message's role and the primer of GPT's reply
+        self.fixed_tokens = get_prompt_token_count(role="user", pad_reply=True, tokenizer=tokenizer)
+        if system_tokens is not None:
+            self.fixed_tokens += system_tokens + get_prompt_token_count(role="system", tokenizer=tokenizer)
+        elif system:
+            self.fixed_tokens += get_prompt_token_count(system, role="system", tokenizer=tokenizer)
+        self.sections = {}
+        self.packed = None
+        self.total_tokens = None
+
+    @property
+    def available(self) -> int:
+        """
+        Tokens left for the sections once the fixed text is accounted for.
+        """
+        return int(max(0, self.limit - self.fixed_tokens) * self.scale)
+
+    @property
+    def remaining(self) -> int:
+        """
+        Tokens left over once the sections are packed, e.g. for context that is split over several calls.
+        """
+        self.pack()
+        return max(0, self.fixed_tokens + self.available - self.total_tokens)
+
+    def add_fixed(self, *texts: str) -> "PromptBudget":
+        """
+        Account for text that is always included in the user message.
+        """
+        self.fixed_tokens += sum(count_tokens_batch([t for t in texts if t], tokenizer=self.tokenizer))
+        return self
+
+    def add_section(self,
+                    name: str,
+                    items: list,
+                    priority: int = 1,
+                    min_tokens: int = 0,
+                    max_tokens: int = None,
+                    keep_most_recent: bool = True,
+                    max_items: int = None,
+                    scores: list = None,
+                    sep_tokens: int = 1) -> "PromptBudget":
+        """
+        Add a list of context items to be trimmed to fit.
+
+        Args:
+            name (str): key of the section in the result of pack()
+            items (list[str]): the context items
+            priority (int, optional): lower values are filled first. Defaults to 1.
+            min_tokens (int, optional): tokens reserved for this section before any lower priority
+                                        section is filled. Defaults to 0.
+            max_tokens (int, optional): the most tokens this section may use. Defaults to no limit.
+            keep_most_recent (bool, optional): trim from the start of the list. Defaults to True.
+            max_items (int, optional): keep at most this many items. Defaults to no limit.
+            scores (list[float], optional): keep the highest scoring items instead (see pack_context).
+            sep_tokens (int, optional): tokens added per item for the separator it is joined with. Defaults to 1.
+        """
+        if self.packed is not None:
+            raise ValueError("Sections can't be added to a budget that has already been packed.")
+        items = list(items or [])
+        counts = [c + sep_tokens for c in count_tokens_batch(items, tokenizer=self.tokenizer)]
+        self.sections[name] = {"items": items,
+                               "counts": counts,
+                               "priority": priority,
+                               "min_tokens": min_tokens,
+                               "max_tokens": max_tokens,
+                               "keep_most_recent": keep_most_recent,
+                               "max_items": max_items,
+                               "scores": scores}
+        return self
+
+    def pack(self) -> dict:
+        """
+        Decide what to keep of each section. This happens once; later calls return the same result.
+
+        Raises:
+            ValueError: if the fixed text alone doesn't fit in the model's context
+
+        Returns:
+            dict: section name -> the kept items, in their original order
+        """
+        if self.packed is not None:
+            return self.packed
+        if self.fixed_tokens > self.limit:
+            raise ValueError(f"The fixed parts of this prompt need {self.fixed_tokens} tokens, "
+                             f"but only {self.limit} are available.")
+
+        ordered = sorted(self.sections, key=lambda name: self.sections[name]["priority"])
+
+        def wanted(section):
+            total = sum(section["counts"])
+            return total if section["max_tokens"] is None else min(total, section["max_tokens"])
+
+        # Reserve the minimums, most important sections first
+        free = self.available
+        reserved = {}
+        for name in ordered:
+            section = self.sections[name]
+            reserved[name] = min(section["min_tokens"], wanted(section), free)
+            free -= reserved[name]
+
+        # Fill each section from its reserve and whatever is still free;
+        # anything it doesn't use is free for the sections after it
+        self.packed = {}
+        used_tokens = 0
+        for name in ordered:
+            section = self.sections[name]
+            budget = reserved[name] + free
+            if section["max_tokens"] is not None:
+                budget = min(budget, max(section["max_tokens"], reserved[name]))
+            indices, used = pack_context(section["counts"],
+                                         budget,
+                                         keep_most_recent=section["keep_most_recent"],
+                                         max_items=section["max_items"],
+                                         scores=section["scores"])
+            self.packed[name] = [section["items"][i] for i in indices]
+            free += reserved[name] - used
+            used_tokens += used
+
+        self.total_tokens = self.fixed_tokens + used_tokens
+        return self.packed
+
+
 def limit_context_length(history, 
                          max_tokens, 
                          max_turns=1000, 
                          tokenizer=None, 
                          keep_most_recent=True, 
-                         return_count=False):
+                         return_count=False,
+                         token_counts=None,
+                         scores=None):
 
     """
     This method limits the length of the command_history 
@@ -481,6 +1021,9 @@ def limit_context_length(history,
         tokenizer (_type_, optional): _description_. Defaults to None.
         keep_most_recent (bool, optional): If True, trim from the beginning values.
         return_count (bool, optional): Also return the total token count that was consumed. Defaults to False.
+        token_counts (list[int], optional): token counts of the items in history, if already known.
+        scores (list[float], optional): importance of each item; if given, keep the most important
+                                        items that fit rather than the most recent (see pack_context).
 
     Raises:
         TypeError: _description_
@@ -490,9 +1033,8 @@ def limit_context_length(history,
         _type_: _description_
     """
     total_tokens = 0
-    limited_history = []
     if not tokenizer:
-        tokenizer = tiktoken.get_encoding("cl100k_base")
+        tokenizer = get_tokenizer()
     if not isinstance(history, list):
         raise TypeError("history must be a list, not ", type(history))
     
@@ -500,42 +1042,34 @@ def limit_context_length(history,
         if isinstance(history[0], dict):
             # this indicates that we're parsing ChatMessages, so extract the "content" and "role" strings
             # pad with 3 tokens and include both content & role
-            extract = lambda x: get_prompt_token_count(content=x["content"], role=x["role"], pad_reply=False, tokenizer=tokenizer)
+            if token_counts is None:
+                token_counts = [get_prompt_token_count(content=x["content"], role=x["role"], pad_reply=False, tokenizer=tokenizer)
+                                for x in history]
             
             # each reply carries 3 tokens via "<|start|>assistant<|message|>" that need to be added once
             total_tokens += 3
         elif isinstance(history[0], str):
             # this indicates that we're parsing a list of strings
-            extract = lambda x: len(tokenizer.encode(x))
+            if token_counts is None:
+                token_counts = count_tokens_batch(history, tokenizer=tokenizer)
         else:
             raise TypeError("Elements in history must be either dict or str")
-        
-    # reverse a copy of the list if we are only keeping the most recent items
-    if keep_most_recent:
-        copy_history = reversed(history)
-    # otherwise make a normal copy of the list
     else:
-        copy_history = history.copy()
-
-    for message in copy_history:
-        msg_tokens = extract(message)
+        token_counts = []
         
-        if total_tokens + msg_tokens > max_tokens:
-            break
-        total_tokens += msg_tokens
-        limited_history.append(message)
-        if len(limited_history) >= max_turns:
-            break
-
-    # reverse the new list (back to normal) if we are keeping only the most recent items
-    if keep_most_recent:
-        limited_history.reverse()
+    indices, packed_tokens = pack_context(token_counts, 
+                                          max_tokens - total_tokens, 
+                                          keep_most_recent=keep_most_recent, 
+                                          max_items=max_turns,
+                                          scores=scores)
+    limited_history = [history[i] for i in indices]
+    total_tokens += packed_tokens
         
     # return the total number of tokens consumed by this context list.
     if return_count:
-        return list(limited_history), total_tokens
+        return limited_history, total_tokens
     
-    return list(limited_history)
+    return limited_history
 
 
 def get_prompt_token_count(content=None, role=None, pad_reply=False, tokenizer=None):
@@ -571,7 +1105,7 @@ def get_prompt_token_count(content=None, role=None, pad_reply=False, tokenizer=N
         int: number of tokens
     """
 
-    if not content:
+    if not content and not role and not pad_reply:
         return 0
     if content is not None and not isinstance(content, str) and not isinstance(content, list):
         raise TypeError("content must be a string or list, not ", type(content))
@@ -581,7 +1115,7 @@ def get_prompt_token_count(content=None, role=None, pad_reply=False, tokenizer=N
         raise TypeError("role must be a string, not ", type(role))
     
     if not tokenizer:
-        tokenizer = tiktoken.get_encoding("cl100k_base")
+        tokenizer = get_tokenizer()
 
     # initialize token count to 0
     token_count = 0
@@ -592,18 +1126,17 @@ def get_prompt_token_count(content=None, role=None, pad_reply=False, tokenizer=N
 
     # if checking string message content
     if content and isinstance(content, str):
-        token_count += len(tokenizer.encode(content))
+        token_count += count_tokens(content, tokenizer=tokenizer)
 
     # if checking list of strings message content
     elif content and isinstance(content, list):
-        for c in content:
-            token_count += len(tokenizer.encode(c))
+        token_count += sum(count_tokens_batch(content, tokenizer=tokenizer))
 
     # if checking message role
     if role:
         # pad messages with 3 tokens to account for GPT's content/role JSON structure
         token_count += 3
-        token_count += len(tokenizer.encode(role))
+        token_count += count_tokens(role, tokenizer=tokenizer)
 
     return token_count
 
@@ -0,0 +1,150 @@
+"""
+Author: Samuel Thudium (sam.thudium1@gmail.com)
+
+File: gpt/scheduler.py
+Description: a process-wide scheduler that every GptCallHandler request passes through.
+             At most max_concurrent requests are in flight at once. When requests have to wait,
+             they are let through by priority class, then by whichever game has the fewest requests
+             in flight (so one busy game can't crowd out the others), then first come, first served.
+             A request that has waited longer than its deadline is treated as critical, so
+             background work is delayed under load but never starved.
+
+             This only orders requests within one process, e.g. a game whose thread pools issue
+             more than max_concurrent calls at once. run_sweep.py runs one game per process; there,
+             requests queue up in the shared rate limiter, which applies the same priority classes
+             and deadlines across processes (see caching.RateLimiter).
+"""
+
+import contextvars
+import itertools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from enum import IntEnum
+
+
+class RequestPriority(IntEnum):
+    # Calls that block the turn loop, e.g. choosing an action
+    CRITICAL = 0
+    NORMAL = 1
+    # Calls whose results are only needed later, e.g. impressions and memory importance scores
+    BACKGROUND = 2
+
+
+# Seconds a request may wait before it jumps to the front of the queue
+DEFAULT_DEADLINES = {RequestPriority.CRITICAL: 0,
+                     RequestPriority.NORMAL: 15,
+                     RequestPriority.BACKGROUND: 60}
+DEFAULT_MAX_CONCURRENT = 16
+
+# The game a request belongs to. Set by the game loop; copied into worker threads by map_concurrently.
+current_game = contextvars.ContextVar("current_game", default=None)
+
+
+def set_current_game(game_id):
+    return current_game.set(game_id)
+
+
+class _Request:
+    _ids = itertools.count()
+
+    def __init__(self, priority, deadline, game_id):
+        self.priority = priority
+        self.game_id = game_id
+        self.enqueued = time.monotonic()
+        self.deadline = self.enqueued + (DEFAULT_DEADLINES[priority] if deadline is None else deadline)
+        self.seq = next(self._ids)
+
+    def sort_key(self, now, in_flight_by_game):
+        priority = RequestPriority.CRITICAL if now >= self.deadline else self.priority
+        return (priority, in_flight_by_game[self.game_id], self.seq)
+
+
+class RequestScheduler:
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._in_flight = 0
+        self._in_flight_by_game = defaultdict(int)
+
+        # Metrics
+        self.max_queue_depth = 0
+        self.wait_stats = {p: {"requests": 0, "total_wait": 0.0, "max_wait": 0.0} for p in RequestPriority}
+
+    @contextmanager
+    def slot(self, priority=RequestPriority.NORMAL, deadline=None):
+        """
+        Hold one of the scheduler's slots for the duration of a request.
+
+        Args:
+            priority (RequestPriority, optional): the request's priority class. Defaults to NORMAL.
+            deadline (float, optional): seconds the request may wait before it is treated as critical.
+                                        Defaults to the priority's entry in DEFAULT_DEADLINES.
+        """
+        request = _Request(RequestPriority(priority), deadline, current_game.get())
+        self._acquire(request)
+        try:
+            yield
+        finally:
+            self._release(request)
+
+    def _acquire(self, request):
+        with self._cond:
+            self._waiting.append(request)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+            while not (self._in_flight < self.max_concurrent and self._next_request() is request):
+                # Wake up now and then so that requests past their deadline get promoted
+                self._cond.wait(timeout=0.5)
+            self._waiting.remove(request)
+            self._in_flight += 1
+            self._in_flight_by_game[request.game_id] += 1
+
+            wait = time.monotonic() - request.enqueued
+            stats = self.wait_stats[request.priority]
+            stats["requests"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            # Another slot may be free for the next request in line
+            self._cond.notify_all()
+
+    def _release(self, request):
+        with self._cond:
+            self._in_flight -= 1
+            self._in_flight_by_game[request.game_id] -= 1
+            self._cond.notify_all()
+
+    def _next_request(self):
+        now = time.monotonic()
+        return min(self._waiting, key=lambda r: r.sort_key(now, self._in_flight_by_game))
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            waits = {}
+            for priority, stats in self.wait_stats.items():
+                n = stats["requests"]
+                waits[priority.name.lower()] = {"requests": n,
+                                                "mean_wait": round(stats["total_wait"] / n, 3) if n else 0.0,
+                                                "max_wait": round(stats["max_wait"], 3)}
+            return {"queue_depth": len(self._waiting),
+                    "max_queue_depth": self.max_queue_depth,
+                    "in_flight": self._in_flight,
+                    "wait": waits}
+
+
+_SCHEDULER = RequestScheduler()
+
+
+def get_request_scheduler() -> RequestScheduler:
+    return _SCHEDULER
+
+
+def configure_request_scheduler(max_concurrent: int):
+    """
+    Change how many requests may be in flight at once in this process.
+    """
+    with _SCHEDULER._cond:
+        _SCHEDULER.max_concurrent = max_concurrent
+        _SCHEDULER._cond.notify_all()
@@ -1,10 +1,57 @@
-import tiktoken
-from text_adventure_games.gpt.gpt_helpers import limit_context_length, get_prompt_token_count, GptCallHandler
+from bisect import bisect_left
+import json
+
+from text_adventure_games.gpt.gpt_helpers import (count_tokens,
+                                                  get_prompt_token_count,
+                                                  GptCallHandler,
+                                                  PromptBudget,
+                                                  RETRY_BUDGET_SCALE)
+from text_adventure_games.gpt.scheduler import RequestPriority
 from text_adventure_games.assets.prompts import dialogue_prompt as dp
-from ..utils.general import set_up_openai_client
 from ..agent.agent_cognition.retrieve import retrieve
 
 ACTION_MAX_OUTPUT = 100
+# A character says this to end their part in the conversation
+LEAVE_PHRASE = "I leave the conversation"
+
+
+class DialogueContext:
+    """
+    The lines of a conversation, each counted once as it is added. Running totals of the counts
+    give the window of most recent lines that fits in a token budget without recounting anything.
+    """
+
+    def __init__(self):
+        self.lines = []
+        # Token count of each line, including the newline it is joined with
+        self.token_counts = []
+        # running_totals[i] is the token count of the first i lines
+        self.running_totals = [0]
+
+    def add(self, line: str):
+        count = count_tokens(line) + 1
+        self.lines.append(line)
+        self.token_counts.append(count)
+        self.running_totals.append(self.running_totals[-1] + count)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.running_totals[-1]
+
+    def window(self, max_tokens: int):
+        """
+        Get the most recent lines that fit in max_tokens.
+
+        Returns:
+            tuple[list[str], int]: the lines, in order, and their token count
+        """
+        total = self.total_tokens
+        # A negative budget fits no lines, rather than searching past the end of running_totals
+        start = bisect_left(self.running_totals, total - max(0, max_tokens))
+        return self.lines[start:], total - self.running_totals[start]
+
+    def __len__(self):
+        return len(self.lines)
 
 
 class Dialogue:
@@ -20,16 +67,17 @@ class Dialogue:
 
         self.game = game
         self.gpt_handler = self._set_up_gpt()
-        self.token_offset = 0
-        self.offset_pad = 5
-        self.model_context_limit = self.gpt_handler.model_context_limit
         self.participants = participants
+        # participants leave the conversation as it goes on; these are everyone who took part
+        self.speakers = list(participants)
         self.characters_system = {}
         self.characters_user = {}
         self.participants_number = len(participants)
         self.command = command
-        self.dialogue_history = [f'{self.participants[0].name} wants to {self.command}. The dialogue just started.']
-        self.dialogue_history_token_count = get_prompt_token_count(content=self.dialogue_history, role=None, pad_reply=False)
+        self.context = DialogueContext()
+        self.context.add(f'{self.participants[0].name} wants to {self.command}. The dialogue just started.')
+        # The lines of the dialogue so far
+        self.dialogue_history = self.context.lines
         # get a list of all characters in the conversation
         self.characters_mentioned = [character.name for character in self.participants]  # Characters mentioned so far in the dialogue
 
@@ -46,8 +94,7 @@ class Dialogue:
             self.update_system_instruction(participant)
             self.update_user_instruction(participant,
                                          update_impressions=True,
-                                         update_memories=True,
-                                         system_instruction_token_count=self.get_system_instruction(participant)[0])
+                                         update_memories=True)
 
     def _set_up_gpt(self):
         model_params = {
@@ -56,10 +103,25 @@ class Dialogue:
             "max_tokens": 250,
             "temperature": 1,
             "top_p": 1,
-            "max_retries": 5
+            "max_retries": 5,
+            "priority": RequestPriority.CRITICAL
         }
 
-        return GptCallHandler(**model_params) 
+        return GptCallHandler.get_shared(**model_params)
+
+    def _set_up_encoder_gpt(self):
+        # JSON mode is only supported by the turbo models
+        model_params = {
+            "api_key_org": "Helicone",
+            "model": "gpt-4-turbo-preview",
+            "max_tokens": 400,
+            "temperature": 0,
+            "top_p": 1,
+            "max_retries": 5,
+            "response_format": {"type": "json_object"}
+        }
+
+        return GptCallHandler.get_shared(**model_params)
 
     def get_user_instruction(self, character):
         """
@@ -67,12 +129,8 @@ class Dialogue:
         string representation.
         """
 
-        # get this character's dictionary of system prompt components
-        char_inst_comp = self.characters_user[character.name]
-
-        # return a tuple containing the system instructions token count and string representation
-        return (char_inst_comp['impressions'][0] + char_inst_comp['memories'][0] + char_inst_comp['dialogue_history'][0],
-                char_inst_comp['impressions'][1] + char_inst_comp['memories'][1] + char_inst_comp['dialogue_history'][1])
+        # return a tuple containing the user instructions token count and string representation
+        return self.characters_user[character.name]['instruction']
 
     def get_system_instruction(self, character):
         """
@@ -87,36 +145,30 @@ class Dialogue:
         return (char_inst_comp['intro'][0],
                 char_inst_comp['intro'][1])
 
-    def update_user_instruction(self, character, update_impressions=False, update_memories=False,
-                                 system_instruction_token_count=0):
+    def update_user_instruction(self, character, update_impressions=False, update_memories=False):
         """This method constructs and updates the user instructions which include
         the impressions, the memory and the dialog history.
-        Currently, the impressions are also passed in without being shortened. The memories are
-        reduced if necessary to fit into GPT's context. Note that these aren't returned, but
-        rather are stored in the characters system dictionary as a dictionary of lists.
-        Each component serves as a dictionary key, and its value is a list where the first
-        index is the component's token count and the second is its string representation.
+        The impressions and memories are only gathered and packed (see PromptBudget) when asked to,
+        e.g. when a new character is mentioned; the memories may take up to half of the space left
+        after the impressions. On every other line, only the window of the dialogue that fits in the
+        rest of the space is updated, from the per-line token counts kept by the DialogueContext.
+        Note that these aren't returned, but rather are stored in the characters user dictionary:
+        the impressions and memories as lists, and the instruction as a (token count, string) tuple.
 
         Args:
-            character (_type_): _description_
-            impressions (bool, optional): _description_. Defaults to True.
-            memories (bool, optional): _description_. Defaults to True.
+            character (Character): the character whose user instructions are being updated
+            update_impressions (bool, optional): get the character's impressions again. Defaults to False.
+            update_memories (bool, optional): retrieve the character's memories again. Defaults to False.
         """
+        char_user = self.characters_user[character.name]
 
         ### IMPRESSIONS OF OTHER CHARACTERS###
         if update_impressions:
             # get impressions of the other game characters
             try:
-                impressions = character.impressions.get_multiple_impressions(self.game.characters.values())
-                impressions = "YOUR IMPRESSIONS OF OTHERS:\n" + "\n".join(impressions) + "\n\n"
-
-                # get the impressions token count
-                impressions_token_count = get_prompt_token_count(content=impressions, role=None, pad_reply=False)
-
-                # update the character's impressions in the characters system dictionary
-                self.characters_user[character.name]['impressions'] = (impressions_token_count, impressions)
+                char_user['impressions'] = character.impressions.get_multiple_impressions(self.game.characters.values())
             except AttributeError:
-                self.characters_user[character.name]['impressions'] = (0, "")
+                char_user['impressions'] = []
 
         ### MEMORIES OF CHARACTERS IN DIALOGUE/MENTIONED ###
 
@@ -128,55 +180,59 @@ class Dialogue:
 
             # get the 25 most recent/relevant/important memories
             context_list = retrieve(self.game, character, query, n=25)
+            char_user['memories'] = [m + "\n" for m in context_list or []]
 
-            # if there are memories to include in the system prompt
-            if context_list:
-
-                # include primer message at 0th index in list
-                context_list = ["These are select MEMORIES in ORDER from MOST to LEAST RELEVANT:\n"] + [m+"\n" for m in list(context_list)]
-
-                impressions_token_count = self.characters_user[character.name]['impressions'][0]
-
-                # limit memories to fit in GPT's context by trimming less recent/relevant/important memories
-                memories_limited = limit_context_length(history=context_list,
-                                                        max_tokens=self.model_context_limit - \
-                                                        self.characters_user[character.name]['impressions'][0] - \
-                                                        system_instruction_token_count - \
-                                                        self.dialogue_history_token_count - 5 - \
-                                                        self.gpt_handler.max_tokens,
-                                                        keep_most_recent=False)
-
-                # convert the list of limited memories into a single string
-                memories_limited_str = "".join([f"{m}\n" for m in memories_limited])
-
-                # get the limited memories token count
-                memories_limited_token_count = get_prompt_token_count(content=memories_limited_str, role=None, pad_reply=False)
-
-                # update the character's memories in the characters system dictionary
-                self.characters_user[character.name]['memories'] = (memories_limited_token_count, memories_limited_str)
-            
-            else:
-                self.characters_user[character.name]['memories'] = (2, "No memories")
-
-        # update dialogue history
-        # limit the number of dialogue messages (if necessary, trimming from the start) to fit into GPT's context
-        limited_dialog = limit_context_length(history=self.get_dialogue_history_list(),
-                                              max_tokens=self.model_context_limit - \
-                                              system_instruction_token_count - \
-                                              self.characters_user[character.name]['impressions'][0] - \
-                                              self.characters_user[character.name]['memories'][0] - \
-                                              self.gpt_handler.max_tokens)
-
-        # get the limited dialogue as a string
-        dialog_str = '\n'.join(limited_dialog)
-
-        # update the dialog history with the current token count being passed to GPT
-        dialogue_history_token_count = get_prompt_token_count(content=dialog_str, role=None, pad_reply=False)
+        if update_impressions or update_memories or 'prefix' not in char_user:
+            self._pack_user_context(character)
 
+        # limit the number of dialogue messages (trimming from the start) to the space that is left
+        dialogue_lines, dialogue_token_count = self.context.window(char_user['dialogue_budget'])
         dialogue_history_prompt = dp.gpt_dialogue_user_prompt.format(character=character.name,
-                                                                     dialogue_history=dialog_str)
+                                                                     dialogue_history='\n'.join(dialogue_lines))
         
-        self.characters_user[character.name]['dialogue_history'] = (dialogue_history_token_count, dialogue_history_prompt)
+        char_user['instruction'] = (char_user['prefix_token_count'] + dialogue_token_count,
+                                    char_user['prefix'] + dialogue_history_prompt)
+
+    def _pack_user_context(self, character, scale=1.0):
+        """
+        Fit the character's impressions and memories into GPT's context, and work out how many
+        tokens are left for the dialogue history.
+
+        Args:
+            character (Character): the character whose user instructions are being packed
+            scale (float, optional): share of the context left after the fixed text that the impressions, 
+                                     memories and dialogue may use (see PromptBudget). Defaults to 1.0.
+        """
+        char_user = self.characters_user[character.name]
+        impressions_header = "YOUR IMPRESSIONS OF OTHERS:\n"
+        memories_header = "These are select MEMORIES in ORDER from MOST to LEAST RELEVANT:\n"
+        dialogue_prompt = dp.gpt_dialogue_user_prompt.format(character=character.name, dialogue_history="")
+
+        budget = PromptBudget(self.gpt_handler, 
+                              system=self.get_system_instruction(character)[1],
+                              system_tokens=self.characters_system[character.name]['intro_content_tokens'],
+                              scale=scale)
+        budget.add_fixed(impressions_header, "\n\n", memories_header, dialogue_prompt)
+        budget.add_section("impressions", char_user['impressions'], priority=0)
+        # limit memories to fit in GPT's context by trimming less recent/relevant/important memories
+        budget.add_section("memories",
+                           char_user['memories'],
+                           priority=1,
+                           max_tokens=budget.available // 2,
+                           keep_most_recent=False)
+        packed = budget.pack()
+
+        prefix = ""
+        if packed["impressions"]:
+            prefix += impressions_header + "\n".join(packed["impressions"]) + "\n\n"
+        if packed["memories"]:
+            prefix += memories_header + "".join([f"{m}\n" for m in packed["memories"]])
+        else:
+            prefix += "No memories"
+
+        char_user['prefix'] = prefix
+        char_user['prefix_token_count'] = get_prompt_token_count(content=[prefix, dialogue_prompt])
+        char_user['dialogue_budget'] = budget.remaining
 
     def update_system_instruction(self, character):
         """
@@ -200,14 +256,16 @@ class Dialogue:
         """
 
         ### REQUIRED START TO SYSTEM PROMPT (CAN'T TRIM) ###
-        intro = character.get_standard_info(self.game)
+        intro, intro_content_count = character.get_standard_info(self.game, return_token_count=True)
         
         # add dialogue instructions
         other_character = ', '.join([x.name for x in self.participants if x.name != character.name])
-        intro += dp.gpt_dialogue_system_prompt.format(other_character=other_character)
+        instructions = dp.gpt_dialogue_system_prompt.format(other_character=other_character)
+        intro += instructions
+        intro_content_count += count_tokens(instructions)
 
         # get the system prompt intro token count
-        intro_token_count = get_prompt_token_count(content=intro, role='system', pad_reply=False)
+        intro_token_count = intro_content_count + get_prompt_token_count(role='system', pad_reply=False)
 
         # account for the number of tokens in the resulting role (just the word 'user'),
         # including a padding for GPT's reply containing <|start|>assistant<|message|>
@@ -215,6 +273,7 @@ class Dialogue:
 
         # update the character's intro in the characters system dictionary
         self.characters_system[character.name]['intro'] = (intro_token_count, intro)
+        self.characters_system[character.name]['intro_content_tokens'] = intro_content_count
         
     def get_dialogue_history_list(self):
         return self.dialogue_history
@@ -225,7 +284,7 @@ class Dialogue:
 
 
     def add_to_dialogue_history(self, message):
-        self.dialogue_history.append(message)
+        self.context.add(message)
 
 
     def get_gpt_response(self, character):
@@ -234,47 +293,102 @@ class Dialogue:
         based on their stored system prompt in characters system as well as
         the dialogue history, which is included as a user message. 
 
+        If GPT rejects the request (e.g. by the content filter), it is sent once more with fewer
+        impressions, memories and lines of dialogue. If that is rejected too, the character leaves
+        the conversation rather than stopping the game.
+
         Args:
             character (Character): the character whose system instructions are
                                    being retrieved
 
-        Raises:
-            Exception: _description_
+        Returns:
+            str: the character's line of dialogue
         """
+        response = self._stream_response(character)
+        if isinstance(response, tuple):
+            self._pack_user_context(character, scale=RETRY_BUDGET_SCALE)
+            self.update_user_instruction(character)
+            response = self._stream_response(character)
+            # later lines get the full context again
+            self._pack_user_context(character)
+
+        if isinstance(response, tuple):
+            _, info = response
+            print(f"GPT rejected the dialogue prompt of {character.name} ({info}).")
+            return f"{LEAVE_PHRASE}."
 
-        # Get the system instruction token count and string representation.
-        # To change this, pass in True to any system prompt components that we want to update
-        system_instruction_token_count, system_instruction_str = self.get_system_instruction(character=character)
-        user_instruction_token_count, user_instruction_str = self.get_user_instruction(character=character)
-
-        # if the sum of the system prompt and dialogue history token counts exceeds the max tokens
-        if system_instruction_token_count + user_instruction_token_count >= self.model_context_limit:
-
-            # reduce the max token count by the dialogue count, and reduce the number of memories included in the prompt
-            self.model_context_limit = self.model_context_limit - user_instruction_token_count
-            self.update_user_instruction(character,
-                                         update_impressions=False,
-                                         update_memories=True,
-                                         system_instruction_token_count=system_instruction_token_count)
-            system_instruction_token_count, system_instruction_str = self.get_system_instruction(character=character,
-                                                                                                 memories=True)
-
-        # get GPT's response
-        response = self.gpt_handler.generate(
+        return response
+
+    def _stream_response(self, character):
+        """
+        Send the character's current instructions and stream the response to the console.
+
+        Returns:
+            str | tuple: the response, or the (False, info) tuple of a rejected request
+        """
+        # Get the system and user instruction strings; the user instruction was packed to fit
+        # into GPT's context along with the system instruction (see update_user_instruction)
+        _, system_instruction_str = self.get_system_instruction(character=character)
+        _, user_instruction_str = self.get_user_instruction(character=character)
+
+        # stream GPT's response to the console as it comes in, and stop it once the character leaves
+        print(f"{character.name} said: ", end="", flush=True)
+        response = self.gpt_handler.generate_stream(
             system=system_instruction_str,
-            user=user_instruction_str
+            user=user_instruction_str,
+            stop_phrases=[LEAVE_PHRASE],
+            on_text=lambda text: print(text, end="", flush=True)
         )
+        print()
+        return response
 
-        if isinstance(response, tuple):
-            print("Bad Request Error")
-            # This occurs when there was a Bad Request Error cause for exceeding token limit
-            success, token_difference = response
-            # Add this offset to the calculations of token limits and pad it 
-            self.token_offset = token_difference + self.offset_pad
-            self.offset_pad += 2 * self.offset_pad 
-            return self.get_gpt_response(character)
+    def encode_memories(self, max_facts=3):
+        """
+        Turn the finished conversation into memories with a single call to GPT: a summary,
+        its importance, and the facts each participant took from it.
+        If the whole dialogue doesn't fit into GPT's context, its most recent lines are used.
 
-        return response
+        Args:
+            max_facts (int, optional): the most facts to keep per participant. Defaults to 3.
+
+        Returns:
+            dict | None: {"summary": str, "importance": int, "facts": {name: [str]}},
+                         or None if GPT's response couldn't be used
+        """
+        gpt_handler = self._set_up_encoder_gpt()
+        system = dp.gpt_dialogue_memory_system_prompt.format(
+            participants=', '.join([c.name for c in self.speakers]),
+            max_facts=max_facts
+        )
+        budget = PromptBudget(gpt_handler, system=system)
+        budget.add_fixed(dp.gpt_dialogue_memory_user_prompt.format(dialogue_history=""))
+        dialogue_lines, _ = self.context.window(budget.remaining)
+        user = dp.gpt_dialogue_memory_user_prompt.format(dialogue_history='\n'.join(dialogue_lines))
+
+        response = gpt_handler.generate(system=system, user=user)
+        if not isinstance(response, str):
+            return None
+        try:
+            encoded = json.loads(response)
+            summary = encoded["summary"]
+            importance = int(encoded.get("importance", 0))
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+            return None
+        if not isinstance(summary, str) or not summary:
+            return None
+
+        facts = {}
+        raw_facts = encoded.get("facts")
+        raw_facts = raw_facts if isinstance(raw_facts, dict) else {}
+        for character in self.speakers:
+            character_facts = raw_facts.get(character.name) or []
+            if not isinstance(character_facts, list):
+                character_facts = [character_facts]
+            facts[character.name] = [f for f in character_facts if isinstance(f, str) and f][:max_facts]
+
+        return {"summary": summary,
+                "importance": min(max(importance, 1), 10),
+                "facts": facts}
 
     def is_dialogue_over(self):
         if len(self.participants) <= 1:
@@ -288,30 +402,24 @@ class Dialogue:
             for character in self.participants:
                 # Get last line of dialogue and if any new characters are mentioned update system prompts
                 last_line = self.dialogue_history[-1]
-                keywords = self.game.parser.extract_keywords(last_line).get("characters", None)
+                mentioned = self.game.parser.find_character_mentions(last_line)
                 update_memories = False
-                if keywords:
-                    for k in keywords:
-                        if k not in self.characters_mentioned:
-                            update_memories = True
-                            self.characters_mentioned.append(k)
+                for name in mentioned:
+                    if name not in self.characters_mentioned:
+                        update_memories = True
+                        self.characters_mentioned.append(name)
 
                 self.update_user_instruction(character,
                                              update_impressions=False,
-                                             update_memories=update_memories,
-                                             system_instruction_token_count=self.get_system_instruction(character)[0])
+                                             update_memories=update_memories)
                 # Get GPT response
                 response = self.get_gpt_response(character)
                 response = f"{character.name} said: " + response
-                print(response)
+                # counted once here; later prompts reuse the count (see DialogueContext)
                 self.add_to_dialogue_history(response)
 
-                # update the dialog history token count with the latest reply
-                # response_token_count = get_prompt_token_count(content=response, role=None, pad_reply=False)
-                # self.dialogue_history_token_count += response_token_count
-
                 # End conversation if a character leaves
-                if "I leave the conversation" in response:
+                if LEAVE_PHRASE in response:
                     self.participants.remove(character)
                     print("The conversation is over")
                     break
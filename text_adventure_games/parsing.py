@@ -6,14 +6,13 @@ and performs the actions that the player intends.  This is the module with
 the most potential for improvement using modern natural language processing.
 The implementation that I have given below only uses simple keyword matching.
 """
-from typing import TYPE_CHECKING
-from collections import defaultdict
+from typing import TYPE_CHECKING, ClassVar
+from collections import defaultdict, OrderedDict
 import inspect
 import textwrap
 import re
 import json
-import tiktoken
-import spacy
+import threading
 from jellyfish import jaro_winkler_similarity, levenshtein_distance
 
 from .things import Character
@@ -21,18 +20,25 @@ if TYPE_CHECKING:
     from .things import Item, Location
     from text_adventure_games.things.base import Thing
 from . import actions
-from .utils.general import normalize_name
+from .utils.general import normalize_name, enumerate_dict_options, get_nlp_model, get_text_embeddings
+from .assets.prompts import parser_prompts as pp
 from text_adventure_games.actions.base import ActionSequence
 # from .gpt.parser_kani import DescriptorKani
 from .gpt.gpt_helpers import (GptCallHandler,
+                              count_tokens,
+                              get_tokenizer,
                               limit_context_length,
                               gpt_get_action_importance,
                               gpt_get_summary_description_of_action,
                               gpt_pick_an_option,
                               get_prompt_token_count,
                               get_token_remainder)
+from .gpt.scheduler import RequestPriority
 from .agent.memory_stream import MemoryType
 
+# Returned by dict.get for a key that isn't in the resolution cache
+_MISSING = object()
+
 
 class Parser:
     """
@@ -50,6 +56,11 @@ class Parser:
 
         # Build default scope of actions
         self.actions = game.default_actions()
+        # Incremented whenever the actions change; see get_action_menu
+        self.actions_version = 0
+        self._action_menu_cache = None
+        # (roster, compiled pattern, variant -> name); see find_character_mentions
+        self._mention_matcher = None
 
         # Build default scope of blocks
         self.blocks = game.default_blocks()
@@ -103,6 +114,23 @@ class Parser:
         Add an Action class to the list of actions a parser can use
         """
         self.actions[action.action_name()] = action
+        self.actions_version += 1
+
+    def get_action_menu(self):
+        """
+        Get the numbered list of action names shown to agents, and its token count.
+        Both are cached until the parser's actions change.
+
+        Returns:
+            tuple[str, int]: the action menu and its token count
+        """
+        cached = self._action_menu_cache
+        if cached is None or cached[0] != self.actions_version:
+            # Added inverted argument because the game actions are inverted
+            menu, _ = enumerate_dict_options(self.actions, names_only=True, inverted=True)
+            cached = (self.actions_version, menu, count_tokens(menu))
+            self._action_menu_cache = cached
+        return cached[1], cached[2]
 
     def add_block(self, block):
         """
@@ -113,6 +141,7 @@ class Parser:
 
     def init_actions(self):
         self.actions = {}
+        self.actions_version += 1
         for member in dir(actions):
             attr = getattr(actions, member)
             if inspect.isclass(attr) and issubclass(attr, actions.Action):
@@ -253,6 +282,76 @@ class Parser:
                 return self.game.characters[name]
         return self.game.player
     
+    def find_character_mentions(self, text: str) -> list[str]:
+        """
+        Find the characters named in a piece of text, by full name (with or without titles
+        like "Dr.") or by a first or last name that only one character has. A name of a single
+        word, like "Will" or "Hope", only counts when it is capitalized, so that it isn't found
+        in every sentence that uses the word.
+        Unlike extract_keywords, this needs no spaCy parse: all of the names are matched by
+        one regex, which is compiled again only when the roster changes.
+
+        Returns:
+            list[str]: the names of the characters mentioned, in order of first mention
+        """
+        if not text:
+            return []
+        roster = tuple(sorted(self.game.characters))
+        matcher = self._mention_matcher
+        if matcher is None or matcher[0] != roster:
+            matcher = (roster, *self._build_mention_matcher(roster))
+            self._mention_matcher = matcher
+        _, pattern, variants = matcher
+        if pattern is None:
+            return []
+
+        mentioned = []
+        for match in pattern.finditer(text):
+            words = match.group(0).split()
+            if len(words) == 1 and not words[0][0].isupper():
+                continue
+            name = variants[" ".join("".join(c for c in word if c.isalnum()) for word in words).lower()]
+            if name not in mentioned:
+                mentioned.append(name)
+        return mentioned
+
+    @staticmethod
+    def _build_mention_matcher(names):
+        # Variants come from normalize_name alone: they start and end with a letter or digit,
+        # so \b holds at both ends (it never does after a trailing "." at the end of the text).
+        # The pattern puts back what normalize_name drops inside a name: apostrophes and hyphens
+        # between letters, as in "O'Brien", and any whitespace between words.
+        variants = {}
+        shared = set()
+        parts_to_names = defaultdict(set)
+        for name in names:
+            norm_name = normalize_name(name)
+            if not norm_name:
+                continue
+            if variants.setdefault(norm_name, name) != name:
+                # Two characters are the same name once titles are dropped
+                shared.add(norm_name)
+            parts = norm_name.split()
+            for part in {parts[0], parts[-1]}:
+                parts_to_names[part].add(name)
+        for norm_name in shared:
+            del variants[norm_name]
+        for part, part_names in parts_to_names.items():
+            # Skip parts shared by several characters, and initials
+            if len(part_names) == 1 and len(part) > 1:
+                variants.setdefault(part, next(iter(part_names)))
+        if not variants:
+            return None, variants
+        # Longest first, so that a full name wins over the first name it starts with
+        alternatives = sorted(variants, key=len, reverse=True)
+        pattern = re.compile(r"\b(?:{})\b".format("|".join(Parser._mention_pattern(v) for v in alternatives)),
+                             re.IGNORECASE)
+        return pattern, variants
+
+    @staticmethod
+    def _mention_pattern(variant):
+        return r"\s+".join(r"[^\w\s]?".join(map(re.escape, word)) for word in variant.split())
+
     def check_if_character_exists(self, name):
         # First O(1) check for a perfect fit
         if name in self.game.characters:
@@ -351,11 +450,12 @@ class Parser:
 
 
 class GptParser(Parser):
+    # spaCy doesn't guarantee that a pipeline can be called from several threads at once
+    _nlp_lock: ClassVar = threading.Lock()
+
     def __init__(self, game, echo_commands=True, verbose=False):
         super().__init__(game, echo_commands=echo_commands)
         self.verbose = verbose
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
-        self.nlp = spacy.load('en_core_web_sm')
         self.gpt_handler = self._set_up_gpt()
         self.max_input_tokens = self.gpt_handler.model_context_limit
         self.narrator_turn_limit = 5
@@ -372,6 +472,16 @@ class GptParser(Parser):
 
         return GptCallHandler(**model_params) 
     
+    @property
+    def tokenizer(self):
+        # shared by the process and loaded on first use
+        return get_tokenizer()
+
+    @property
+    def nlp(self):
+        # shared by the process and loaded on first use
+        return get_nlp_model()
+
     def get_handler(self):
         if self.gpt_handler:
             return self.gpt_handler
@@ -382,7 +492,8 @@ class GptParser(Parser):
     def gpt_describe(self, 
                      system_instructions, 
                      command_history,
-                     extra_description=None
+                     extra_description=None,
+                     priority=None
                      ):
         """
         TODO: should the context for each description be more limited to focus on recent actions?
@@ -395,6 +506,7 @@ class GptParser(Parser):
         `add_command_to_history` and `add_description_to_history` functions
         which use the ChatGPT format with commands being assigned role: user,
         and descriptions being assigned role: assistant.
+        The optional priority is the request priority of the call (see gpt.scheduler).
         """
         
         try:
@@ -428,14 +540,17 @@ class GptParser(Parser):
             messages.extend(context)
             if self.verbose:
                 print(json.dumps(messages, indent=2))
-            response = self.gpt_handler.generate(messages=messages)
+            response = self.gpt_handler.generate(messages=messages, priority=priority)
             return response
         except Exception as e:
             return f"Something went wrong with GPT: {e}"
     
     def create_action_statement(self, command: str, description: str, character: Character):
         outcome = f"ACTOR: {character.name}; LOCATION: {character.location.name}, ACTION: {command}; OUTCOME: {description}"
-        summary = gpt_get_summary_description_of_action(outcome, call_handler=self.gpt_handler, max_tokens=256)
+        summary = gpt_get_summary_description_of_action(outcome, 
+                                                        call_handler=self.gpt_handler, 
+                                                        max_tokens=256, 
+                                                        priority=RequestPriority.BACKGROUND)
         return summary
 
     def extract_keywords(self, text):
@@ -444,7 +559,8 @@ class GptParser(Parser):
         custom_stopwords = {"he", "it", "i", "you", "she", "they", "we", "us", 
                             "'s", "this", "that", "these", "those", "them"}
 
-        doc = self.nlp(text)
+        with self._nlp_lock:
+            doc = self.nlp(text)
         keys = defaultdict(set)
         for w in doc:
             if w.text.lower() in custom_stopwords:
@@ -485,7 +601,8 @@ class GptParser(Parser):
             importance_of_action = gpt_get_action_importance(action_statement,
                                                              call_handler=self.gpt_handler, 
                                                              max_tokens=10,
-                                                             top_p=0.25)
+                                                             top_p=0.25,
+                                                             priority=RequestPriority.BACKGROUND)
         else:
             importance_of_action = 0
         keywords = self.extract_keywords(action_statement)
@@ -532,6 +649,39 @@ class GptParser(Parser):
                                    memory_type=type,
                                    actor_id=character.id)
 
+    def add_dialogue_to_history(self, command, starter, speakers, memories):
+        """
+        Add a conversation, encoded by Dialogue.encode_memories, to the command history and to memories.
+        Everyone who spoke in or saw the conversation remembers its summary, and each speaker
+        also remembers the facts they took from it. All of the new memories are embedded in one batch.
+
+        Args:
+            command (str): the command that started the conversation
+            starter (Character): the character who started it
+            speakers (list[Character]): everyone who took part, including those who left early (Dialogue.speakers)
+            memories (dict): the summary, importance and facts of each speaker
+        """
+        super().add_command_to_history(f"{starter.name}'s action: {command}")
+
+        summary = memories["summary"].lower()
+        witnesses = [c for c in starter.chars_in_view if c not in speakers]
+        new_memories = [(character, summary) for character in list(speakers) + witnesses]
+        for character in speakers:
+            new_memories.extend((character, fact.lower()) for fact in memories["facts"].get(character.name, []))
+
+        embeddings = get_text_embeddings([description for _, description in new_memories])
+        for (character, description), embedding in zip(new_memories, embeddings):
+            character.memory.add_memory(round=self.game.round,
+                                        tick=self.game.tick,
+                                        description=description,
+                                        keywords={"characters": self.find_character_mentions(description)},
+                                        location=starter.location.name,
+                                        success_status=True,
+                                        memory_importance=memories["importance"],
+                                        memory_type=MemoryType.DIALOGUE.value,
+                                        actor_id=starter.id,
+                                        embedding=embedding)
+
     def ok(self, command: str, description: str, thing: "Thing") -> None:
         """
         Logs a successful command and the description of its outcome.
@@ -611,7 +761,10 @@ class GptParser(Parser):
             ]
         )
 
-        response = self.gpt_describe(system_instructions, self.command_history, extra_description=description)
+        response = self.gpt_describe(system_instructions, 
+                                     self.command_history, 
+                                     extra_description=description, 
+                                     priority=RequestPriority.BACKGROUND)
 
         # FIRST: we add summarize the FAILED action and send it as a memory to the appropriate characters
         if isinstance(thing, Character):
@@ -620,7 +773,8 @@ class GptParser(Parser):
             importance_of_action = gpt_get_action_importance(response,
                                                              call_handler=self.gpt_handler, 
                                                              max_tokens=10,
-                                                             top_p=0.25)
+                                                             top_p=0.25,
+                                                             priority=RequestPriority.BACKGROUND)
             keywords = self.extract_keywords(response)
             
             # Make sure that the Narrator GPT knows about the character names 
@@ -679,8 +833,171 @@ class GptParser2(GptParser):
 
 
 class GptParser3(GptParser2):
+    # Resolutions are shared by every parser in the process (and so across games).
+    # Keys hold the normalized command, the hint, and a fingerprint of the scope the
+    # command was resolved against; values hold names rather than game objects.
+    resolution_cache: ClassVar[OrderedDict] = OrderedDict()
+    resolution_cache_size: ClassVar[int] = 2048
+    # Guards the cache and its counters, which worker threads of every game share
+    _cache_lock: ClassVar[threading.Lock] = threading.Lock()
+    cache_hits: ClassVar[int] = 0
+    cache_misses: ClassVar[int] = 0
+
+    # Connections that are common words in commands only count when the command ends in them
+    PREPOSITION_DIRECTIONS: ClassVar[set] = {"in", "out", "up", "down"}
+    DIRECTION_ALIASES: ClassVar[dict] = {"n": "north", "s": "south", "e": "east", "w": "west"}
+
     def __init__(self, game, echo_commands=True, verbose=False):
         super().__init__(game, echo_commands, verbose)
+        # How each character, item, and direction match of this game was resolved.
+        # Updated under _cache_lock, since agents' turns may run on worker threads.
+        self.resolution_stats = {"fast_path": 0, "cache": 0, "gpt": 0}
+
+    @classmethod
+    def get_resolution_cache_stats(cls):
+        with cls._cache_lock:
+            return {"hits": cls.cache_hits, "misses": cls.cache_misses, "size": len(cls.resolution_cache)}
+
+    def get_resolution_stats(self):
+        with GptParser3._cache_lock:
+            return dict(self.resolution_stats)
+
+    def set_resolution_stats(self, stats):
+        # Used when resuming a game from a checkpoint
+        with GptParser3._cache_lock:
+            self.resolution_stats = dict(stats)
+
+    def _count_resolution(self, kind: str):
+        with GptParser3._cache_lock:
+            self.resolution_stats[kind] += 1
+
+    @staticmethod
+    def _mentions(command: str, phrase: str) -> bool:
+        # whole word/phrase match, so "stick" doesn't match "lipstick"
+        return re.search(r"\b{}\b".format(re.escape(phrase.lower())), command) is not None
+
+    def _record_fast_path(self, command: str, kind: str):
+        self._count_resolution("fast_path")
+        if self.verbose:
+            print(f"Resolved the {kind} in '{command}' without GPT.")
+
+    def _fast_match_character(self, command: str, hint: str = None) -> Character:
+        """
+        Match a character mentioned by full name, or by a first or last name that
+        only one character has. Returns None when no single character is named.
+        With a hint, the hint has to name the same character; otherwise the role it
+        describes is left to GPT.
+        """
+        match = self._match_character_name(command)
+        if hint and match is not self._match_character_name(hint):
+            return None
+        return match
+
+    def _match_character_name(self, command: str) -> Character:
+        command = command.lower()
+        matched = set()
+        for name in self.game.characters:
+            if self._mentions(command, name):
+                matched.add(name)
+        if not matched:
+            parts_to_names = defaultdict(set)
+            for name in self.game.characters:
+                parts = name.lower().split()
+                for part in {parts[0], parts[-1]}:
+                    parts_to_names[part].add(name)
+            for part, names in parts_to_names.items():
+                if len(names) == 1 and self._mentions(command, part):
+                    matched.update(names)
+        if len(matched) == 1:
+            return self.game.characters[matched.pop()]
+        return None
+
+    def _fast_match_item(self, command: str, item_dict: dict[str, "Item"], hint: str = None) -> "Item":
+        """
+        Match the single item whose full name appears in the command.
+        Returns None if no item or several items are named, or if a hint is
+        given that doesn't name the same item.
+        """
+        match = self._match_item_name(command, item_dict)
+        if hint and match is not self._match_item_name(hint, item_dict):
+            return None
+        return match
+
+    def _match_item_name(self, command: str, item_dict: dict[str, "Item"]) -> "Item":
+        command = command.lower()
+        matched = [name for name in item_dict if self._mentions(command, name)]
+        if len(matched) == 1:
+            return item_dict[matched[0]]
+        return None
+
+    def _fast_match_direction(self, command: str, location: "Location") -> str:
+        """
+        Match a direction in location.connections by its name, a one-letter alias,
+        or the name of the location it leads to. Returns None unless exactly one
+        exit is indicated.
+        """
+        if not location:
+            return None
+        command = " ".join(command.lower().split())
+        words = command.split()
+        matched = set()
+        for direction, to_loc in location.connections.items():
+            direction_lower = direction.lower()
+            if direction_lower in self.PREPOSITION_DIRECTIONS:
+                if command == direction_lower or command.endswith(f"go {direction_lower}"):
+                    matched.add(direction)
+            elif self._mentions(command, direction_lower):
+                matched.add(direction)
+            if self._mentions(command, to_loc.name):
+                matched.add(direction)
+        for word in words:
+            alias = self.DIRECTION_ALIASES.get(word)
+            if alias in location.connections:
+                matched.add(alias)
+        if len(matched) == 1:
+            return matched.pop()
+        return None
+
+    @classmethod
+    def clear_resolution_cache(cls):
+        with cls._cache_lock:
+            cls.resolution_cache.clear()
+
+    @staticmethod
+    def _resolution_key(kind: str, command: str, hint: str, fingerprint: tuple) -> tuple:
+        normalized_command = " ".join(command.lower().split())
+        return (kind, normalized_command, hint, fingerprint)
+
+    def _get_cached_resolution(self, key):
+        """
+        Look up a previous resolution of this command against the same scope.
+
+        Returns:
+            tuple: (found, name) where name is the cached character name, item name, or direction
+        """
+        cache = GptParser3.resolution_cache
+        with GptParser3._cache_lock:
+            name = cache.get(key, _MISSING)
+            if name is _MISSING:
+                GptParser3.cache_misses += 1
+                return False, None
+            cache.move_to_end(key)
+            GptParser3.cache_hits += 1
+            self.resolution_stats["cache"] += 1
+        if self.verbose:
+            print(f"Resolved '{key[1]}' from the parser cache.")
+        return True, name
+
+    def _cache_resolution(self, key, name):
+        # Don't cache failed matches; they may be transient GPT errors
+        if name is None:
+            return
+        cache = GptParser3.resolution_cache
+        with GptParser3._cache_lock:
+            cache[key] = name
+            cache.move_to_end(key)
+            while len(cache) > GptParser3.resolution_cache_size:
+                cache.popitem(last=False)
 
     def get_character(
         self, command: str, character: Character = None, hint: str = None, split_words=None, position=None
@@ -697,6 +1014,21 @@ class GptParser3(GptParser2):
         This method tries to match a character's name in the command.
         If no names are matched, it defaults to the player.
         """
+        fast_match = self._fast_match_character(command, hint)
+        if fast_match:
+            self._record_fast_path(command, "character")
+            return fast_match
+
+        # The scope of a character match is the roster, where each character is
+        # (the prompt lists their locations) and the default character
+        roster = tuple((name, c.location.id if c.location else None)
+                       for name, c in sorted(self.game.characters.items()))
+        fingerprint = (roster, self.game.player.name)
+        cache_key = self._resolution_key("character", command, hint, fingerprint)
+        found, name = self._get_cached_resolution(cache_key)
+        if found and name in self.game.characters:
+            return self.game.characters[name]
+
         if self.verbose:
             print("Matching a character with GPT.")
         character_descriptions = {}
@@ -732,7 +1064,10 @@ class GptParser3(GptParser2):
             instructions += f"\nHint: the character you are looking for is the {hint}. "
         instructions += "\n\nThe possible characters are:"
 
-        return gpt_pick_an_option(instructions, character_descriptions, command, call_handler=self.gpt_handler, max_tokens=10)
+        self._count_resolution("gpt")
+        match = gpt_pick_an_option(instructions, character_descriptions, command, call_handler=self.gpt_handler, max_tokens=10)
+        self._cache_resolution(cache_key, match.name if match else None)
+        return match
 
     def match_item(
         self, command: str, item_dict: dict[str, "Item"], hint: str = None
@@ -749,6 +1084,19 @@ class GptParser3(GptParser2):
         Check whether the name any of the items in this dictionary match the
         command. If so, return Item, else return None.
         """
+        fast_match = self._fast_match_item(command, item_dict, hint)
+        if fast_match:
+            self._record_fast_path(command, "item")
+            return fast_match
+
+        # Any change to the contents of the location or inventory changes the fingerprint
+        fingerprint = tuple(sorted((name, item.location.name if item.location else None)
+                                   for name, item in item_dict.items()))
+        cache_key = self._resolution_key("item", command, hint, fingerprint)
+        found, name = self._get_cached_resolution(cache_key)
+        if found and name in item_dict:
+            return item_dict[name]
+
         if self.verbose:
             print("Matching an item with GPT.")
         instructions = "You are the parser for a text adventure game. For an input command try to match the item in the command."
@@ -772,13 +1120,31 @@ class GptParser3(GptParser2):
                 )
 
             item_descriptions[description] = item
-        return gpt_pick_an_option(instructions, item_descriptions, command, call_handler=self.gpt_handler, max_tokens=10)
+        self._count_resolution("gpt")
+        match = gpt_pick_an_option(instructions, item_descriptions, command, call_handler=self.gpt_handler, max_tokens=10)
+        self._cache_resolution(cache_key, match.name if match else None)
+        return match
 
     def get_direction(self, command: str, location: "Location" = None) -> str:
         """
         Return the direction from `location.connections` which the player
         wants to travel to.
         """
+        fast_match = self._fast_match_direction(command, location)
+        if fast_match:
+            self._record_fast_path(command, "direction")
+            return fast_match
+
+        if location:
+            fingerprint = (location.name, tuple(sorted((direction, to_loc.name)
+                                                       for direction, to_loc in location.connections.items())))
+        else:
+            fingerprint = None
+        cache_key = self._resolution_key("direction", command, None, fingerprint)
+        found, direction = self._get_cached_resolution(cache_key)
+        if found:
+            return direction
+
         if self.verbose:
             print("Matching a direction with GPT.")
         instructions = "".join(
@@ -809,7 +1175,208 @@ class GptParser3(GptParser2):
             "'down' can mean 'go down'": "down",
         }
         directions.update(other_directions)
-        return gpt_pick_an_option(instructions, directions, command, call_handler=self.gpt_handler, max_tokens=10)
+        self._count_resolution("gpt")
+        direction = gpt_pick_an_option(instructions, directions, command, call_handler=self.gpt_handler, max_tokens=10)
+        self._cache_resolution(cache_key, direction)
+        return direction
+
+
+class GptParser4(GptParser3):
+    """
+    Resolves the intent, target character, items, and direction of a command
+    with a single JSON-mode call to GPT instead of chaining one
+    gpt_pick_an_option call per slot. The Action is constructed with a
+    ResolvedCommandParser bound to the resolved slots, so the existing Action
+    constructors pick them up through get_character, match_item and get_direction.
+    Nothing about the command is kept on the parser, which is shared by the
+    threads of the two-phase and pipelined schedulers.
+
+    If the structured call fails or returns an unusable intent, parsing falls
+    back to the chained GptParser3 behavior. Actions that don't accept a parser
+    argument are also parsed with the chained matches.
+
+    Select it with run_game.py --parser=structured.
+    """
+    def __init__(self, game, echo_commands=True, verbose=False, model=None, json_mode=False):
+        """
+        Args:
+            model (str, optional): the model of the structured call. Defaults to the model of the 
+                                   parser's other calls (see GptParser._set_up_gpt).
+            json_mode (bool, optional): request OpenAI's JSON mode, which only some models support.
+                                        Otherwise the prompt asks for JSON. Defaults to False.
+        """
+        super().__init__(game, echo_commands, verbose)
+        self.structured_handler = self._set_up_structured_gpt(model, json_mode)
+
+    def _set_up_structured_gpt(self, model=None, json_mode=False):
+        model_params = {
+            "api_key_org": self.gpt_handler.api_key_org,
+            "model": model or self.gpt_handler.model,
+            "max_tokens": 100,
+            "temperature": 0,
+            "top_p": 1,
+            "max_retries": 5,
+            "response_format": {"type": "json_object"} if json_mode else None
+        }
+
+        return GptCallHandler(**model_params)
+
+    def parse_action(self, command: str, character: Character) -> actions.Action:
+        """
+        Resolve all slots of the command at once, then construct the matched
+        action with those slots available to its constructor.
+        """
+        command = command.lower().strip()
+        if command == "":
+            return None
+        slots = self.resolve_command(command, character)
+        if slots is None:
+            if self.verbose:
+                print("Structured parse failed. Falling back to chained matching.")
+            return super().parse_action(command, character)
+
+        action = self.actions[slots["intent"]]
+        if "parser" not in inspect.signature(action.__init__).parameters:
+            return super().parse_action(command, character)
+        return action(self.game, command, character, parser=ResolvedCommandParser(self, slots))
+
+    def resolve_command(self, command: str, character: Character) -> dict:
+        """
+        Ask GPT to resolve every slot of the command against the character's
+        current scope.
+
+        Args:
+            command (str): the command issued by the character
+            character (Character): the character issuing the command
+
+        Returns:
+            dict: the validated slots ("command", "intent", "character", "items",
+                  "direction") or None if the response could not be used.
+        """
+        if self.verbose:
+            print("Resolving the command with a single structured GPT call.")
+        commands_str, options_list = enumerate_dict_options(self.command_descriptions)
+        location = character.location
+        items_in_scope = self.get_items_in_scope(character)
+
+        characters_str = "\n".join([f"- {name}" for name in self.game.characters
+                                     if name != character.name]) or "None"
+        items_str = "\n".join([f"- {name} - {item.description}"
+                               for name, item in items_in_scope.items()]) or "None"
+        directions_str = "\n".join([f"- {direction} toward {to_loc.name}"
+                                    for direction, to_loc in location.connections.items()]) or "None"
+
+        system = pp.structured_parse_system_prompt.format(commands=commands_str,
+                                                          characters=characters_str,
+                                                          actor=character.name,
+                                                          items=items_str,
+                                                          directions=directions_str)
+        response = self.structured_handler.generate(system=system, user=command)
+        if not isinstance(response, str):
+            # A failed request or a context length error
+            return None
+
+        try:
+            parsed = json.loads(response)
+            intent_idx = int(parsed.get("intent"))
+        except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+            return None
+
+        if not 0 <= intent_idx < len(options_list):
+            return None
+        intent = self.command_descriptions[options_list[intent_idx]]
+        if intent not in self.actions:
+            return None
+
+        target_name = parsed.get("character")
+        if target_name not in self.game.characters:
+            target_name = None
+
+        item_names = parsed.get("items") or []
+        if not isinstance(item_names, list):
+            item_names = [item_names]
+        item_names = [name for name in item_names if isinstance(name, str) and name in items_in_scope]
+
+        direction = parsed.get("direction")
+        if direction not in location.connections:
+            direction = None
+
+        return {"command": command,
+                "intent": intent,
+                "character": target_name,
+                "items": item_names,
+                "direction": direction}
+
+    def get_character(
+        self, command: str, character: Character = None, hint: str = None, split_words=None, position=None,
+        slots: dict = None
+    ) -> Character:
+        """
+        Use the character resolved by the structured parse, falling back to
+        keyword matching when the parse did not name one.
+        """
+        if slots is None:
+            return super().get_character(command, character, hint, split_words, position)
+        target_name = slots["character"]
+        if target_name:
+            return self.game.characters[target_name]
+        return Parser.get_character(self, command, character)
+
+    def match_item(
+        self, command: str, item_dict: dict[str, "Item"], hint: str = None, slots: dict = None
+    ) -> "Item":
+        """
+        Use the items resolved by the structured parse. Actions often call this
+        with a short hint in place of the full command (e.g. "machete"), so a
+        resolved item must match that hint unless the full command was passed.
+        """
+        if slots is None:
+            return super().match_item(command, item_dict, hint)
+        command = command.lower()
+        candidates = [name for name in slots["items"] if name in item_dict]
+        for name in candidates:
+            if name in command or command in name:
+                return item_dict[name]
+        if candidates and command == slots["command"]:
+            return item_dict[candidates[0]]
+        for name in item_dict:
+            if name in command or command in name:
+                return item_dict[name]
+        return None
+
+    def get_direction(self, command: str, location: "Location" = None, slots: dict = None) -> str:
+        """
+        Use the direction resolved by the structured parse, falling back to
+        the alias matching of the base Parser.
+        """
+        if slots is None:
+            return super().get_direction(command, location)
+        return slots["direction"] or Parser.get_direction(self, command, location)
+
+
+class ResolvedCommandParser:
+    """
+    The parser as seen by the action built from one command resolved by GptParser4:
+    get_character, match_item and get_direction use the command's resolved slots,
+    and everything else goes to the parser.
+    """
+    def __init__(self, parser: GptParser4, slots: dict):
+        self.parser = parser
+        self.slots = slots
+
+    def __getattr__(self, name):
+        return getattr(self.parser, name)
+
+    def get_character(
+        self, command: str, character: Character = None, hint: str = None, split_words=None, position=None
+    ) -> Character:
+        return self.parser.get_character(command, character, hint, split_words, position, slots=self.slots)
+
+    def match_item(self, command: str, item_dict: dict[str, "Item"], hint: str = None) -> "Item":
+        return self.parser.match_item(command, item_dict, hint, slots=self.slots)
+
+    def get_direction(self, command: str, location: "Location" = None) -> str:
+        return self.parser.get_direction(command, location, slots=self.slots)
 
 
 # class GptParser3(GptParser2):
@@ -9,8 +9,8 @@ from ..agent.agent_cognition.act import Act
 from ..agent.agent_cognition.reflect import reflect 
 from ..agent.agent_cognition.impressions import Impressions
 from ..agent.agent_cognition.goals import Goals
-from ..agent.agent_cognition.perceive import percieve_location
-from ..gpt.gpt_helpers import context_list_to_string
+from ..agent.agent_cognition.perceive import draft_perceptions, commit_perceptions, get_location_observations
+from ..gpt.gpt_helpers import context_list_to_string, count_tokens
 
 # Used to map group to use_goals and use_impressions
 GROUP_MAPPING = {"A": (False, False),
@@ -158,6 +158,11 @@ class GenerativeAgent(Character):
         # Initialize Agent's memory
         self.memory = MemoryStream(self)
         self.last_location_observations = None
+        # Incremented each time this agent perceives its surroundings
+        self.perception_version = 0
+        # ((round, tick, game state version, perception version),
+        #  {(include_goals, include_perceptions): (standard info, token count)})
+        self._standard_info_cache = (None, {})
 
         # Track last conversation participant
         self.last_talked_to = None
@@ -197,15 +202,41 @@ class GenerativeAgent(Character):
 
         return context_list_to_string(perception_descriptions, sep="\n")
 
-    def get_standard_info(self, game, include_goals=True, include_perceptions=True):
+    def get_standard_info(self, game, include_goals=True, include_perceptions=True, return_token_count=False):
         """
         Get standard context for this agent
         Includes: world info, persona summary, and (if invoked) goals
 
+        The summary and its token count are cached until the tick, the game's state version
+        or this agent's perceptions change, since most prompts in a tick start with it.
+
+        Args:
+            return_token_count (bool, optional): also return the token count of the summary. Defaults to False.
+
         Returns:
             str: a standard summary paragraph for this agent and the world.
         """
-        summary = f"WORLD INFO: {game.world_info}\n"
+        stamp = (game.round, game.tick, getattr(game, "state_version", 0), self.perception_version)
+        cached_stamp, cache = self._standard_info_cache
+        if cached_stamp != stamp:
+            cache = {}
+            self._standard_info_cache = (stamp, cache)
+
+        key = (include_goals, include_perceptions)
+        if key not in cache:
+            summary = self._build_standard_info(game, include_goals, include_perceptions)
+            cache[key] = (summary, count_tokens(summary))
+        summary, token_count = cache[key]
+        if return_token_count:
+            return summary, token_count
+        return summary
+
+    def _build_standard_info(self, game, include_goals, include_perceptions):
+        if hasattr(game, "get_world_info"):
+            world_info = game.get_world_info(self)
+        else:
+            world_info = game.world_info
+        summary = f"WORLD INFO: {world_info}\n"
         summary += f"You are {self.persona.get_personal_summary()}.\n"
         if self.use_goals and include_goals:
             goals = self.get_goals(round=game.round, as_str=True)
@@ -234,6 +265,25 @@ class GenerativeAgent(Character):
         if game.tick == 0 and self.use_goals: 
             # print(f"Setting goal for {self.name}")
             self.goals.gpt_generate_goals(game)
+            game.bump_state_version()
+
+    def draft_goals(self, game):
+        """
+        Draft this round's goals without recording them. Safe to run concurrently with
+        other characters' drafts; pass the result to commit_goals.
+
+        Returns:
+            tuple: (goal, goal embedding) or None if this agent doesn't set goals now
+                   or GPT rejected its goal prompt
+        """
+        if game.tick == 0 and self.use_goals:
+            return self.goals.draft_goals(game)
+        return None
+
+    def commit_goals(self, game, draft):
+        if draft:
+            self.goals.commit_goals(game, *draft)
+            game.bump_state_version()
 
     def engage(self, game) -> Union[str, int]:
         """
@@ -247,24 +297,79 @@ class GenerativeAgent(Character):
         """
 
         # If this is the end of a round, force reflection
-        if game.tick == (game.max_ticks_per_round - 1):
-            reflect(game, self) 
-            if self.use_goals:
-                self.goals.evaluate_goals(game)
+        if self.should_reflect(game):
+            scores = self.reflect_and_evaluate(game)
+            self.commit_goal_scores(game, scores)
             return -999
 
+        # act accordingly
+        return self.prepare_turn(game).act()
+
+    def prepare_turn(self, game, perceptions=None) -> Act:
+        """
+        Everything that happens before an agent's action is chosen: perceive the surroundings,
+        update impressions of nearby characters, and build the action prompts.
+
+        Args:
+            game (Game): the current game object
+            perceptions (tuple, optional): perceptions already drafted by draft_perceptions, which
+                                           must match what the agent would perceive now
+
+        Returns:
+            Act: an Act with its prompts already built
+        """
         # Percieve the agent's surroundings 
-        self.perceive(game)
+        self.perceive(game, perceptions)
 
         # Update this agent's impressions of characters in the same location
         if self.use_impressions:
             self.update_character_impressions(game)
 
-        # act accordingly
-        return Act(game, self).act()
+        return Act(game, self).prepare()
+
+    def draft_perceptions(self, game):
+        """
+        Summarize and score what this agent would perceive right now, without storing anything.
+        Commit it with perceive(game, perceptions) while it still matches what the agent
+        perceives (see perceptions_match).
+        """
+        return draft_perceptions(game, self)
+
+    def perceptions_match(self, game, perceptions) -> bool:
+        """
+        Check whether drafted perceptions are still what this agent would perceive.
+        Only the agent's own perceive changes what it last observed, so comparing the
+        observations of its location is enough.
+        """
+        return perceptions[0] == get_location_observations(game, self)
     
-    def perceive(self, game):
-        percieve_location(game, self)
+    def should_reflect(self, game) -> bool:
+        # Agents reflect at the last tick of each round
+        return game.tick == (game.max_ticks_per_round - 1)
+
+    def reflect_and_evaluate(self, game):
+        """
+        Reflect on this round and score progress toward this round's goals.
+        Reflections only touch this agent's memory, so several agents can do this
+        concurrently; pass the result to commit_goal_scores.
+
+        Returns:
+            str: the goal completion scores, or None if this agent doesn't use goals
+        """
+        reflect(game, self)
+        if self.use_goals:
+            return self.goals.draft_goal_scores(game)
+        return None
+
+    def commit_goal_scores(self, game, scores):
+        if scores:
+            self.goals.score_update(scores, game)
+
+    def perceive(self, game, perceptions=None):
+        if perceptions is None:
+            perceptions = draft_perceptions(game, self)
+        commit_perceptions(game, self, perceptions)
+        self.perception_version += 1
         self.chars_in_view = self.get_characters_in_view(game)
                 
     def get_characters_in_view(self, game):
@@ -334,30 +439,6 @@ class DiscoveryAgent(GenerativeAgent):
     def update_score(self, add_on: int):
         self.score += add_on
 
-    def engage(self, game) -> Union[str, int]:
-        """
-        wrapper method for all agent cognition: perceive, retrieve, act, reflect, set goals
-
-        Args:
-            game (Game): the current game object
-
-        Returns:
-            Union[str, int]: An action string or int flag -999 to trigger skipped action
-        """
-
-        # If this is the end of a round, force reflection
-        if game.tick == (game.max_ticks_per_round - 1) and self.group != "E":
-            reflect(game, self) 
-            if self.use_goals:
-                self.goals.evaluate_goals(game)
-            return -999
-
-        # Percieve the agent's surroundings 
-        self.perceive(game)
-
-        # Update this agent's impressions of characters in the same location
-        if self.use_impressions:
-            self.update_character_impressions(game)
-
-        # act accordingly
-        return Act(game, self).act()
+    def should_reflect(self, game) -> bool:
+        # Group E agents act on the last tick instead of reflecting
+        return super().should_reflect(game) and self.group != "E"
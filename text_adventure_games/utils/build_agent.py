@@ -11,8 +11,6 @@ from importlib.resources import files, as_file
 import random
 from typing import Dict, List, Literal
 import numpy as np
-import openai
-from sklearn.metrics.pairwise import cosine_similarity
 
 # relative imports
 from ..agent.persona import Persona
@@ -37,6 +35,8 @@ def find_similar_character(query, characters, top_n=1):
         _type_: _description_
     """
 
+    from sklearn.metrics.pairwise import cosine_similarity
+
     sim = cosine_similarity(np.array(query).reshape(1, -1),
                             np.array([np.array(v) for v
                                       in characters.values()]))
@@ -105,8 +105,20 @@ def get_output_logs_path():
     output_logs = get_root_dir(n=3)
     return output_logs
 
+def get_cache_path():
+    cache_path = os.path.join(get_root_dir(n=3), "cache")
+    return cache_path
+
+# Set this environment variable (e.g. in sweep workers) to never prompt about existing log directories
+NONINTERACTIVE_ENV_VAR = "SURVIVOR_NONINTERACTIVE"
+
+def is_interactive() -> bool:
+    return not os.environ.get(NONINTERACTIVE_ENV_VAR)
+
 def validate_output_dir(fp, name, sim_id):
     overwrite = False
+    if not is_interactive():
+        return claim_output_dir(fp, name, sim_id)
     if os.path.exists(fp):
         print()
         decision = check_user_input(name, sim_id)
@@ -122,6 +134,20 @@ def validate_output_dir(fp, name, sim_id):
     else:
         return overwrite, fp, sim_id
     
+def claim_output_dir(fp, name, sim_id):
+    """
+    Non-interactive version of validate_output_dir: never overwrites, and takes the first free id
+    at or above sim_id. The directory is created here, so two processes can't claim the same one.
+    """
+    while True:
+        try:
+            os.makedirs(fp)
+        except FileExistsError:
+            sim_id += 1
+            fp = os.path.join(get_output_logs_path(), f"logs/{name}-{sim_id}/")
+        else:
+            return False, fp, sim_id
+    
 def check_user_input(name, sim_id):
     p1 = f"It appears you've already saved data using '{name}-{sim_id}. Do you want to overwrite the data?"
     p2 = "Type 'y' or 'n'"
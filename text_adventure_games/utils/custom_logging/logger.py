@@ -5,8 +5,8 @@ from .logging_setup import setup_logger
 
 
 class CustomLogger():
-    def __init__(self, experiment_name, sim_id):
-        _, validated_id = setup_logger(experiment_name, sim_id)
+    def __init__(self, experiment_name, sim_id, resume=False):
+        _, validated_id = setup_logger(experiment_name, sim_id, resume=resume)
 
         self.simulation_id = validated_id
         self.logger = logging.getLogger("survivor_global_logger")
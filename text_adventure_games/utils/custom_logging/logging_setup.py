@@ -21,6 +21,7 @@ from ..consts import (get_root_dir,
 
 def setup_logger(experiment_name: str, 
                  simulation_id: int, 
+                 resume: bool = False
                  # other_exp_info: dict
                  ):
     # TODO: how do we want to track experiments and runs of the simulation?
@@ -33,7 +34,11 @@ def setup_logger(experiment_name: str,
         config = json.load(log_cfg)
 
     new_log_path = os.path.join(get_output_logs_path(), f"logs/{experiment_name}-{simulation_id}/")
-    overwrite, validated_path, validated_id = validate_output_dir(new_log_path, experiment_name, simulation_id)
+    if resume:
+        # A resumed game keeps appending to its existing log
+        overwrite, validated_path, validated_id = False, new_log_path, simulation_id
+    else:
+        overwrite, validated_path, validated_id = validate_output_dir(new_log_path, experiment_name, simulation_id)
 
     # TODO: update this as needed to maintain 1 log per run or 1 log per experiment
     experiment_logfile_name = os.path.join(validated_path, f"sim_{experiment_name}-{validated_id}.jsonl")
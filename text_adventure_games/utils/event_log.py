@@ -0,0 +1,319 @@
+"""
+Author: Samuel Thudium (sam.thudium1@gmail.com)
+
+File: utils/event_log.py
+Description: an append-only log of everything that changes in a game: actions, movements, item transfers,
+             memories, votes and exiles. Each event is one JSON line; events are buffered and written
+             to disk (with an fsync) in batches. The state of the game at any point can be rebuilt for
+             analysis by replaying the log, starting from the latest snapshot before that point.
+             Snapshots hold the event sequence number and the compact parts of the state; memories
+             grow with every tick, so they are left out and read back from the log's memory events.
+
+             Holders of items are written as "character:<name>" or "location:<name>".
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+
+SNAPSHOT_DIR = "snapshots"
+
+
+class ReplayState:
+    """
+    The state of a game as derived from its events.
+    """
+
+    def __init__(self, track_memories=True):
+        """
+        Args:
+            track_memories (bool, optional): keep the memories themselves, not just how many
+                                             each character has. Defaults to True.
+        """
+        self.track_memories = track_memories
+        self.seq = 0
+        self.round = 0
+        self.tick = 0
+        # name -> {"location": str, "inventory": [item names]}
+        self.characters = {}
+        # item id -> {"name": str, "holder": str}
+        self.items = {}
+        # character name -> list of memories
+        self.memories = defaultdict(list)
+        # character name -> number of memories
+        self.memory_counts = defaultdict(int)
+        # round -> voter name -> vote record
+        self.votes = defaultdict(dict)
+        self.actions = defaultdict(int)
+        self.exiled = []
+        self.winner = None
+
+    def apply(self, event):
+        self.seq = event["seq"]
+        self.round = event["round"]
+        self.tick = event["tick"]
+        data = event["data"]
+        event_type = event["type"]
+
+        if event_type == "start":
+            self.characters = {name: {"location": location, "inventory": []}
+                               for name, location in data["characters"].items()}
+            for item_id, item in data["items"].items():
+                self._place_item(item_id, item["name"], item["holder"])
+        elif event_type == "action":
+            self.actions[data["character"]] += 1
+        elif event_type == "move":
+            self._get_character(data["character"])["location"] = data["to"]
+        elif event_type == "item_transfer":
+            self._remove_item(data["item_id"])
+            if data["to"]:
+                self._place_item(data["item_id"], data["item"], data["to"])
+        elif event_type == "memory":
+            self.memory_counts[data["character"]] += 1
+            if self.track_memories:
+                self.memories[data["character"]].append({k: v for k, v in data.items() if k != "character"})
+        elif event_type == "vote":
+            self.votes[str(event["round"])][data["voter"]] = data["record"]
+        elif event_type == "exile":
+            self.exiled.append(data["character"])
+            self._get_character(data["character"])["location"] = None
+        elif event_type == "winner":
+            self.winner = data["character"]
+
+    def _get_character(self, name):
+        return self.characters.setdefault(name, {"location": None, "inventory": []})
+
+    def _place_item(self, item_id, name, holder):
+        self.items[item_id] = {"name": name, "holder": holder}
+        kind, _, holder_name = holder.partition(":")
+        if kind == "character" and holder_name in self.characters:
+            self.characters[holder_name]["inventory"].append(name)
+
+    def _remove_item(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item:
+            kind, _, holder_name = item["holder"].partition(":")
+            if kind == "character" and holder_name in self.characters:
+                inventory = self.characters[holder_name]["inventory"]
+                if item["name"] in inventory:
+                    inventory.remove(item["name"])
+
+    def to_primitive(self):
+        # Memories are rebuilt from the log (see load_latest_snapshot)
+        return {"seq": self.seq,
+                "round": self.round,
+                "tick": self.tick,
+                "characters": self.characters,
+                "items": self.items,
+                "memory_counts": self.memory_counts,
+                "votes": self.votes,
+                "actions": self.actions,
+                "exiled": self.exiled,
+                "winner": self.winner}
+
+    @classmethod
+    def from_primitive(cls, data):
+        state = cls()
+        state.seq = data["seq"]
+        state.round = data["round"]
+        state.tick = data["tick"]
+        state.characters = data["characters"]
+        state.items = data["items"]
+        state.memory_counts = defaultdict(int, data["memory_counts"])
+        state.votes = defaultdict(dict, data["votes"])
+        state.actions = defaultdict(int, data["actions"])
+        state.exiled = data["exiled"]
+        state.winner = data["winner"]
+        return state
+
+
+class EventLog:
+
+    def __init__(self, path, batch_size=64):
+        """
+        Args:
+            path (str): the JSONL file to append events to
+            batch_size (int, optional): number of buffered events that triggers a write. Defaults to 64.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.seq = 0
+        # Kept up to date as events are appended, so snapshots don't need a replay
+        self.state = ReplayState(track_memories=False)
+        self._buffer = []
+        self._file = None
+        self._lock = threading.Lock()
+
+    def append(self, event_type: str, round: int, tick: int, **data) -> int:
+        """
+        Add an event to the log.
+
+        Returns:
+            int: the event's sequence number
+        """
+        with self._lock:
+            self.seq += 1
+            event = {"seq": self.seq, "type": event_type, "round": round, "tick": tick, "data": data}
+            self.state.apply(event)
+            self._buffer.append(json.dumps(event))
+            if len(self._buffer) >= self.batch_size:
+                self._write_buffer()
+            return self.seq
+
+    def flush(self):
+        """
+        Write any buffered events and make sure they are on disk.
+        """
+        with self._lock:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        if not self._buffer:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a")
+        self._file.write("\n".join(self._buffer) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def write_snapshot(self):
+        """
+        Save the state derived from the events so far, so that replays can start from here.
+        The snapshot doesn't include memories, so its size doesn't grow with the length of the game.
+        """
+        self.flush()
+        path = os.path.join(os.path.dirname(self.path), SNAPSHOT_DIR, f"snapshot_{self.seq}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state.to_primitive(), f)
+        os.replace(tmp_path, path)
+        return path
+
+    def rollback(self):
+        """
+        Drop events on disk that are newer than this log's sequence number, e.g. ones written
+        after the checkpoint a game is being resumed from.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not os.path.exists(self.path):
+                return
+            tmp_path = self.path + ".tmp"
+            with open(self.path, "r") as src, open(tmp_path, "w") as dst:
+                for line in src:
+                    if line.strip() and json.loads(line)["seq"] <= self.seq:
+                        dst.write(line)
+            os.replace(tmp_path, self.path)
+
+            snapshot_dir = os.path.join(os.path.dirname(self.path), SNAPSHOT_DIR)
+            if os.path.isdir(snapshot_dir):
+                for f in os.listdir(snapshot_dir):
+                    if f.startswith("snapshot_") and f.endswith(".json") and int(f[9:-5]) > self.seq:
+                        os.remove(os.path.join(snapshot_dir, f))
+
+    def __getstate__(self):
+        # Pickled with the game at checkpoints: make sure the file agrees with the pickled state
+        self.flush()
+        state = self.__dict__.copy()
+        del state["_file"], state["_lock"]
+        state["_buffer"] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._file = None
+        self._lock = threading.Lock()
+
+
+def read_events(path):
+    """
+    Iterate over the events in a log file, in order.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_memories(path, until_seq):
+    """
+    Collect the memories recorded in a log up to and including the event with the given sequence number.
+
+    Returns:
+        defaultdict: character name -> list of memories, as in ReplayState.memories
+    """
+    state = ReplayState()
+    for event in read_events(path):
+        if event["seq"] > until_seq:
+            break
+        if event["type"] == "memory":
+            state.apply(event)
+    return state.memories
+
+
+def load_latest_snapshot(path, until_seq=None, until_round=None):
+    """
+    Find the most recent snapshot of a log that doesn't go past the given point.
+    Memories aren't stored in snapshots; they are read back from the log.
+
+    Returns:
+        ReplayState | None: the snapshot's state, if there is one
+    """
+    snapshot_dir = os.path.join(os.path.dirname(path), SNAPSHOT_DIR)
+    if not os.path.isdir(snapshot_dir):
+        return None
+    seqs = sorted((int(f[len("snapshot_"):-len(".json")]) for f in os.listdir(snapshot_dir)
+                   if f.startswith("snapshot_") and f.endswith(".json")), reverse=True)
+    for seq in seqs:
+        if until_seq is not None and seq > until_seq:
+            continue
+        with open(os.path.join(snapshot_dir, f"snapshot_{seq}.json"), "r") as f:
+            data = json.load(f)
+        if until_round is not None and data["round"] > until_round:
+            continue
+        state = ReplayState.from_primitive(data)
+        state.memories = read_memories(path, state.seq)
+        return state
+    return None
+
+
+def replay(path, until_seq=None, until_round=None, use_snapshots=True) -> ReplayState:
+    """
+    Rebuild the state of a game from its event log.
+
+    Args:
+        path (str): the event log
+        until_seq (int, optional): stop after the event with this sequence number
+        until_round (int, optional): stop after the last event of this round
+        use_snapshots (bool, optional): start from the latest usable snapshot. Defaults to True.
+
+    Returns:
+        ReplayState: the state of the game at that point
+    """
+    state = None
+    if use_snapshots:
+        state = load_latest_snapshot(path, until_seq=until_seq, until_round=until_round)
+    state = state or ReplayState()
+
+    for event in read_events(path):
+        if event["seq"] <= state.seq:
+            continue
+        if until_seq is not None and event["seq"] > until_seq:
+            break
+        if until_round is not None and event["round"] > until_round:
+            break
+        state.apply(event)
+    return state
@@ -6,21 +6,71 @@ Description: helper methods used throughout the project
 """
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import os
 import re
 import json
 import string
+import threading
 import numpy as np
 # from importlib.resources import files, as_file
 from typing import Dict
-from openai import OpenAI
-from kani.engines.openai import OpenAIEngine
 
 # local imports
 from . import consts
 
+# Heavy dependencies (openai, kani, spaCy) are imported on first use so that
+# importing the package, and starting up worker processes, stays fast.
+_NLP_MODEL = None
+_NLP_MODEL_LOCK = threading.Lock()
+NLP_MODEL_NAME = "en_core_web_sm"
+DEFAULT_MAX_WORKERS = 8
+
+
+def get_nlp_model():
+    """
+    Get the spaCy Language shared by the whole process, loading it on first use.
+
+    Returns:
+        spacy.Language: the loaded en_core_web_sm pipeline
+    """
+    global _NLP_MODEL
+    with _NLP_MODEL_LOCK:
+        if _NLP_MODEL is None:
+            import spacy
+            _NLP_MODEL = spacy.load(NLP_MODEL_NAME)
+    return _NLP_MODEL
+
+
+def warm_start(background=True):
+    """
+    Load the shared spaCy pipeline and tokenizer ahead of their first use.
+    By default this happens on a daemon thread so it overlaps with game setup.
+
+    Args:
+        background (bool, optional): load on a background thread. Defaults to True.
+
+    Returns:
+        threading.Thread: the loading thread, or None if loaded in the foreground
+    """
+    from ..gpt.gpt_helpers import get_tokenizer
+
+    def _load():
+        get_tokenizer()
+        get_nlp_model()
+
+    if not background:
+        _load()
+        return None
+    thread = threading.Thread(target=_load, name="warm-start", daemon=True)
+    thread.start()
+    return thread
+
 
 def set_up_openai_client(org="Penn", **kwargs):
+    from openai import OpenAI
+
     key = consts.get_openai_api_key(org)
     params = kwargs.copy()
     params.update({"api_key": key})
@@ -31,10 +81,38 @@ def set_up_openai_client(org="Penn", **kwargs):
     return client
 
 def set_up_kani_engine(org="Penn", model='gpt-4', **kwargs):
+    from kani.engines.openai import OpenAIEngine
+
     key = consts.get_openai_api_key(org)
     engine = OpenAIEngine(key, model=model, **kwargs)
     return engine
 
+def map_concurrently(func, items, max_workers=None):
+    """
+    Apply func to each item on a pool of threads. This is meant for fanning out
+    independent GPT calls, which spend nearly all of their time waiting on the network.
+
+    Results are returned in the same order as items, regardless of the order in
+    which the calls finish, and the first exception raised (in item order) is re-raised.
+
+    Args:
+        func (Callable): function of a single item
+        items (Iterable): the items to map over
+        max_workers (int, optional): size of the thread pool. Defaults to DEFAULT_MAX_WORKERS.
+
+    Returns:
+        list: func(item) for each item, in order
+    """
+    items = list(items)
+    max_workers = max_workers or DEFAULT_MAX_WORKERS
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        # Each call runs in a copy of the caller's context so context variables carry over
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
+
 def get_logger_extras(game, character):
     extras = {}
     extras["character_name"] = character.name if character else "none"
@@ -237,9 +315,42 @@ def get_text_embedding(text, model="text-embedding-3-small", *args):
     """
     if not text:
         return None
-    client = set_up_openai_client(org="Penn")
-    text_vector = client.embeddings.create(input=[text], model=model, *args).data[0].embedding
-    return np.array(text_vector)
+    return get_text_embeddings([text], model, *args)[0]
+
+def get_text_embeddings(texts, model="text-embedding-3-small", *args):
+    """
+    Embed several texts with one call to the OpenAI embeddings api.
+    Cached embeddings are reused, and each distinct text is only sent once.
+
+    Args:
+        texts (list[str]): texts to embed
+        model (str, optional): the embedding model to use. Defaults to "text-embedding-3-small".
+
+    Returns:
+        list[np.array]: an embedding for each text, in order (None for empty texts)
+    """
+    from ..gpt.caching import get_embedding_cache, get_rate_limiter
+
+    cache = get_embedding_cache()
+    vectors = {}
+    for text in texts:
+        if text and text not in vectors:
+            cached = cache.get(cache.make_key(text, model)) if cache else None
+            vectors[text] = np.array(cached) if cached is not None else None
+
+    missing = [text for text, vector in vectors.items() if vector is None]
+    if missing:
+        rate_limiter = get_rate_limiter()
+        if rate_limiter:
+            rate_limiter.acquire()
+        client = set_up_openai_client(org="Penn")
+        response = client.embeddings.create(input=missing, model=model, *args)
+        for data in response.data:
+            text = missing[data.index]
+            vectors[text] = np.array(data.embedding)
+            if cache:
+                cache.set(cache.make_key(text, model), data.embedding)
+    return [vectors[text] if text else None for text in texts]
 
 def create_dirs(fp):
     os.makedirs(os.path.dirname(fp), exist_ok=True)
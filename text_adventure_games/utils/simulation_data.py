@@ -0,0 +1,107 @@
+"""
+Author: Samuel Thudium (sam.thudium1@gmail.com)
+
+File: utils/simulation_data.py
+Description: the per-round outputs of a SurvivorGame (votes, goals and goal scores).
+             Each is a JSONL file with one record per (round, character), appended as rounds close.
+             A (round, character) pair may be written more than once, e.g. for a round that was still
+             in progress when the data was saved; the last record wins. A line cut short by a crash
+             while appending is skipped.
+
+             load_simulation_data reassembles the nested structure of the old JSON files:
+                voting_history: {round: {character: vote record}}
+                character_goals / character_goal_scores: {character: {round: goals} or "None"}
+"""
+
+import json
+import os
+
+from .consts import get_output_logs_path
+
+VOTING_HISTORY = "voting_history"
+CHARACTER_GOALS = "character_goals"
+CHARACTER_GOAL_SCORES = "character_goal_scores"
+SIMULATION_DATA_KINDS = (VOTING_HISTORY, CHARACTER_GOALS, CHARACTER_GOAL_SCORES)
+
+
+def get_simulation_data_path(kind, experiment_name, experiment_id, log_dir=None):
+    log_dir = log_dir or os.path.join(get_output_logs_path(), f"logs/{experiment_name}-{experiment_id}/")
+    return os.path.join(log_dir, f"{kind}_{experiment_name}-{experiment_id}.jsonl")
+
+
+def append_records(path, records):
+    """
+    Append (round, character, value) records to a JSONL file.
+    """
+    if not records:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = [json.dumps({"round": r, "character": c, "value": v}) for r, c, v in records]
+    if _ends_mid_line(path):
+        # The last append was cut short; keep its partial line apart from these records
+        lines.insert(0, "")
+    with open(path, "a") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _ends_mid_line(path) -> bool:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def read_records(path) -> dict:
+    """
+    Read a JSONL file of records, keeping the last value written for each (round, character).
+
+    Returns:
+        dict: (round, character) -> value, ordered by when each pair was first written
+    """
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line that was only partly written when the game crashed
+                continue
+            records[(record["round"], record["character"])] = record["value"]
+    return records
+
+
+def load_simulation_data(experiment_name, experiment_id, log_dir=None) -> dict:
+    """
+    Load a game's votes, goals and goal scores in the structure of the old JSON outputs.
+
+    Args:
+        experiment_name (str): name of the experiment
+        experiment_id (int): id of the experiment
+        log_dir (str, optional): the experiment's log directory. Defaults to logs/<name>-<id>.
+
+    Returns:
+        dict: kind -> nested data, for each kind in SIMULATION_DATA_KINDS
+    """
+    data = {}
+
+    votes = {}
+    path = get_simulation_data_path(VOTING_HISTORY, experiment_name, experiment_id, log_dir)
+    for (r, character), value in read_records(path).items():
+        votes.setdefault(str(r), {})[character] = value
+    data[VOTING_HISTORY] = votes
+
+    for kind in (CHARACTER_GOALS, CHARACTER_GOAL_SCORES):
+        by_character = {}
+        path = get_simulation_data_path(kind, experiment_name, experiment_id, log_dir)
+        for (r, character), value in read_records(path).items():
+            rounds = by_character.setdefault(character, {})
+            if value is not None:
+                rounds[str(r)] = value
+        # Characters without goals were written as "None"
+        data[kind] = {character: rounds or "None" for character, rounds in by_character.items()}
+    return data